@@ -11,8 +11,14 @@ import math
 import struct
 import logging
 import string
+import binascii
 from chunk import Chunk
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 try:
     from cStringIO import StringIO
 except ImportError:
@@ -350,13 +356,8 @@ class CassetteStream(object):
         """Write a 256-byte block to tape."""
         # fill out short blocks with last byte
         data += data[-1]*(256-len(data))
-        for b in data:
-            self.bitstream.write_byte(ord(b))
-        crc_word = crc(data)
         # crc is written big-endian
-        lo, hi = map(ord, struct.pack('<H', crc_word))
-        self.bitstream.write_byte(hi)
-        self.bitstream.write_byte(lo)
+        self.bitstream.write_bytes(data + struct.pack('>H', crc(data)))
 
     def _fill_record_buffer(self):
         """Read to fill the tape buffer."""
@@ -561,8 +562,7 @@ class TapeBitStream(object):
         """Write some noise to give the reader something to get started."""
         # We just need some bits here
         # however on a new CAS file this works like a magic-sequence...
-        for b in bytearray(self.intro):
-            self.write_byte(b)
+        self.write_bytes(self.intro)
         # Write seven bits, so that we are byte-aligned after the sync bit
         # (after the 256-byte pilot). Makes CAS-files easier to read in hex.
         for _ in range(7):
@@ -592,8 +592,7 @@ class TapeBitStream(object):
 
     def write_leader(self):
         """Write the leader / pilot tone."""
-        for _ in range(256):
-            self.write_byte(0xff)
+        self.write_bytes('\xff' * 256)
         self.write_bit(0)
         self.write_byte(0x16)
 
@@ -614,6 +613,11 @@ class TapeBitStream(object):
         for bit in bits:
             self.write_bit(bit)
 
+    def write_bytes(self, data):
+        """Write a string of bytes to tape image."""
+        for byte in bytearray(data):
+            self.write_byte(byte)
+
     def close(self):
         """Eject tape."""
         pass
@@ -731,6 +735,22 @@ class CASBitStream(TapeBitStream):
             self.mask = 0x80
         self.current_byte = chr(ord(self.current_byte) | (bit*self.mask))
 
+    def write_bytes(self, data):
+        """Write a string of bytes to tape."""
+        if not data:
+            return
+        # number of bits already in the current byte
+        # a completed byte is kept in current_byte until the next bit arrives
+        used = 9 - self.mask.bit_length()
+        value = ((ord(self.current_byte) >> (8-used)) << (8*len(data))
+                    | int(binascii.hexlify(data), 16))
+        keep = used or 8
+        num_out = (used + 8*len(data) - keep) // 8
+        if num_out:
+            self.cas.write(binascii.unhexlify('%0*x' % (2*num_out, value >> keep)))
+        self.current_byte = chr((value & ((1 << keep) - 1)) << (8-keep))
+        self.mask = 1 << (8-keep)
+
     def flush(self):
         """Write remaining bits to tape."""
         if self.operating_mode == 'w':
@@ -865,7 +885,8 @@ class WAVBitStream(TapeBitStream):
                 raise EndOfTape()
             self.operating_mode = 'r'
         self.wav_pos = 0
-        self.buf_len = 1024
+        # number of frames to read and convert at once
+        self.buf_len = 16384 if numpy else 1024
         # convert 8-bit and 16-bit values to ints
         if self.sampwidth == 1:
             self.sub_threshold = 0
@@ -881,6 +902,8 @@ class WAVBitStream(TapeBitStream):
         self.halflength_max = 2*self.halflength_cut
         self.halflength_min = self.halflength_cut / 2
         self.length_cut = 2*self.halflength_cut
+        # precomputed byte waveforms for writing, built on first use
+        self._byte_waves, self._byte_lengths = [], []
         # 2048 halves = 1024 pulses = 512 1-bits = 64 bytes of leader
         self.min_leader_halves = 2048
         # initialise generators
@@ -950,41 +973,23 @@ class WAVBitStream(TapeBitStream):
 
     def _fill_buffer(self):
         """Fill buffer with frames and pre-process."""
-        frame_buf = []
         frames = self.wav.read(self.buf_len*self.nchannels*self.sampwidth)
         if not frames:
             raise EndOfTape
-        # convert MSBs to int (data stored little endian)
-        # note that we simply throw away all the less significant bytes
-        frames = map(ord, frames[self.sampwidth-1::self.sampwidth])
-        # sum frames over channels
-        frames = map(sum, zip(*[iter(frames)]*self.nchannels))
-        frames = [ x-self.subtractor if x >= self.sub_threshold else x for x in frames ]
+        frames = frames_to_samples(frames, self.sampwidth, self.nchannels,
+                                   self.sub_threshold, self.subtractor)
         return self.lowpass.send(frames)
 
     def _gen_read_halfpulse(self):
         """Generator to read a half-pulse and yield its length."""
-        length = 0
-        frame = 1
-        prezero = 1
-        pos_in_frame = 0
-        frame_buf = []
+        # sign of last sample, sign before last zero, length of current half-pulse
+        state = 1, 1, 0
         while True:
-            try:
-                sample = frame_buf[pos_in_frame]
-                pos_in_frame += 1
-            except IndexError:
-                frame_buf = self._fill_buffer()
-                pos_in_frame = 0
-                continue
-            length += 1
-            last, frame = frame, (sample > self.zero_threshold) + (sample >= -self.zero_threshold) - 1
-            if last != frame and (last != 0 or frame == prezero):
-                if frame == 0 and last != 0:
-                    prezero = last
+            lengths, state = find_halfpulses(
+                    self._fill_buffer(), self.zero_threshold, state)
+            for length in lengths:
                 self.wav_pos += length
                 yield length
-                length = 0
 
     def write_pause(self, milliseconds):
         """Write a pause of given length to the tape."""
@@ -993,15 +998,31 @@ class WAVBitStream(TapeBitStream):
         self.wav.write(zero[self.sampwidth] * self.nchannels * length)
         self.wav_pos += length
 
-    def write_bit(self, bit):
-        """Write a bit to tape."""
+    def _bit_wave(self, bit):
+        """Waveform for a bit."""
         half_length = self.halflength[bit]
         down = { 1: '\x00', 2: '\x00\x80'}
         up = { 1: '\xff', 2: '\xff\x7f'}
-        self.wav.write(
-            down[self.sampwidth] * self.nchannels * half_length +
-            up[self.sampwidth] * self.nchannels * half_length)
-        self.wav_pos += 2 * half_length
+        return (down[self.sampwidth] * self.nchannels * half_length +
+                up[self.sampwidth] * self.nchannels * half_length)
+
+    def write_bit(self, bit):
+        """Write a bit to tape."""
+        self.wav.write(self._bit_wave(bit))
+        self.wav_pos += 2 * self.halflength[bit]
+
+    def write_bytes(self, data):
+        """Write a string of bytes to tape."""
+        if not self._byte_waves:
+            # waveforms and lengths in frames for every byte value
+            bit_waves = [self._bit_wave(0), self._bit_wave(1)]
+            for byte in range(256):
+                bits = [(byte >> (7-i)) & 1 for i in range(8)]
+                self._byte_waves.append(''.join(bit_waves[bit] for bit in bits))
+                self._byte_lengths.append(sum(2*self.halflength[bit] for bit in bits))
+        data = bytearray(data)
+        self.wav.write(''.join([self._byte_waves[byte] for byte in data]))
+        self.wav_pos += sum(self._byte_lengths[byte] for byte in data)
 
     def _read_wav_header(self):
         """Read RIFF WAV header."""
@@ -1183,6 +1204,10 @@ class BasicodeWAVBitStream(WAVBitStream):
         """BASICODE writing not yet supported."""
         pass
 
+    def write_bytes(self, data):
+        """BASICODE writing not yet supported."""
+        pass
+
     def read_byte(self, skip_start=False):
         """Read a byte from the tape."""
         if skip_start:
@@ -1229,6 +1254,74 @@ class BasicodeWAVBitStream(WAVBitStream):
         return half <= self.length_cut/2
 
 
+##############################################################################
+# sample conversion
+
+def frames_to_samples_python(frames, sampwidth, nchannels, sub_threshold, subtractor):
+    """Convert WAV frames to a sequence of signed sample values."""
+    # convert MSBs to int (data stored little endian)
+    # note that we simply throw away all the less significant bytes
+    frames = map(ord, frames[sampwidth-1::sampwidth])
+    # sum frames over channels
+    frames = map(sum, zip(*[iter(frames)]*nchannels))
+    return [ x-subtractor if x >= sub_threshold else x for x in frames ]
+
+def find_halfpulses_python(samples, zero_threshold, state):
+    """Find the lengths of half-pulses completed in a sequence of samples."""
+    frame, prezero, length = state
+    lengths = []
+    for sample in samples:
+        length += 1
+        last, frame = frame, (sample > zero_threshold) + (sample >= -zero_threshold) - 1
+        if last != frame and (last != 0 or frame == prezero):
+            if frame == 0 and last != 0:
+                prezero = last
+            lengths.append(length)
+            length = 0
+    return lengths, (frame, prezero, length)
+
+if numpy:
+    def frames_to_samples_numpy(frames, sampwidth, nchannels, sub_threshold, subtractor):
+        """Convert WAV frames to a sequence of signed sample values."""
+        # convert MSBs to int (data stored little endian)
+        # note that we simply throw away all the less significant bytes
+        msbs = numpy.frombuffer(frames, dtype=numpy.uint8)[sampwidth-1::sampwidth]
+        # sum frames over channels, dropping any incomplete frame
+        msbs = msbs[:len(msbs)//nchannels*nchannels].astype(int)
+        samples = msbs.reshape(-1, nchannels).sum(axis=1)
+        return samples - subtractor * (samples >= sub_threshold)
+
+    def find_halfpulses_numpy(samples, zero_threshold, state):
+        """Find the lengths of half-pulses completed in a sequence of samples."""
+        frame, prezero, length = state
+        samples = numpy.asarray(samples)
+        if not len(samples):
+            return [], state
+        # -1, 0 or 1 according to sign; values close to zero count as zero
+        signs = ((samples > zero_threshold).astype(int)
+                    + (samples >= -zero_threshold) - 1)
+        lasts = numpy.concatenate(([frame], signs[:-1]))
+        changes = numpy.flatnonzero(lasts != signs)
+        lasts, currents = lasts[changes], signs[changes]
+        # when leaving zero, compare with the sign from before the zero
+        # which is the sign we left at the previous change
+        prezeros = numpy.concatenate(([prezero], lasts[:-1]))
+        ends = changes[(lasts != 0) | (currents == prezeros)]
+        into_zero = lasts[currents == 0]
+        if len(into_zero):
+            prezero = int(into_zero[-1])
+        lengths = numpy.diff(numpy.concatenate(([-1-length], ends)))
+        if len(ends):
+            length = len(samples) - 1 - int(ends[-1])
+        else:
+            length += len(samples)
+        return lengths.tolist(), (int(signs[-1]), prezero, length)
+
+    frames_to_samples, find_halfpulses = frames_to_samples_numpy, find_halfpulses_numpy
+else:
+    frames_to_samples, find_halfpulses = frames_to_samples_python, find_halfpulses_python
+
+
 ##############################################################################
 # supporting functions
 
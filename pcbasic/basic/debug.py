@@ -15,6 +15,7 @@ import platform
 from . import vartypes
 from . import representation
 from . import error
+from . import fp
 
 
 class DebugException(Exception):
@@ -94,6 +95,121 @@ class BaseDebugger(object):
         """Dummy debug exec."""
 
 
+class Watch(object):
+    """Expression that is only re-evaluated when the variables it refers to change."""
+
+    def __init__(self, session, expr):
+        """Set up the watch; the expression is prepared when first needed."""
+        self.session = session
+        self.expr = expr
+        self.prepared = None
+        # whether the expression must be evaluated every step; not known until compiled
+        self.volatile = None
+        # scalar version and variable state at the last evaluation
+        self._version = None
+        self._state = None
+        # last value as raw bytes and as formatted for the log
+        self._raw = None
+        self.value = None
+        # whether the last value is nonzero, for conditions
+        self._true = False
+
+    def _find_variables(self):
+        """Find the variables the compiled expression refers to."""
+        ops = self.prepared.ops
+        # functions may depend on anything (RND, TIMER, PEEK, ...); evaluate every step
+        self.volatile = any(oper[0] == 'fn' for oper in ops)
+        if self.volatile:
+            ops = []
+        complete_name = self.session.parser.complete_name
+        self.scalars = sorted(set(complete_name(oper[1]) for oper in ops if oper[0] == 'var'))
+        self.arrays = sorted(set(complete_name(oper[1]) for oper in ops if oper[0] == 'arr'))
+
+    def _in_field(self):
+        """Check if any string referred to lives in a FIELD buffer, which GET and PRINT# change in place."""
+        memory = self.session.memory
+        for name in self.scalars:
+            buf = memory.scalars.variables.get(name)
+            if (name[-1] == '$' and buf is not None and
+                    memory.field_mem_start <= vartypes.string_address(('$', buf)) < memory.code_start):
+                return True
+        return False
+
+    def _get_state(self):
+        """Get the current contents of the variables referred to."""
+        memory = self.session.memory
+        state = []
+        for name in self.scalars:
+            buf = memory.scalars.variables.get(name)
+            if buf is None:
+                state.append(None)
+            elif name[-1] == '$':
+                # string pointers may stay the same when contents change, e.g. MID$
+                state.append(memory.strings.copy((name[-1], buf)))
+            else:
+                state.append(str(buf))
+        for name in self.arrays:
+            record = memory.arrays.arrays.get(name)
+            if record is None:
+                state.append(None)
+            else:
+                # the version is increased on every assignment into the array
+                state.append((id(record[1]), record[0], record[2]))
+        return state
+
+    def evaluate(self):
+        """Evaluate the expression."""
+        parser = self.session.parser
+        if self.prepared.ops is not None:
+            return parser.evaluate_compiled(self.prepared.ops, self.prepared.code)
+        ops = []
+        value = parser.parse_expression(StringIO(self.prepared.code), self.session, ops=ops)
+        self.prepared.ops = ops
+        return value
+
+    def update(self):
+        """Re-evaluate if any variable referred to has changed; return True if the value has changed."""
+        if self.prepared is None:
+            self.prepared = self.session.prepare_expression(self.expr)
+        # the expression is compiled on its first evaluation without error
+        if self.volatile is None and self.prepared.ops is not None:
+            self._find_variables()
+        if self.volatile is False:
+            version = self.session.scalars.version
+            if version == self._version and not self.arrays and not self._in_field():
+                return False
+            self._version = version
+            state = self._get_state()
+            if state == self._state:
+                return False
+            self._state = state
+        strings = self.session.strings
+        try:
+            with strings:
+                val = self.evaluate()
+                raw = (val[0], strings.copy(val) if val[0] == '$' else str(val[1]))
+        except Exception as e:
+            raw = (None, '%s %s' % (type(e), e))
+        if raw == self._raw:
+            return False
+        self._raw = raw
+        # only format for the log if the value has changed
+        self._true = False
+        if raw[0] is None:
+            self.value = raw[1]
+        elif raw[0] == '$':
+            self.value = '"' + raw[1] + '"'
+        else:
+            val = (raw[0], bytearray(raw[1]))
+            self.value = representation.number_to_str(val, screen=False)
+            self._true = not fp.unpack(vartypes.pass_single(val)).is_zero()
+        return True
+
+    def is_true(self):
+        """Check if the last value is nonzero, as in IF."""
+        return self._true
+
+
 class Debugger(BaseDebugger):
     """Debugging helper."""
 
@@ -103,26 +219,71 @@ class Debugger(BaseDebugger):
         """Initialise debugger."""
         BaseDebugger.__init__(self, session)
         self.debug_tron = False
+        # watches and the conditions they are logged under
         self.watch_list = []
+        # breakpoints: line number -> condition or None
+        self.break_lines = {}
+        # conditions that break wherever they become true
+        self.break_conditions = []
+        # line we have just broken at, not to break again on CONT
+        self._break_line = None
+
+    def __setstate__(self, pickle_dict):
+        """Unpickle."""
+        self.__dict__.update(pickle_dict)
+        # snapshots from earlier versions keep watches as tokenised code, without conditions
+        self.watch_list = [
+                (Watch(self.session, item[0]), None) if isinstance(item[1], StringIO) else item
+                for item in self.watch_list]
+        if 'break_lines' not in pickle_dict:
+            self.break_lines = {}
+            self.break_conditions = []
+            self._break_line = None
 
     def debug_step(self, linum):
-        """Execute traces and watches on a program step."""
-        outstr = ''
+        """Execute traces, watches and breakpoints on a program step."""
         if self.debug_tron:
-            outstr += ('['+('%i' % linum) +']')
-        for (expr, outs) in self.watch_list:
-            outstr += (' ' + expr +' = ')
-            outs.seek(2)
-            try:
-                val = self.session.parser.parse_expression(outs, self.session)
-                if val[0] == '$':
-                    outstr += '"' + self.session.strings.copy(val) + '"'
-                else:
-                    outstr += representation.number_to_str(val, screen=False)
-            except Exception as e:
-                logging.debug(str(type(e))+' '+str(e))
-        if outstr:
+            outstr = '[%i]' % linum
+            for watch, condition in self.watch_list:
+                watch.update()
+                if condition is not None:
+                    condition.update()
+                if condition is None or condition.is_true():
+                    outstr += ' ' + watch.expr + ' = ' + str(watch.value)
             logging.debug(outstr)
+        elif self.watch_list:
+            # only log watches when their value changes
+            for watch, condition in self.watch_list:
+                changed = watch.update()
+                if condition is not None:
+                    changed = condition.update() or changed
+                    if not condition.is_true():
+                        continue
+                if changed:
+                    logging.debug('[%i] %s = %s', linum, watch.expr, watch.value)
+        if self.break_lines or self.break_conditions:
+            self._check_breakpoints(linum)
+
+    def _check_breakpoints(self, linum):
+        """Break program execution if a breakpoint fires."""
+        fire = False
+        if linum in self.break_lines:
+            condition = self.break_lines[linum]
+            if condition is not None:
+                condition.update()
+            fire = condition is None or condition.is_true()
+        for condition in self.break_conditions:
+            # conditions break where they become true, not on every line they hold
+            if condition.update() and condition.is_true():
+                fire = True
+        # don't break again when continuing from a breakpoint
+        resumed, self._break_line = (linum == self._break_line), None
+        if fire and not resumed:
+            self._break_line = linum
+            logging.debug('Breakpoint in %i', linum)
+            # back to the start of the line, just past the \x00 before the line number
+            self.session.parser.get_codestream().seek(-4, 1)
+            raise error.Break(stop=True)
 
     def debug_exec(self, debug_cmd):
         """Execute a debug command."""
@@ -172,10 +333,26 @@ def trace(on=True):
     """Switch line number tracing on or off."""
     debugger.debug_tron = on
 
-def watch(expr):
-    """Add an expression to the watch list."""
-    outs = session.tokeniser.tokenise_line('?'+expr)
-    debugger.watch_list.append((expr, outs))
+def watch(expr, condition=None):
+    """Add an expression to the watch list; only log it while a condition holds, if given."""
+    debugger.watch_list.append((
+            Watch(session, expr), Watch(session, condition) if condition else None))
+
+def break_at(linenum, condition=None):
+    """Break before executing a program line; only if a condition holds, if given."""
+    debugger.break_lines[linenum] = Watch(session, condition) if condition else None
+
+def break_when(condition):
+    """Break wherever a condition becomes true."""
+    watch = Watch(session, condition)
+    # don't break on a condition that already holds
+    watch.update()
+    debugger.break_conditions.append(watch)
+
+def clear_breakpoints():
+    """Remove all breakpoints."""
+    debugger.break_lines = {}
+    debugger.break_conditions = []
 
 def show_variables():
     """Dump all variables to the log."""
@@ -203,11 +203,24 @@ class PixelPage(object):
         pagedict = self.__dict__.copy()
         # lambdas can't be pickled
         pagedict['operations'] = None
+        # store the raw buffer rather than pickling the array or lists
+        if numpy:
+            pagedict['buffer'] = self.buffer.tostring()
+        else:
+            pagedict['buffer'] = b''.join(str(bytearray(row)) for row in self.buffer)
         return pagedict
 
     def __setstate__(self, pagedict):
         """Initialise from pickled page."""
         self.__dict__.update(pagedict)
+        if isinstance(self.buffer, bytes):
+            if numpy:
+                self.buffer = numpy.fromstring(self.buffer, dtype=numpy.int8).reshape(
+                                self.height, self.width)
+            else:
+                self.buffer = [
+                        list(bytearray(self.buffer[y*self.width:(y+1)*self.width]))
+                        for y in range(self.height)]
         self.init_operations()
 
     def put_pixel(self, x, y, attr):
@@ -332,6 +345,8 @@ class PixelPage(object):
                 self.buffer[y][x:x+len(colours)] = [(c & mask) |
                                                 (self.buffer[y][x+i] & inv_mask)
                                                 for i,c in enumerate(colours)]
+            else:
+                self.buffer[y][x:x+len(colours)] = list(colours)
             return self.buffer[y][x:x+len(colours)]
 
         def get_interval(self, x, y, length):
@@ -513,6 +528,19 @@ class Screen(object):
         # initialise a fresh textmode screen
         self.set_mode(self.mode, 0, 1, 0, 0)
 
+    def _interface_attached(self):
+        """Check if there is an interface to send video signals to."""
+        return not isinstance(self.session.video_queue, signals.NullQueue)
+
+    def _build_glyphs(self, mode_info):
+        """Build all SBCS glyphs for a mode."""
+        font = self.fonts[mode_info.font_height]
+        for c in map(chr, range(256)):
+            if c not in self.glyphs:
+                self.glyphs[c] = font.build_glyph(self.codepage.to_unicode(c, u'\0'),
+                                mode_info.font_width, mode_info.font_height,
+                                c in carry_col_9_chars, c in carry_row_9_chars)
+
     def prepare_modes(self):
         """Build lists of allowed graphics modes."""
         self.text_data, self.mode_data = modes.get_modes(self,
@@ -527,6 +555,7 @@ class Screen(object):
         # set the screen mode
         self.session.video_queue.put(signals.Event(signals.VIDEO_SET_MODE, self.mode))
         if self.mode.is_text_mode:
+            self._build_glyphs(self.mode)
             # send glyphs to signals; copy is necessary
             # as dict may change here while the other thread is working on it
             self.session.video_queue.put(signals.Event(signals.VIDEO_BUILD_GLYPHS,
@@ -655,18 +684,15 @@ class Screen(object):
                 new_apagenum >= mode_info.num_pages or
                 new_vpagenum >= mode_info.num_pages):
             raise error.RunError(error.IFC)
-        # preload SBCS glyphs
-        try:
-            self.glyphs = {
-                chr(c): self.fonts[mode_info.font_height].build_glyph(self.codepage.to_unicode(chr(c), u'\0'),
-                                mode_info.font_width, mode_info.font_height,
-                                chr(c) in carry_col_9_chars, chr(c) in carry_row_9_chars)
-                for c in range(256) }
-        except (KeyError, AttributeError):
+        if mode_info.font_height not in self.fonts:
             logging.warning(
                 'No %d-pixel font available. Could not enter video mode %s.',
                 mode_info.font_height, mode_info.name)
             raise error.RunError(error.IFC)
+        # glyphs are built on first use; preload SBCS glyphs if we have an interface to show them
+        self.glyphs = {}
+        if mode_info.is_text_mode and self._interface_attached():
+            self._build_glyphs(mode_info)
         self.session.video_queue.put(signals.Event(signals.VIDEO_SET_MODE, mode_info))
         if mode_info.is_text_mode:
             # send glyphs to signals; copy is necessary
@@ -862,7 +888,7 @@ class Screen(object):
         """Write a string to the screen at the current position."""
         if do_echo:
             # CR -> CRLF, CRLF -> CRLF LF
-            self.redirect.write(''.join([ ('\r\n' if c == '\r' else c) for c in s ]))
+            self.redirect.write(str(s).replace('\r', '\r\n'))
         last = ''
         # if our line wrapped at the end before, it doesn't anymore
         self.apage.row[self.current_row-1].wrap = False
@@ -1203,7 +1229,7 @@ class Screen(object):
         """Rebuild a text-mode character after POKE."""
         if self.mode.is_text_mode:
             # force rebuilding the character by deleting and requesting
-            del self.glyphs[chr(ordval)]
+            self.glyphs.pop(chr(ordval), None)
             self.get_glyph(chr(ordval))
 
     ## text viewport / scroll area
@@ -1387,11 +1413,15 @@ class Screen(object):
         try:
             mask = self.glyphs[c]
         except KeyError:
+            if self.mode.is_text_mode and not self._interface_attached():
+                # text-mode glyphs are only needed for display
+                return None
             uc = self.codepage.to_unicode(c, u'\0')
             carry_col_9 = c in carry_col_9_chars
             carry_row_9 = c in carry_row_9_chars
+            # DBCS glyphs are double width
             mask = self.fonts[self.mode.font_height].build_glyph(uc,
-                                self.mode.font_width*2, self.mode.font_height,
+                                self.mode.font_width * len(c), self.mode.font_height,
                                 carry_col_9, carry_row_9)
             self.glyphs[c] = mask
             if self.mode.is_text_mode:
@@ -85,12 +85,30 @@ class Events(object):
     # main event checker
 
     tick = 0.006
-
-    def wait(self):
-        """Wait and check events."""
-        time.sleep(self.tick)
+    # number of redirected input characters to move to the keyboard buffer at once
+    redirect_chunk = 1024
+
+    def wait(self, timeout=None):
+        """Wait and check events; stop waiting early if there is input."""
+        # nothing happening, so let any buffered output through
+        self.session.output_redirection.flush()
+        self._wait_input(self.tick if timeout is None else timeout)
         self.check_events()
 
+    def _wait_input(self, timeout):
+        """Wait for an input event for at most timeout seconds, and handle it."""
+        start = time.time()
+        try:
+            signal = self.session.input_queue.get(True, max(0., timeout))
+        except Queue.Empty:
+            # the null queue doesn't block
+            remaining = start + timeout - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+            return
+        self.session.input_queue.task_done()
+        self._handle_input(signal)
+
     def check_events(self):
         """Main event cycle."""
         # we need this for audio thread to keep up during tight loops
@@ -103,8 +121,10 @@ class Events(object):
     def _check_input(self):
         """Handle input events."""
         while True:
-            # drain redirect streams
-            in_str = self.session.input_redirection.read()
+            # drain redirect streams, a chunk at a time to keep the keyboard buffer short
+            in_str = u''
+            if self.session.keyboard.buf.length() < self.session.keyboard.buf.ring_length:
+                in_str = self.session.input_redirection.read(self.redirect_chunk)
             if in_str:
                 self.session.keyboard.insert_chars(in_str, check_full=False)
             if self.session.input_redirection.is_closed():
@@ -118,35 +138,38 @@ class Events(object):
                 else:
                     continue
             self.session.input_queue.task_done()
-            # process input events
-            if signal.event_type == signals.KEYB_QUIT:
-                raise error.Exit()
-            elif signal.event_type == signals.KEYB_CHAR:
-                # params is a unicode sequence
-                self.session.keyboard.insert_chars(*signal.params)
-            elif signal.event_type == signals.KEYB_DOWN:
-                # params is e-ASCII/unicode character sequence, scancode, modifier
-                self.session.keyboard.key_down(*signal.params)
-            elif signal.event_type == signals.KEYB_UP:
-                self.session.keyboard.key_up(*signal.params)
-            elif signal.event_type == signals.PEN_DOWN:
-                self.session.pen.down(*signal.params)
-            elif signal.event_type == signals.PEN_UP:
-                self.session.pen.up()
-            elif signal.event_type == signals.PEN_MOVED:
-                self.session.pen.moved(*signal.params)
-            elif signal.event_type == signals.STICK_DOWN:
-                self.session.stick.down(*signal.params)
-            elif signal.event_type == signals.STICK_UP:
-                self.session.stick.up(*signal.params)
-            elif signal.event_type == signals.STICK_MOVED:
-                self.session.stick.moved(*signal.params)
-            elif signal.event_type == signals.CLIP_PASTE:
-                self.session.keyboard.insert_chars(*signal.params, check_full=False)
-            elif signal.event_type == signals.CLIP_COPY:
-                text = self.session.screen.get_text(*(signal.params[:4]))
-                self.session.video_queue.put(signals.Event(
-                        signals.VIDEO_SET_CLIPBOARD_TEXT, (text, signal.params[-1])))
+            self._handle_input(signal)
+
+    def _handle_input(self, signal):
+        """Process an input event."""
+        if signal.event_type == signals.KEYB_QUIT:
+            raise error.Exit()
+        elif signal.event_type == signals.KEYB_CHAR:
+            # params is a unicode sequence
+            self.session.keyboard.insert_chars(*signal.params)
+        elif signal.event_type == signals.KEYB_DOWN:
+            # params is e-ASCII/unicode character sequence, scancode, modifier
+            self.session.keyboard.key_down(*signal.params)
+        elif signal.event_type == signals.KEYB_UP:
+            self.session.keyboard.key_up(*signal.params)
+        elif signal.event_type == signals.PEN_DOWN:
+            self.session.pen.down(*signal.params)
+        elif signal.event_type == signals.PEN_UP:
+            self.session.pen.up()
+        elif signal.event_type == signals.PEN_MOVED:
+            self.session.pen.moved(*signal.params)
+        elif signal.event_type == signals.STICK_DOWN:
+            self.session.stick.down(*signal.params)
+        elif signal.event_type == signals.STICK_UP:
+            self.session.stick.up(*signal.params)
+        elif signal.event_type == signals.STICK_MOVED:
+            self.session.stick.moved(*signal.params)
+        elif signal.event_type == signals.CLIP_PASTE:
+            self.session.keyboard.insert_chars(*signal.params, check_full=False)
+        elif signal.event_type == signals.CLIP_COPY:
+            text = self.session.screen.get_text(*(signal.params[:4]))
+            self.session.video_queue.put(signals.Event(
+                    signals.VIDEO_SET_CLIPBOARD_TEXT, (text, signal.params[-1])))
 
 
 ###############################################################################
@@ -25,6 +25,11 @@ This file is released under the GNU GPL version 3 or later.
 import math
 from functools import partial
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # the exponent is biased by 128
 true_bias = 128
 
@@ -38,6 +43,9 @@ class Float(object):
     byte_size = None
     bias = None
     carry_mask = None
+    man_bits = None
+    man_low = None
+    man_high = None
     # constants
     zero = None
     one = None
@@ -157,11 +165,21 @@ class Float(object):
         if self.man == 0 or self.exp == 0:
             self.neg, self.man, self.exp = self.zero.neg, self.zero.man, self.zero.exp
             return self
-        # are these correct?
-        while self.man <= 2**(self.mantissa_bits+8-1): # 0x7fffffffffffffff: # < 2**63
+        # shift left while man <= 2**(mantissa_bits+7), then right while man > 2**(mantissa_bits+8)
+        # this is equivalent to shifting one bit at a time
+        # note that a mantissa of exactly 2**(mantissa_bits+7) ends up as 2**(mantissa_bits+8)
+        shift = self.man_bits - self.man.bit_length()
+        if shift > 0:
+            self.exp -= shift
+            self.man <<= shift
+        if self.man <= self.man_low:
             self.exp -= 1
             self.man <<= 1
-        while self.man > 2**(self.mantissa_bits+8): #0xffffffffffffffff: # 2**64 or 0x100**8
+        shift = self.man.bit_length() - self.man_bits - 1
+        if shift > 0:
+            self.exp += shift
+            self.man >>= shift
+        if self.man > self.man_high:
             self.exp += 1
             self.man >>= 1
         # underflow
@@ -221,9 +239,9 @@ class Float(object):
         else:
             right = right_in
         # denormalise left to match exponents
-        while self.exp < right.exp:
-            self.exp += 1
-            self.man >>= 1
+        if self.exp < right.exp:
+            self.man >>= right.exp - self.exp
+            self.exp = right.exp
         # add mantissas, taking sign into account
         if (self.neg == right.neg):
             self.man += right.man
@@ -247,10 +265,9 @@ class Float(object):
         """In-place multiplication by 10."""
         if self.is_zero():
             return self
-        # 10x == 2(x+4x)
-        n = self.__class__(self.neg, self.man, self.exp+2)
-        self.iadd_raw(n)
-        self.exp += 1
+        # 10x == 2(x+4x), where x is denormalised to the exponent of 4x
+        self.man += self.man >> 2
+        self.exp += 3
         self.normalise()
         return self
 
@@ -288,6 +305,16 @@ class Float(object):
         denom_man = right_in.man
         self.man = 0L
         self.exp += 1
+        # while the denominator is shifted without losing bits, the loop below
+        # finds the largest quotient that leaves a positive remainder
+        # do those steps at once; for a power of two times ten, that's all but the last three
+        if 0 < work_man <= 2 * denom_man:
+            steps = (denom_man & -denom_man).bit_length()
+            denom_man >>= steps - 1
+            self.man = (work_man - 1) // denom_man
+            work_man -= self.man * denom_man
+            self.exp -= steps
+            denom_man >>= 1
         while (denom_man > 0):
             self.man <<= 1
             self.exp -= 1
@@ -382,9 +409,9 @@ class Float(object):
         if value == 0.0:
             return cls.zero
         neg = value < 0
-        fexp = math.log(abs(value), 2) - cls.mantissa_bits
-        man = int(abs(value) * 0.5**int(fexp-8))
-        exp = int(fexp) + cls.bias
+        fexp = math.frexp(abs(value))[1] - 1 - cls.mantissa_bits
+        man = int(math.ldexp(abs(value), 8-fexp))
+        exp = fexp + cls.bias
         return cls(neg, man, exp).normalise()
 
 
@@ -395,6 +422,9 @@ class Single(Float):
     byte_size = 4
     bias = true_bias + mantissa_bits
     carry_mask = 0xffffff00
+    # normalised mantissa range including carry byte
+    man_bits = mantissa_bits + 8
+    man_low, man_high = 2**(man_bits-1), 2**man_bits
 
     def round_to_single(self):
         """Round to single."""
@@ -408,6 +438,9 @@ class Double(Float):
     byte_size = 8
     bias = true_bias + mantissa_bits
     carry_mask = 0xffffffffffffff00
+    # normalised mantissa range including carry byte
+    man_bits = mantissa_bits + 8
+    man_low, man_high = 2**(man_bits-1), 2**man_bits
 
     def round_to_single(self):
         """Round double to single."""
@@ -439,6 +472,53 @@ def pack(n):
         return ('!', s)
 
 
+####################################
+# vectorised conversion, requires numpy
+
+def from_ieee_array(values, typechar):
+    """Convert an array of IEEE floats to an array of MBF singles or doubles; raise OverflowError if out of range."""
+    bits = numpy.array(values, dtype=numpy.float64).view(numpy.int64)
+    neg = (bits < 0).astype(numpy.int64)
+    # IEEE double is 1.f * 2**(e-1023), MBF is 0.1f * 2**(exp-128)
+    exp = ((bits >> 52) & 0x7ff) - 1022 + true_bias
+    man = (bits & 0xfffffffffffff) | 0x10000000000000
+    if typechar == '!':
+        # keep 24 bits; round up if the first discarded bit is set, as apply_carry does
+        man = (man + (1 << 28)) >> 29
+        carry = man >> 24
+        man >>= carry
+        exp += carry
+        mbf = (exp << 24) | (neg << 23) | (man & 0x7fffff)
+        dtype = '<u4'
+    else:
+        # 53 bits fit in the 56-bit MBF mantissa
+        mbf = (exp << 56) | (neg << 55) | ((man << 3) & 0x7fffffffffffff)
+        dtype = '<i8'
+    if numpy.any(exp > 0xff):
+        raise OverflowError()
+    # underflow; this includes IEEE zero and denormals
+    mbf[exp <= 0] = 0
+    return mbf.astype(dtype)
+
+def to_ieee_array(buf, typechar):
+    """Convert a buffer of MBF singles or doubles to a flat array of IEEE doubles."""
+    if typechar == '!':
+        mbf = numpy.frombuffer(buf, '<u4').astype(numpy.int64)
+        exp = mbf >> 24
+        neg = (mbf >> 23) & 1
+        man = (mbf & 0x7fffff) | 0x800000
+        values = numpy.ldexp(man.astype(numpy.float64), (exp - Single.bias).astype(numpy.intc))
+    else:
+        mbf = numpy.frombuffer(buf, '<i8')
+        exp = (mbf >> 56) & 0xff
+        neg = (mbf >> 55) & 1
+        man = (mbf & 0x7fffffffffffff) | 0x80000000000000
+        values = numpy.ldexp(man.astype(numpy.float64), (exp - Double.bias).astype(numpy.intc))
+    values[neg == 1] *= -1
+    values[exp == 0] = 0.
+    return values
+
+
 ####################################
 # standalone arithmetic operators
 
@@ -221,63 +221,71 @@ class Functions(object):
             big = vartypes.pass_string(self.parser.parse_expression(ins, self.session, allow_empty=True))
         else:
             big = vartypes.pass_string(s)
+        length = vartypes.string_length(big)
+        # the string may move in memory while the other arguments are evaluated
+        big = self.session.strings.hold(big)
         util.require_read(ins, (',',))
         small = vartypes.pass_string(self.parser.parse_expression(ins, self.session, allow_empty=True))
         util.require_read(ins, (')',))
-        big, small = self.session.strings.copy(big), self.session.strings.copy(small)
-        if big == '' or n > len(big):
+        if n > length:
             return vartypes.null('%')
         # BASIC counts string positions from 1
-        find = big[n-1:].find(small)
+        find = self.session.strings.find(big, small, n-1)
         if find == -1:
             return vartypes.null('%')
-        return vartypes.int_to_integer_signed(n + find)
+        return vartypes.int_to_integer_signed(find + 1)
 
     def value_mid(self, ins):
         """MID$: get substring."""
         util.require_read(ins, ('(',))
-        s = self.session.strings.copy(vartypes.pass_string(self.parser.parse_expression(ins, self.session)))
+        s = vartypes.pass_string(self.parser.parse_expression(ins, self.session))
+        length = vartypes.string_length(s)
+        s = self.session.strings.hold(s)
         util.require_read(ins, (',',))
         start = vartypes.pass_int_unpack(self.parser.parse_expression(ins, self.session))
         if util.skip_white_read_if(ins, (',',)):
             num = vartypes.pass_int_unpack(self.parser.parse_expression(ins, self.session))
         else:
-            num = len(s)
+            num = length
         util.require_read(ins, (')',))
         util.range_check(1, 255, start)
         util.range_check(0, 255, num)
-        if num == 0 or start > len(s):
+        if num == 0 or start > length:
             return vartypes.null('$')
         start -= 1
         stop = start + num
-        stop = min(stop, len(s))
-        return self.session.strings.store(s[start:stop])
+        stop = min(stop, length)
+        return self.session.strings.substring(s, start, stop)
 
     def value_left(self, ins):
         """LEFT$: get substring at the start of string."""
         util.require_read(ins, ('(',))
-        s = self.session.strings.copy(vartypes.pass_string(self.parser.parse_expression(ins, self.session)))
+        s = vartypes.pass_string(self.parser.parse_expression(ins, self.session))
+        length = vartypes.string_length(s)
+        s = self.session.strings.hold(s)
         util.require_read(ins, (',',))
         stop = vartypes.pass_int_unpack(self.parser.parse_expression(ins, self.session))
         util.require_read(ins, (')',))
         util.range_check(0, 255, stop)
         if stop == 0:
             return vartypes.null('$')
-        stop = min(stop, len(s))
-        return self.session.strings.store(s[:stop])
+        stop = min(stop, length)
+        return self.session.strings.substring(s, 0, stop)
 
     def value_right(self, ins):
         """RIGHT$: get substring at the end of string."""
         util.require_read(ins, ('(',))
-        s = self.session.strings.copy(vartypes.pass_string(self.parser.parse_expression(ins, self.session)))
+        s = vartypes.pass_string(self.parser.parse_expression(ins, self.session))
+        length = vartypes.string_length(s)
+        s = self.session.strings.hold(s)
         util.require_read(ins, (',',))
         stop = vartypes.pass_int_unpack(self.parser.parse_expression(ins, self.session))
         util.require_read(ins, (')',))
         util.range_check(0, 255, stop)
         if stop == 0:
             return vartypes.null('$')
-        stop = min(stop, len(s))
-        return self.session.strings.store(s[-stop:])
+        stop = min(stop, length)
+        return self.session.strings.substring(s, length - stop, length)
 
     def value_string(self, ins):
         """STRING$: repeat characters."""
@@ -444,37 +452,51 @@ class Functions(object):
         if fnname in self.user_function_parsing:
             raise error.RunError(error.OUT_OF_MEMORY)
         try:
-            varnames, fncode = self.session.user_functions[fnname]
+            varnames, fncode, fnops = self.session.user_functions[fnname]
         except KeyError:
             raise error.RunError(error.UNDEFINED_USER_FUNCTION)
-        # save existing vars
-        varsave = {}
-        for name in varnames:
-            if name in self.session.scalars.variables:
-                # copy the *value* - set_var is in-place it's safe for FOR loops
-                varsave[name] = self.session.scalars.variables[name][:]
         # read variables
+        exprs = []
         if util.skip_white_read_if(ins, ('(',)):
-            exprs = []
             while True:
                 exprs.append(self.parser.parse_expression(ins, self.session))
                 if not util.skip_white_read_if(ins, (',',)):
                     break
             if len(exprs) != len(varnames):
                 raise error.RunError(error.STX)
-            for name, value in zip(varnames, exprs):
-                self.session.scalars.set(name, value)
             util.require_read(ins, (')',))
-        # execute the code
-        fns = StringIO(fncode)
-        fns.seek(0)
+        variables = self.session.scalars.variables
+        varsave = []
         self.user_function_parsing.add(fnname)
-        value = self.parser.parse_expression(fns, self.session)
-        self.user_function_parsing.remove(fnname)
-        # restore existing vars
-        for name in varsave:
-            # re-assign the stored value
-            self.session.scalars.variables[name][:] = varsave[name]
+        try:
+            # bind the parameters to new buffers, keeping the existing ones aside
+            # the existing buffers are put back unchanged, so this is safe for FOR loops
+            for name, value in zip(varnames, exprs):
+                varsave.append((name, variables.get(name)))
+                if name in variables:
+                    value = vartypes.pass_type(name[-1], value)
+                    if name[-1] == '$':
+                        value = self.session.strings.materialise(value)
+                    variables[name] = value[1][:]
+                    # the buffer is swapped, not changed through Scalars.set
+                    self.session.scalars.version += 1
+                else:
+                    self.session.scalars.set(name, value)
+            # execute the code
+            if fnops is None:
+                # compile while evaluating; calls after a successful one don't parse the code again
+                fnops = []
+                value = self.parser.parse_expression(StringIO(fncode), self.session, ops=fnops)
+                self.session.user_functions[fnname] = varnames, fncode, fnops
+            else:
+                value = self.parser.evaluate_compiled(fnops, fncode)
+        finally:
+            self.user_function_parsing.remove(fnname)
+            # restore existing vars, last first in case a name is repeated
+            for name, buf in reversed(varsave):
+                if buf is not None:
+                    variables[name] = buf
+            self.session.scalars.version += 1
         return vartypes.pass_type(fnname[-1], value)
 
     ###############################################################
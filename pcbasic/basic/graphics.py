@@ -26,6 +26,75 @@ from . import mlparser
 deg_to_rad = fp.div(fp.Single.twopi, fp.Single.from_int(360))
 
 
+# compiled DRAW strings
+_draw_cache = {}
+
+def compile_draw(gml):
+    """Compile a Graphics Macro Language string into a list of operations."""
+    try:
+        return _draw_cache[gml]
+    except KeyError:
+        pass
+    # don't convert to uppercase as VARPTR$ elements are case sensitive
+    gmls = StringIO(gml)
+    ml_parser = mlparser.MLParser(gmls, None)
+    ops = []
+    try:
+        while True:
+            ml_parser.args = []
+            c = util.skip_read(gmls, ml_parser.whitepace).upper()
+            if c == '':
+                break
+            elif c in ('B', 'N'):
+                ops.append((c,))
+            elif c == 'X':
+                ops.append((c, ml_parser.compile_string()))
+            elif c in ('C', 'A'):
+                # allow empty spec (default 0), but only if followed by a semicolon
+                if util.skip(gmls, ml_parser.whitepace) == ';':
+                    ops.append((c, 0))
+                elif c == 'C':
+                    # 100000 seems to be GW's limit
+                    # however, parse_number will overflow past signed int limits
+                    ops.append((c, ml_parser.compile_number(lower=-99999, upper=99999)))
+                else:
+                    ops.append((c, ml_parser.compile_number(lower=0, upper=3)))
+            elif c == 'S':
+                ops.append((c, ml_parser.compile_number(lower=1, upper=255)))
+            elif c == 'T':
+                if gmls.read(1).upper() != 'A':
+                    raise error.RunError(error.IFC)
+                # allow empty spec (default 0), but only if followed by a semicolon
+                if util.skip(gmls, ml_parser.whitepace) == ';':
+                    ops.append((c, 0))
+                else:
+                    ops.append((c, ml_parser.compile_number(lower=-360, upper=360)))
+            elif c in ('U', 'D', 'L', 'R', 'E', 'F', 'G', 'H'):
+                ops.append((c, ml_parser.compile_number(default=1, lower=-99999, upper=99999)))
+            elif c == 'M':
+                relative = util.skip(gmls, ml_parser.whitepace) in ('+','-')
+                x = ml_parser.compile_number(lower=-9999, upper=9999)
+                if util.skip(gmls, ml_parser.whitepace) != ',':
+                    raise error.RunError(error.IFC)
+                else:
+                    gmls.read(1)
+                y = ml_parser.compile_number(lower=-9999, upper=9999)
+                ops.append((c, relative, x, y))
+            elif c == 'P':
+                colour = ml_parser.compile_number(lower=0, upper=9999)
+                if util.skip_read(gmls, ml_parser.whitepace) != ',':
+                    raise error.RunError(error.IFC)
+                bound = ml_parser.compile_number(lower=0, upper=9999)
+                ops.append((c, colour, bound))
+    except error.RunError as e:
+        # raise the error when execution gets here
+        ops.append(('error', ml_parser.args, e.err))
+    if len(_draw_cache) >= mlparser.cache_size:
+        _draw_cache.clear()
+    _draw_cache[gml] = ops
+    return ops
+
+
 class Drawing(object):
     """Manage graphics drawing."""
 
@@ -265,6 +334,12 @@ class Drawing(object):
         if y1 <= y0:
             # work from top to bottom, or from x1,y1 if at the same height. this matters for mask.
             x1, y1, x0, y0 = x0, y0, x1, y1
+        if pattern == 0xffff and (x0 == x1 or y0 == y1):
+            # solid horizontal or vertical line: fill as a single span
+            vx0, vy0, vx1, vy1 = self.view_clip_rect(min(x0, x1), y0, max(x0, x1), y1)
+            if vx0 <= vx1 and vy0 <= vy1:
+                self.screen.fill_rect(vx0, vy0, vx1, vy1, c)
+            return
         # Bresenham algorithm
         dx, dy = abs(x1-x0), abs(y1-y0)
         steep = dy > dx
@@ -686,17 +761,11 @@ class Drawing(object):
 
     def draw(self, gml, memory, events):
         """DRAW: Execute a Graphics Macro Language string."""
-        # don't convert to uppercase as VARPTR$ elements are case sensitive
-        gmls = StringIO(gml)
-        ml_parser = mlparser.MLParser(gmls, memory)
+        ml_parser = mlparser.MLParser(None, memory)
         plot, goback = True, False
-        while True:
-            c = util.skip_read(gmls, ml_parser.whitepace).upper()
-            if c == '':
-                break
-            elif c == ';':
-                continue
-            elif c == 'B':
+        for op in compile_draw(str(gml)):
+            c = op[0]
+            if c == 'B':
                 # do not draw
                 plot = False
             elif c == 'N':
@@ -704,50 +773,23 @@ class Drawing(object):
                 goback = True
             elif c == 'X':
                 # execute substring
-                sub = ml_parser.parse_string()
+                sub = ml_parser.get_string(op[1])
                 self.draw(str(sub), memory, events)
             elif c == 'C':
                 # set foreground colour
-                # allow empty spec (default 0), but only if followed by a semicolon
-                if util.skip(gmls, ml_parser.whitepace) == ';':
-                    self.last_attr = 0
-                else:
-                    attr = ml_parser.parse_number()
-                    # 100000 seems to be GW's limit
-                    # however, parse_number will overflow past signed int limits
-                    util.range_check(-99999, 99999, attr)
-                    self.last_attr = attr
+                self.last_attr = ml_parser.get_number(op[1])
             elif c == 'S':
                 # set scale
-                scale = ml_parser.parse_number()
-                util.range_check(1, 255, scale)
-                self.draw_scale = scale
+                self.draw_scale = ml_parser.get_number(op[1])
             elif c == 'A':
                 # set angle
-                # allow empty spec (default 0), but only if followed by a semicolon
-                if util.skip(gmls, ml_parser.whitepace) == ';':
-                    self.draw_angle = 0
-                else:
-                    angle = ml_parser.parse_number()
-                    util.range_check(0, 3, angle)
-                    self.draw_angle = 90 * angle
+                self.draw_angle = 90 * ml_parser.get_number(op[1])
             elif c == 'T':
                 # 'turn angle' - set (don't turn) the angle to any value
-                if gmls.read(1).upper() != 'A':
-                    raise error.RunError(error.IFC)
-                # allow empty spec (default 0), but only if followed by a semicolon
-                if util.skip(gmls, ml_parser.whitepace) == ';':
-                    self.draw_angle = 0
-                else:
-                    angle = ml_parser.parse_number()
-                    util.range_check(-360, 360, angle)
-                    self.draw_angle = angle
+                self.draw_angle = ml_parser.get_number(op[1])
             # one-variable movement commands:
             elif c in ('U', 'D', 'L', 'R', 'E', 'F', 'G', 'H'):
-                step = ml_parser.parse_number(default=vartypes.int_to_integer_signed(1))
-                # 100000 seems to be GW's limit
-                # however, parse_number will overflow past signed int limits
-                util.range_check(-99999, 99999, step)
+                step = ml_parser.get_number(op[1])
                 x0, y0 = self.last_point
                 x1, y1 = 0, 0
                 if c in ('U', 'E', 'H'):
@@ -763,15 +805,7 @@ class Drawing(object):
                 goback = False
             # two-variable movement command
             elif c == 'M':
-                relative = util.skip(gmls, ml_parser.whitepace) in ('+','-')
-                x = ml_parser.parse_number()
-                util.range_check(-9999, 9999, x)
-                if util.skip(gmls, ml_parser.whitepace) != ',':
-                    raise error.RunError(error.IFC)
-                else:
-                    gmls.read(1)
-                y = ml_parser.parse_number()
-                util.range_check(-9999, 9999, y)
+                relative, x, y = op[1], ml_parser.get_number(op[2]), ml_parser.get_number(op[3])
                 x0, y0 = self.last_point
                 if relative:
                     self.draw_step(x0, y0, x, y, plot, goback)
@@ -785,14 +819,12 @@ class Drawing(object):
                 goback = False
             elif c == 'P':
                 # paint - flood fill
-                colour = ml_parser.parse_number()
-                util.range_check(0, 9999, colour)
-                if util.skip_read(gmls, ml_parser.whitepace) != ',':
-                    raise error.RunError(error.IFC)
-                bound = ml_parser.parse_number()
-                util.range_check(0, 9999, bound)
+                colour, bound = ml_parser.get_number(op[1]), ml_parser.get_number(op[2])
                 x, y = self.get_window_logical(*self.last_point)
                 self.paint((x, y, False), None, colour, bound, None, events)
+            else:
+                # parse error, after resolving any variables read before it
+                ml_parser.raise_error(*op[1:])
 
     def draw_step(self, x0, y0, sx, sy, plot, goback):
         """Make a DRAW step, drawing a line and reurning if requested."""
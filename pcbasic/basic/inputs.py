@@ -231,6 +231,9 @@ class Keyboard(object):
 
     def wait_char(self):
         """Wait for character, then return it but don't drop from queue."""
+        if self.buf.is_empty():
+            # pick up any pending redirected input before going to sleep
+            self.events.check_events()
         while self.buf.is_empty() and not self._input_closed:
             self.events.wait()
         return self.buf.peek()
@@ -6,6 +6,8 @@ Machine emulation and memory model
 This file is released under the GNU GPL version 3 or later.
 """
 
+import time
+
 from . import vartypes
 
 
@@ -39,12 +41,17 @@ class MachinePorts(object):
         self.com_enable_baud_write = [False, False]
         self.com_baud_divisor = [0, 0]
         self.com_break = [False, False]
+        # video status register
+        self.retrace = RetraceClock(session.screen)
 
     def inp(self, port):
         """Get the value in an emulated machine port."""
         # keyboard
         if port == 0x60:
             return self.session.keyboard.last_scancode
+        # CRT status register
+        elif port in (0x3da, 0x3ba):
+            return self.retrace.status(port)
         # game port (joystick)
         elif port == 0x201:
             value = (
@@ -185,10 +192,124 @@ class MachinePorts(object):
                     com_port.stream.set_pins(rts=val & 0x2, dtr=val & 0x1)
 
     def wait(self, addr, ander, xorer):
-        """Wait untial an emulated machine port has a specified value."""
+        """Wait until an emulated machine port has a specified value."""
         with self.session.events.suspend():
+            last = time.time()
             while (self.inp(addr) ^ xorer) & ander == 0:
-                self.session.events.wait()
+                # input events wake us up early; timed sources tell us when they change
+                self.session.events.wait(self._time_to_change(addr, ander))
+                # a short pulse such as vsync may have come and gone while we slept
+                now = time.time()
+                if (addr in (0x3da, 0x3ba) and
+                        self.retrace.matched_between(addr, ander, xorer, last, now)):
+                    break
+                last = now
+
+    def _time_to_change(self, port, mask):
+        """Time in seconds until the masked bits of a timed port may change."""
+        timeout = self.session.events.tick
+        if port in (0x3da, 0x3ba):
+            timeout = min(timeout, self.retrace.time_to_change(port, mask))
+        elif port == 0x201 and mask & 0x0f:
+            # joystick axis bits drop when the decay time passes the axis threshold
+            stick = self.session.stick
+            decay = stick.decay()
+            for bit, (joy, axis) in ((0x04, (0, 0)), (0x02, (0, 1)), (0x01, (1, 0)), (0x08, (1, 1))):
+                if mask & bit:
+                    remaining = stick.axis[joy][axis] * self.joystick_time_factor - decay
+                    if remaining > 0:
+                        timeout = min(timeout, remaining / 1000.)
+        return timeout
+
+
+class RetraceClock(object):
+    """Emulated CRT controller timing for the video status register."""
+
+    # line rate in Hz, total lines, displayed lines, vsync start line, vsync lines,
+    # fraction of the scan line that is displayed
+    cga_timing = (15699.8, 262, 200, 224, 16, 640./912.)
+    ega_timing = (21850., 364, 350, 354, 2, 640./744.)
+    mda_timing = (18432., 370, 350, 354, 16, 720./882.)
+    olivetti_timing = (26760., 448, 400, 412, 16, 0.75)
+    vga_400_timing = (31469., 449, 400, 412, 2, 0.8)
+    vga_350_timing = (31469., 449, 350, 387, 2, 0.8)
+    vga_480_timing = (31469., 525, 480, 490, 2, 0.8)
+    # fraction of a scan line
+    epsilon = 1e-6
+
+    def __init__(self, screen):
+        """Initialise the retrace clock."""
+        self._screen = screen
+        self._start = time.time()
+
+    def _get_timing(self):
+        """Get the timings for the current adapter and mode."""
+        capabilities = self._screen.capabilities
+        height = self._screen.mode.pixel_height
+        if capabilities in ('mda', 'hercules', 'ega_mono'):
+            return self.mda_timing
+        elif capabilities == 'ega':
+            return self.ega_timing if height == 350 else self.cga_timing
+        elif capabilities == 'vga':
+            if height == 480:
+                return self.vga_480_timing
+            return self.vga_350_timing if height == 350 else self.vga_400_timing
+        elif capabilities == 'olivetti':
+            return self.olivetti_timing
+        # cga, cga_old, tandy, pcjr
+        return self.cga_timing
+
+    def _get_position(self, when=None):
+        """Get the timing and the line and position on the line at the given time."""
+        timing = self._get_timing()
+        rate, total = timing[:2]
+        if when is None:
+            when = time.time()
+        # nudge past an edge we've been asked to wait for
+        lines = ((when - self._start) * rate + self.epsilon) % total
+        return timing, int(lines), lines % 1.
+
+    def status(self, port, when=None):
+        """Get the value of the video status register, now or at a given time."""
+        (_, _, displayed, vsync, vsync_lines, hdisplay), line, pos = self._get_position(when)
+        in_vsync = vsync <= line < vsync + vsync_lines
+        # bit 0: display disabled (colour) or horizontal retrace (mono)
+        value = line >= displayed or pos >= hdisplay
+        if port == 0x3da:
+            # bit 3: vertical retrace
+            return value | in_vsync * 0x08
+        # Hercules: bit 7 is low during vertical retrace
+        if self._screen.capabilities == 'hercules':
+            value |= (not in_vsync) * 0x80
+        return value
+
+    def time_to_change(self, port, mask, when=None):
+        """Time in seconds until the next edge of the masked status bits."""
+        (rate, total, displayed, vsync, vsync_lines, hdisplay), line, pos = self._get_position(when)
+        now = line + pos
+        # edges, in lines from the start of the frame
+        edges = []
+        if mask & (0x08 if port == 0x3da else 0x80):
+            edges += [vsync, vsync + vsync_lines, total + vsync]
+        if mask & 0x01:
+            if line < displayed:
+                edges += [line + hdisplay, line + 1]
+            edges.append(total)
+        later = [edge - now for edge in edges if edge > now]
+        if not later:
+            # these bits don't change
+            return total / rate
+        return min(later) / rate
+
+    def matched_between(self, port, ander, xorer, since, until):
+        """Check if the status matched a WAIT condition at any time in an interval."""
+        when = since
+        while when <= until:
+            if (self.status(port, when) ^ xorer) & ander:
+                return True
+            # step from edge to edge; at least a microsecond, or we may not move at all
+            when += max(self.time_to_change(port, ander, when), 1e-6)
+        return False
 
 
 
@@ -37,6 +37,14 @@ from . import devices
 # NOTE - the last two sections may be the other way around (2 bytes at end)
 # 65534                 total size (determined by CLEAR)
 
+# file header + FCB size, at the head of each field buffer
+file_header_size = 194
+
+
+def get_code_start(reserved_memory, max_reclen, max_files):
+    """Start of the code section, after the workspace and the field buffers."""
+    return reserved_memory + (max_files+1) * (file_header_size + max_reclen)
+
 
 
 class DataSegment(object):
@@ -61,8 +69,6 @@ class DataSegment(object):
         self.total_memory = total_memory
         # first field buffer address (workspace size; 3429 for gw-basic)
         self.field_mem_base = reserved_memory
-        # file header (at head of field memory)
-        file_header_size = 194
         # bytes distance between field buffers
         self.field_mem_offset = file_header_size + max_reclen
         # start of 1st field =3945, includes FCB & header header of 1st field
@@ -70,7 +76,7 @@ class DataSegment(object):
         self.field_mem_start = self.field_mem_base + self.field_mem_offset + file_header_size
         # data memory model: start of code section
         # code_start+1: offsets in files (4718 == 0x126e)
-        self.code_start = self.field_mem_base + (max_files+1) * self.field_mem_offset
+        self.code_start = get_code_start(reserved_memory, max_reclen, max_files)
         # scalar space
         self.scalars = var.Scalars(self)
         # array space
@@ -115,7 +121,7 @@ class DataSegment(object):
             self.arrays.clear()
         # clear old dict and copy into
         self.strings.clear()
-        self.strings.strings.update(new_strings.strings)
+        self.strings.update(new_strings)
         if not(preserve_sc or preserve_ar):
             # clear OPTION BASE
             self.arrays.clear_base()
@@ -377,6 +383,7 @@ class DataSegment(object):
         # swap the contents
         left[:], right[:] = right.tobytes(), left.tobytes()
         # inc version
+        self.scalars.version += 1
         if name1 in self.arrays.arrays:
             self.arrays.arrays[name1][2] += 1
         if name2 in self.arrays.arrays:
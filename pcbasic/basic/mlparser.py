@@ -14,8 +14,17 @@ from .operators import Operators as op
 from . import util
 
 
+# maximum number of compiled strings to keep for each macro language
+cache_size = 256
+
+
 class MLParser(object):
-    """Macro Language parser."""
+    """Macro Language parser.
+
+    DRAW and PLAY compile their strings into lists of operations with the compile_
+    methods; references to variables in those operations are resolved by the get_
+    methods each time the operation is run.
+    """
 
     # whitespace character for both macro languages is only space
     whitepace = ' '
@@ -24,11 +33,14 @@ class MLParser(object):
         """Initialise macro-language parser."""
         self.gmls = gmls
         self.memory = data_memory
+        # arguments compiled so far; the compiler resets this for each command
+        self.args = []
 
-    def parse_value(self, default):
-        """Parse a value in a macro-language string."""
+    def compile_number(self, default=None, lower=None, upper=None):
+        """Parse a number argument and check it lies in the given range.
+        Return a Python int or a reference to be resolved with get_number."""
         c = util.skip(self.gmls, self.whitepace)
-        sgn = -1 if c == '-' else 1
+        neg = c == '-'
         if c in ('+', '-'):
             self.gmls.read(1)
             c = util.peek(self.gmls)
@@ -42,41 +54,83 @@ class MLParser(object):
             elif ord(c) > 8:
                 name = util.read_name(self.gmls)
                 indices = self._parse_indices()
-                step = self.memory.get_variable(name, indices)
+                # the variable is retrieved before the terminator is checked
+                self.args.append(('var', (name, indices), False, None, None))
                 util.require_read(self.gmls, (';',), err=error.IFC)
+                self.args[-1] = ('#var', (name, indices), neg, lower, upper)
             else:
                 # varptr$
-                step = self.memory.get_value_for_varptrstr(self.gmls.read(3))
+                self.args.append(('#ptr', self.gmls.read(3), neg, lower, upper))
+            return self.args[-1]
         elif c and c in string.digits:
             step = self._parse_const()
         elif default is not None:
-            step = default
+            step = vartypes.int_to_integer_signed(default)
         else:
             raise error.RunError(error.IFC)
-        if sgn == -1:
+        if neg:
             step = op.number_neg(step)
+        step = vartypes.pass_int_unpack(step, err=error.IFC)
+        if lower is not None:
+            util.range_check(lower, upper, step)
+        self.args.append(step)
         return step
 
-    def parse_number(self, default=None):
-        """Parse and return a number value in a macro-language string."""
-        return vartypes.pass_int_unpack(self.parse_value(default), err=error.IFC)
-
-    def parse_string(self):
-        """Parse a string value in a macro-language string."""
+    def compile_string(self):
+        """Parse a string argument; return a reference to be resolved with get_string."""
         c = util.skip(self.gmls, self.whitepace)
         if len(c) == 0:
             raise error.RunError(error.IFC)
         elif ord(c) > 8:
             name = util.read_name(self.gmls, err=error.IFC)
             indices = self._parse_indices()
-            sub = self.memory.get_variable(name, indices)
+            self.args.append(('var', (name, indices), False, None, None))
             util.require_read(self.gmls, (';',), err=error.IFC)
-            return self.memory.strings.copy(vartypes.pass_string(sub, err=error.IFC))
+            self.args[-1] = ('$var', (name, indices), False, None, None)
         else:
             # varptr$
-            return self.memory.strings.copy(
-                    vartypes.pass_string(
-                        self.memory.get_value_for_varptrstr(self.gmls.read(3))))
+            self.args.append(('$ptr', self.gmls.read(3), False, None, None))
+        return self.args[-1]
+
+    def _get_value(self, arg):
+        """Retrieve the variable an argument refers to."""
+        kind, ref, neg, _, _ = arg
+        if kind[1:] == 'ptr':
+            value = self.memory.get_value_for_varptrstr(ref)
+        else:
+            value = self.memory.get_variable(*ref)
+        if neg:
+            value = op.number_neg(value)
+        return value
+
+    def get_number(self, arg):
+        """Resolve a compiled number argument to a Python int."""
+        if isinstance(arg, int):
+            return arg
+        value = vartypes.pass_int_unpack(self._get_value(arg), err=error.IFC)
+        if arg[3] is not None:
+            util.range_check(arg[3], arg[4], value)
+        return value
+
+    def get_string(self, arg):
+        """Resolve a compiled string argument to a string."""
+        if arg[0] == '$var':
+            return self.memory.strings.copy(vartypes.pass_string(self._get_value(arg), err=error.IFC))
+        else:
+            return self.memory.strings.copy(vartypes.pass_string(self._get_value(arg)))
+
+    def raise_error(self, args, err):
+        """Resolve the arguments compiled before a parse error, then raise it."""
+        for arg in args:
+            if isinstance(arg, int):
+                continue
+            elif arg[0] == 'var':
+                self._get_value(arg)
+            elif arg[0][0] == '#':
+                self.get_number(arg)
+            else:
+                self.get_string(arg)
+        raise error.RunError(err)
 
     def _parse_const(self):
         """Parse and return a constant value in a macro-language string."""
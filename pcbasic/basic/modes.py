@@ -303,46 +303,57 @@ class TextMode(VideoMode):
         self.num_attr = 32
         self.has_underline = has_underline
 
+    def _walk_rows(self, addr, num_bytes):
+        """Yield page, row, first column and offsets for the text rows in a block of memory."""
+        row_size = self.width*2
+        start, end = addr, addr + num_bytes
+        while start < end:
+            page, offset = divmod(start, self.page_size)
+            crow, row_offset = divmod(offset, row_size)
+            # stop at the end of the row, or of the page if it isn't a whole number of rows
+            stop = min(end, start - row_offset + row_size, (page+1) * self.page_size)
+            yield page, crow, row_offset // 2, start - addr, stop - addr
+            start = stop
+
     def get_memory(self, addr, num_bytes):
         """Retrieve bytes from textmode video memory."""
         addr -= self.video_segment*0x10
-        bytes = [0]*num_bytes
-        for i in xrange(num_bytes):
-            page = (addr+i) // self.page_size
-            offset = (addr+i) % self.page_size
-            ccol = (offset % (self.width*2)) // 2
-            crow = offset // (self.width*2)
+        bytes = bytearray(num_bytes)
+        for page, crow, ccol, start, stop in self._walk_rows(addr, num_bytes):
             try:
-                c = self.screen.text.pages[page].row[crow].buf[ccol][(addr+i)%2]
-                bytes[i] = c if (addr+i)%2==1 else ord(c)
+                cells = self.screen.text.pages[page].row[crow].buf
             except IndexError:
-                pass
+                continue
+            # character and attribute bytes of the whole row, from the first column touched
+            row_bytes = bytearray(2 * (len(cells) - ccol))
+            row_bytes[0::2] = b''.join(c for c, _ in cells[ccol:])
+            row_bytes[1::2] = bytearray(a for _, a in cells[ccol:])
+            first = (addr+start) % 2
+            bytes[start:stop] = row_bytes[first:first+stop-start]
         return bytes
 
     def set_memory(self, addr, bytes):
         """Set bytes in textmode video memory."""
         addr -= self.video_segment*0x10
-        last_row = -1
-        for i in xrange(len(bytes)):
-            page = (addr+i) // self.page_size
-            offset = (addr+i) % self.page_size
-            ccol = (offset % (self.width*2)) // 2
-            crow = offset // (self.width*2)
+        for page, crow, ccol, start, stop in self._walk_rows(addr, len(bytes)):
             try:
-                c, a = self.screen.text.pages[page].row[crow].buf[ccol]
-                if (addr+i)%2 == 0:
-                    c = chr(bytes[i])
-                else:
-                    a = bytes[i]
-                self.screen.text.pages[page].put_char_attr(crow+1, ccol+1, c, a, one_only=False)
-                if last_row >= 0 and last_row != crow:
-                    # set for_keys to true to avoid echoing to text terminal
-                    self.screen.refresh_range(page, last_row+1, 1, self.width, for_keys=True)
+                text_page = self.screen.text.pages[page]
+                cells = text_page.row[crow].buf
             except IndexError:
-                pass
-            last_row = crow
-        if last_row >= 0 and last_row < 25 and page >= 0 and page < self.num_pages:
-            self.screen.refresh_range(page, last_row+1, 1, self.width, for_keys=True)
+                continue
+            # position in bytes of the character byte of the first cell
+            pos = start - (addr+start) % 2
+            for col in xrange(ccol, min(ccol + (stop-pos+1) // 2, len(cells))):
+                c, a = cells[col]
+                if pos >= start:
+                    c = chr(bytes[pos])
+                if pos+1 < stop:
+                    a = bytes[pos+1]
+                text_page.put_char_attr(crow+1, col+1, c, a, one_only=False)
+                pos += 2
+            if page < self.num_pages:
+                # set for_keys to true to avoid echoing to text terminal
+                self.screen.refresh_range(page, crow+1, 1, self.width, for_keys=True)
 
 
 # helper functions: convert between attribute lists and byte arrays
@@ -352,44 +363,31 @@ if numpy:
         """Convert masked attributes packed into bytes to a scanline interval."""
         bpp = 8//pixels_per_byte
         attrmask = (1<<bpp) - 1
-        bitval = numpy.array([128, 64, 32, 16, 8, 4, 2, 1], dtype=numpy.uint8)
-        bitmask = bitval[0::bpp]
-        for i in xrange(1, bpp):
-            bitmask |= bitval[i::bpp]
-        pre_mask = numpy.tile(bitmask, len(bytes))
-        post_shift = numpy.tile(
-                        numpy.array([7, 6, 5, 4, 3, 2, 1, 0])[(bpp-1)::bpp],
-                        len(bytes))
-        attrs = numpy.right_shift(
-                    numpy.repeat(numpy.array(bytes).astype(int),
-                                 pixels_per_byte) & pre_mask,
-                    post_shift) & attrmask
-        return numpy.array(attrs) * mask
+        # shift of each pixel in a byte, leftmost pixel in the high bits
+        shift = numpy.arange(8-bpp, -1, -bpp)
+        # works on whole blocks of bytes at once: one row of pixels per byte, then flatten
+        bytes = numpy.array(bytes, dtype=numpy.uint8)
+        attrs = (bytes[:, numpy.newaxis].astype(int) >> shift) & attrmask
+        return attrs.ravel() * mask
 
     def interval_to_bytes(colours, pixels_per_byte, plane=0):
         """Convert a scanline interval into masked attributes packed into bytes."""
         num_pixels = len(colours)
         num_bytes, odd_out = divmod(num_pixels, pixels_per_byte)
-        if odd_out:
-            num_bytes += 1
         bpp = 8//pixels_per_byte
         attrmask = (1<<bpp) - 1
         colours = numpy.array(colours).astype(int)
         if odd_out:
-            colours.resize(len(colours)+pixels_per_byte-odd_out)
-        shift = numpy.tile(numpy.array([7, 6, 5, 4, 3, 2, 1, 0])[(bpp-1)::bpp],
-                           num_bytes)
-        attrs = numpy.right_shift(colours, plane)
-        attrs = numpy.left_shift(attrs & attrmask, shift)
-        # below is much faster than:
-        #   return list([ sum(attrs[i:i+pixels_per_byte])
-        #                 for i in xrange(0, len(attrs), pixels_per_byte) ])
-        # and anything involving numpy.array_split or numpy.dot is even slower.
-        # numpy.roll is ok but this is the fastest I've found:
-        nattrs = attrs[0::pixels_per_byte]
-        for i in xrange(1, pixels_per_byte):
-            nattrs |= attrs[i::pixels_per_byte]
-        return list(nattrs)
+            num_bytes += 1
+            colours.resize(num_bytes * pixels_per_byte)
+        shift = numpy.arange(8-bpp, -1, -bpp)
+        # one row per byte; the bits of the pixels don't overlap, so adding ORs them
+        attrs = ((colours >> plane) & attrmask).reshape(num_bytes, pixels_per_byte)
+        return bytearray((attrs << shift).sum(axis=1).astype(numpy.uint8).tostring())
+
+    def blank_interval(length):
+        """Create a scanline interval of attribute 0, to be filled with slices."""
+        return numpy.zeros(length, dtype=int)
 
 else:
     def bytes_to_interval(bytes, pixels_per_byte, mask=1):
@@ -418,6 +416,10 @@ else:
             shift -= bpp
         return byte_list
 
+    def blank_interval(length):
+        """Create a scanline interval of attribute 0, to be filled with slices."""
+        return [0] * length
+
 def walk_memory(self, addr, num_bytes, factor=1):
     """Yield parts of graphics memory corresponding to pixels."""
     # factor supports tandy-6 mode, which has 8 pixels per 2 bytes
@@ -600,17 +602,20 @@ class CGAMode(GraphicsMode):
 
     def set_memory(self, addr, bytes):
         """Set bytes in CGA memory."""
+        # convert the whole block at once, then put it row by row
+        ppb = self.ppb
+        pixels = bytes_to_interval(bytes, ppb)
         for page, x, y, ofs, length in walk_memory(self, addr, len(bytes)):
-            self.screen.put_interval(page, x, y,
-                bytes_to_interval(bytes[ofs:ofs+length], self.ppb))
+            self.screen.put_interval(page, x, y, pixels[ofs*ppb:(ofs+length)*ppb])
 
     def get_memory(self, addr, num_bytes):
         """Retrieve bytes from CGA memory."""
-        bytes = bytearray(num_bytes)
+        # collect the rows, then convert the whole block at once
+        ppb = self.ppb
+        pixels = blank_interval(num_bytes*ppb)
         for page, x, y, ofs, length in walk_memory(self, addr, num_bytes):
-            bytes[ofs:ofs+length] = interval_to_bytes(
-                self.screen.get_interval(page, x, y, length*self.ppb), self.ppb)
-        return bytes
+            pixels[ofs*ppb:(ofs+length)*ppb] = self.screen.get_interval(page, x, y, length*ppb)
+        return interval_to_bytes(pixels, ppb)
 
     def sprite_size_to_record(self, dx, dy):
         """Write 4-byte record of sprite size."""
@@ -701,14 +706,13 @@ class EGAMode(GraphicsMode):
     def get_memory(self, addr, num_bytes):
         """Retrieve bytes from EGA memory."""
         plane = self.plane % (max(self.planes_used)+1)
-        bytes = bytearray(num_bytes)
         if plane not in self.planes_used:
-            return bytes
+            return bytearray(num_bytes)
+        ppb = self.ppb
+        pixels = blank_interval(num_bytes*ppb)
         for page, x, y, ofs, length in walk_memory(self, addr, num_bytes):
-            bytes[ofs:ofs+length] = interval_to_bytes(
-                self.screen.get_interval(page, x, y, length*self.ppb),
-                self.ppb, plane)
-        return bytes
+            pixels[ofs*ppb:(ofs+length)*ppb] = self.screen.get_interval(page, x, y, length*ppb)
+        return interval_to_bytes(pixels, ppb, plane)
 
     def set_memory(self, addr, bytes):
         """Set bytes in EGA video memory."""
@@ -720,9 +724,10 @@ class EGAMode(GraphicsMode):
         # return immediately for unused colour planes
         if mask == 0:
             return
+        ppb = self.ppb
+        pixels = bytes_to_interval(bytes, ppb, mask)
         for page, x, y, ofs, length in walk_memory(self, addr, len(bytes)):
-            self.screen.put_interval(page, x, y,
-                bytes_to_interval(bytes[ofs:ofs+length], self.ppb, mask), mask)
+            self.screen.put_interval(page, x, y, pixels[ofs*ppb:(ofs+length)*ppb], mask)
 
     sprite_to_array = sprite_to_array_ega
     array_to_sprite = array_to_sprite_ega
@@ -782,26 +787,28 @@ class Tandy6Mode(GraphicsMode):
         # 8 pixels per 2 bytes
         # low attribute bits stored in even bytes, high bits in odd bytes.
         half_len = (num_bytes+1) // 2
-        hbytes = bytearray(half_len), bytearray(half_len)
+        ppb = self.ppb * 2
+        # both planes are taken from the same pixels
+        pixels = blank_interval(half_len*ppb)
+        for page, x, y, ofs, length in walk_memory(self, addr, half_len, 2):
+            pixels[ofs*ppb:(ofs+length)*ppb] = self.screen.get_interval(page, x, y, length*ppb)
+        bytes = bytearray(half_len*2)
         for parity in (0, 1):
-            for page, x, y, ofs, length in walk_memory(self, addr, num_bytes, 2):
-                hbytes[parity][ofs:ofs+length] = interval_to_bytes(
-                    self.screen.get_interval(page, x, y, length*self.ppb*2),
-                    self.ppb*2, parity ^ (addr%2))
+            bytes[parity::2] = interval_to_bytes(pixels, ppb, parity ^ (addr%2))
         # resulting array may be too long by one byte, so cut to size
-        return [item for pair in zip(*hbytes) for item in pair] [:num_bytes]
+        return bytes[:num_bytes]
 
     def set_memory(self, addr, bytes):
         """Set bytes in Tandy 640x200x4 memory."""
         hbytes = bytes[0::2], bytes[1::2]
         # Tandy-6 encodes 8 pixels per byte, alternating colour planes.
         # I.e. even addresses are 'colour plane 0', odd ones are 'plane 1'
+        ppb = self.ppb * 2
         for parity in (0, 1):
             mask = 2 ** (parity^(addr%2))
-            for page, x, y, ofs, length in walk_memory(self, addr, len(bytes), 2):
-                self.screen.put_interval(page, x, y,
-                    bytes_to_interval(hbytes[parity][ofs:ofs+length], 2*self.ppb, mask),
-                    mask)
+            pixels = bytes_to_interval(hbytes[parity], ppb, mask)
+            for page, x, y, ofs, length in walk_memory(self, addr, len(hbytes[0]), 2):
+                self.screen.put_interval(page, x, y, pixels[ofs*ppb:(ofs+length)*ppb], mask)
 
     sprite_to_array = sprite_to_array_ega
     array_to_sprite = array_to_sprite_ega
@@ -10,6 +10,7 @@ try:
     from cStringIO import StringIO
 except ImportError:
     from StringIO import StringIO
+import time
 import string
 from collections import deque
 
@@ -91,6 +92,8 @@ class Parser(object):
                     return False
                 if self.tron:
                     self.session.screen.write('[' + ('%i' % linenum) + ']')
+                if self.session.profiler:
+                    self.session.profiler.start_line(linenum)
                 self.session.debugger.debug_step(linenum)
             elif c == ':':
                 ins.read(1)
@@ -100,7 +103,7 @@ class Parser(object):
                 return True
             # implicit LET
             elif c in string.ascii_letters:
-                self.statements.exec_let(ins)
+                c = tk.LET
             # token
             else:
                 ins.read(1)
@@ -109,11 +112,22 @@ class Parser(object):
                 # don't use try-block to avoid catching other KeyErrors in statement
                 if c not in self.statements.statements:
                     raise error.RunError(error.STX)
+            if self.session.profiler:
+                self._profile_statement(c, ins)
+            else:
                 self.statements.statements[c](ins)
         except error.RunError as e:
             self.trap_error(e)
         return True
 
+    def _profile_statement(self, token, ins):
+        """Execute a statement and record the time it took."""
+        start = time.time()
+        try:
+            self.statements.statements[token](ins)
+        finally:
+            self.session.profiler.add_statement(token, time.time() - start)
+
     #################################################################
 
     def clear(self):
@@ -265,6 +279,8 @@ class Parser(object):
         """Increase number and check if it exceeds a limit."""
         if sgn == 0:
             return False
+        # the loop variable is changed in place, not through Scalars.set
+        self.session.scalars.version += 1
         if typechar in ('#', '!'):
             fp_left = fp.from_bytes(loopvar).iadd(step)
             loopvar[:] = fp_left.to_bytes()
@@ -345,11 +361,11 @@ class Parser(object):
     ###########################################################################
     # expression parser
 
-    def parse_bracket(self, ins, session):
+    def parse_bracket(self, ins, session, ops=None):
         """Compute the value of the bracketed expression."""
         util.require_read(ins, ('(',))
         # we'll get a Syntax error, not a Missing operand, if we close with )
-        val = self.parse_expression(ins, session)
+        val = self.parse_expression(ins, session, ops=ops)
         util.require_read(ins, (')',))
         return val
 
@@ -391,23 +407,35 @@ class Parser(object):
         else:
             raise error.RunError(error.STX)
 
-    def parse_variable(self, ins, session):
-        """Helper function: parse a variable or array element."""
-        name = self.parse_scalar(ins)
+    def parse_variable(self, ins, session, ops=None):
+        """Helper function: parse a variable or array element.
+        If ops is a list, append the operations that retrieve the element."""
+        name = util.read_name(ins)
         indices = []
         if util.skip_white_read_if(ins, ('[', '(')):
             # it's an array, read indices
             while True:
-                indices.append(vartypes.pass_int_unpack(self.parse_expression(ins, session)))
+                indices.append(vartypes.pass_int_unpack(self.parse_expression(ins, session, ops=ops)))
+                if ops is not None:
+                    ops.append(('int',))
                 if not util.skip_white_read_if(ins, (',',)):
                     break
             util.require_read(ins, (']', ')'))
-        return name, indices
+        if ops is not None:
+            # the default sigil is added when the operation is run, as DEFINT etc. may change
+            if indices:
+                ops.append(('arr', name, len(indices)))
+            else:
+                ops.append(('var', name))
+        return self.complete_name(name), indices
 
     def parse_scalar(self, ins, allow_empty=False, err=error.STX):
         """Get variable name from token stream."""
-        # append type specifier
-        name = self.session.memory.complete_name(util.read_name(ins, allow_empty, err))
+        return self.complete_name(util.read_name(ins, allow_empty, err))
+
+    def complete_name(self, name):
+        """Append type specifier to a variable name as read from the token stream."""
+        name = self.session.memory.complete_name(name)
         # only the first 40 chars are relevant in GW-BASIC, rest is discarded
         if len(name) > 41:
             name = name[:40]+name[-1]
@@ -430,8 +458,9 @@ class Parser(object):
         util.range_check(0, 255, number)
         return number
 
-    def parse_expression(self, ins, session, allow_empty=False):
-        """Compute the value of the expression at the current code pointer."""
+    def parse_expression(self, ins, session, allow_empty=False, ops=None):
+        """Compute the value of the expression at the current code pointer.
+        If ops is a list, append the operations evaluated, for evaluate_compiled."""
         stack = deque()
         units = deque()
         d = ''
@@ -465,21 +494,27 @@ class Parser(object):
                     if d not in op.operators:
                         # illegal combined ops like == raise syntax error
                         raise error.RunError(error.STX)
-                    self._evaluate_stack(stack, units, op.precedence[d], error.STX)
+                    self._evaluate_stack(stack, units, op.precedence[d], error.STX, ops)
                 stack.append((d, nargs))
             elif not (last in op.operators or last == ''):
                 # repeated unit ends expression
                 # repeated literals or variables or non-keywords like 'AS'
                 break
             elif d == '(':
-                units.append(self.parse_bracket(ins, session))
+                units.append(self.parse_bracket(ins, session, ops))
             elif d and d in string.ascii_letters:
                 # variable name
-                name, indices = self.parse_variable(ins, session)
-                units.append(self.session.memory.get_variable(name, indices))
+                name, indices = self.parse_variable(ins, session, ops)
+                if indices:
+                    units.append(self.session.arrays.get(name, indices))
+                else:
+                    units.append(self.session.scalars.get(name))
             elif d in self.functions.functions:
                 # apply functions
                 ins.read(len(d))
+                if ops is not None:
+                    # the function reads its own arguments again when the operation is run
+                    ops.append(('fn', d, ins.tell()))
                 try:
                     units.append(self.functions.functions[d](ins))
                 except (ValueError, ArithmeticError) as e:
@@ -493,23 +528,32 @@ class Parser(object):
             else:
                 # literal
                 units.append(self.parse_literal(ins, session))
+                if ops is not None:
+                    if units[-1][0] == '$':
+                        # string literals are stored anew each time
+                        ops.append(('str', str(session.strings.copy(units[-1]))))
+                    else:
+                        # copy, as operators may work on the value in place
+                        ops.append(('lit', (units[-1][0], units[-1][1][:])))
         # empty expression is a syntax error (inside brackets)
         # or Missing Operand (in an assignment)
         # or not an error (in print and many functions)
         if units or stack:
-            self._evaluate_stack(stack, units, 0, missing_error)
+            self._evaluate_stack(stack, units, 0, missing_error, ops)
             return units[0]
         elif allow_empty:
             return None
         else:
             raise error.RunError(missing_error)
 
-    def _evaluate_stack(self, stack, units, precedence, missing_err):
+    def _evaluate_stack(self, stack, units, precedence, missing_err, ops=None):
         """Drain evaluation stack until an operator of low precedence on top."""
         while stack:
             if precedence > op.precedence[stack[-1][0]]:
                 break
             oper, narity = stack.pop()
+            if ops is not None:
+                ops.append(('un' if narity == 1 else 'bin', oper))
             try:
                 right = units.pop()
                 if narity == 1:
@@ -545,3 +589,48 @@ class Parser(object):
         if e.args and e.args[0] and isinstance(e.args[0], fp.Float):
             return fp.pack(e.args[0])
         return fp.pack(fp.Single.max.copy())
+
+    ###########################################################################
+    # compiled expressions
+
+    def evaluate_compiled(self, ops, code):
+        """Compute the value of a compiled expression; code is the source it was compiled from."""
+        units = []
+        ins = None
+        memory = self.session.memory
+        for oper in ops:
+            kind = oper[0]
+            if kind == 'var':
+                units.append(memory.scalars.get(self.complete_name(oper[1])))
+            elif kind == 'lit':
+                units.append((oper[1][0], oper[1][1][:]))
+            elif kind == 'bin':
+                right = units.pop()
+                left = units.pop()
+                try:
+                    units.append(self.operators.binary[oper[1]](left, right))
+                except (ValueError, ArithmeticError) as e:
+                    units.append(self._handle_math_error(e))
+            elif kind == 'un':
+                try:
+                    units.append(self.operators.unary[oper[1]](units.pop()))
+                except (ValueError, ArithmeticError) as e:
+                    units.append(self._handle_math_error(e))
+            elif kind == 'fn':
+                if ins is None:
+                    ins = StringIO(code)
+                ins.seek(oper[2])
+                try:
+                    units.append(self.functions.functions[oper[1]](ins))
+                except (ValueError, ArithmeticError) as e:
+                    units.append(self._handle_math_error(e))
+            elif kind == 'str':
+                units.append(self.session.strings.store(bytearray(oper[1])))
+            elif kind == 'int':
+                units[-1] = vartypes.pass_int_unpack(units[-1])
+            elif kind == 'arr':
+                nindices = oper[2]
+                indices = units[-nindices:]
+                del units[-nindices:]
+                units.append(memory.arrays.get(self.complete_name(oper[1]), indices))
+        return units[0]
@@ -11,21 +11,32 @@ PySerial (c) 2001-2013 Chris Liechtl <cliechti(at)gmx.net>; All Rights Reserved.
 
 import logging
 import sys
+import re
 import os
+import time
 import socket
+import select
 import datetime
 import platform
 
 # kbhit() also appears in video_none.py
 if platform.system() == 'Windows':
     from msvcrt import kbhit
-else:
-    import select
 
+    def wait_stdin(timeout):
+        """Wait until a character is ready to be read from the keyboard, or timeout."""
+        if not kbhit():
+            time.sleep(timeout)
+        return kbhit()
+else:
     def kbhit():
         """Return whether a character is ready to be read from the keyboard."""
         return select.select([sys.stdin], [], [], 0)[0] != []
 
+    def wait_stdin(timeout):
+        """Wait until a character is ready to be read from the keyboard, or timeout."""
+        return select.select([sys.stdin], [], [], timeout)[0] != []
+
 try:
     from cStringIO import StringIO
 except ImportError:
@@ -214,13 +225,20 @@ class COMFile(devices.CRLFTextFileBase):
         if len(self.in_buffer) >= self.serial_in_size and self.fhandle.read(1):
             self.overflow = True
             # drop waiting chars that don't fit in buffer
-            while self.fhandle.read(1):
+            while self.fhandle.read(self.serial_in_size):
                 pass
         if not allow_overflow and self.overflow:
             # only raise this the first time the overflow is encountered
             self.overflow = False
             raise error.RunError(error.COMMUNICATION_BUFFER_OVERFLOW)
 
+    def _wait_input(self):
+        """Wait until input arrives, for at most an event tick."""
+        try:
+            return self.fhandle.wait(self.events.tick)
+        except (EnvironmentError, ValueError, select.error):
+            raise error.RunError(error.DEVICE_IO_ERROR)
+
     def read_raw(self, num=-1):
         """Read num characters from the port as a string; blocking """
         if num == -1:
@@ -230,15 +248,27 @@ class COMFile(devices.CRLFTextFileBase):
             del self.in_buffer[:]
         else:
             out = ''
-            while len(out) < num:
+            woken = False
+            while True:
                 # non blocking read
                 self._check_read()
                 to_read = min(len(self.in_buffer), num - len(out))
                 out += str(self.in_buffer[:to_read])
                 del self.in_buffer[:to_read]
-                # allow for break & screen updates
-                # this also allows triggering BASIC events
-                self.events.wait()
+                if len(out) >= num:
+                    break
+                if woken and not to_read:
+                    # woken up but nothing to read, e.g. connection closed
+                    # don't spin; wait a tick as when polling
+                    self.events.wait()
+                    woken = False
+                else:
+                    # wake up as soon as input arrives, but at least once a tick
+                    woken = self._wait_input()
+                    # allow for break & screen updates
+                    # this also allows triggering BASIC events
+                    self.events.check_events()
+            self.events.check_events()
         return out
 
     def read_line(self):
@@ -322,6 +352,10 @@ class StdIOStream(object):
             s += c
         return s
 
+    def wait(self, timeout):
+        """Wait until input is available or timeout (in seconds) has passed."""
+        return wait_stdin(timeout)
+
     def write(self, s):
         """Write to stdout."""
         for c in s:
@@ -472,6 +506,21 @@ class SerialStream(object):
         # but that's ill-defined for ports
         return self._serial.read(num)
 
+    def wait(self, timeout):
+        """Wait until input is available or timeout (in seconds) has passed."""
+        self._check_open()
+        try:
+            # posix serial ports can be selected on
+            fd = self._serial.fileno()
+        except (AttributeError, EnvironmentError, ValueError):
+            fd = None
+        if fd is None or platform.system() == 'Windows':
+            # fall back to polling
+            if not self._serial.inWaiting():
+                time.sleep(timeout)
+            return self._serial.inWaiting() > 0
+        return select.select([fd], [], [], timeout)[0] != []
+
     def write(self, s):
         """Write to socket."""
         self._check_open()
@@ -515,11 +564,22 @@ class SocketSerialStream(SerialStream):
                 return ''
             raise SerialException('connection failed (%s)' % e)
 
+    def wait(self, timeout):
+        """Wait until input is available or timeout (in seconds) has passed."""
+        if not self._serial._isOpen:
+            raise serialutil.portNotOpenError
+        return select.select([self._serial._socket], [], [], timeout)[0] != []
+
 
 
 ###############################################################################
 # LPT ports
 
+# characters with special effect on the printer position
+_lpt_special = re.compile('([\r\n\f\b])')
+# characters not counted for printer width
+_lpt_nonprinting = ''.join(chr(_c) for _c in range(32))
+
 class LPTDevice(devices.Device):
     """Parallel port or printer device (LPTn:) """
 
@@ -570,6 +630,11 @@ class LPTDevice(devices.Device):
 class LPTFile(devices.TextFileBase):
     """LPTn: device - line printer or parallel port."""
 
+    # pass on long lines in pieces so they don't collect in memory
+    chunk_size = printer.PrinterStreamBase.chunk_size
+    # number of characters of a long line held back for CHR$(8)
+    backspace_room = 255
+
     def __init__(self, stream, filetype='D', flush_trigger='close'):
         """Initialise LPTn."""
         devices.TextFileBase.__init__(self, StringIO(), filetype, mode='A')
@@ -588,30 +653,71 @@ class LPTFile(devices.TextFileBase):
 
     def write(self, s):
         """Write a string to the printer buffer."""
-        for c in str(s):
-            if self.col >= self.width and self.width != 255:  # width 255 means wrapping enabled
-                self.fhandle.write('\r\n')
-                self.flush()
-                self.col = 1
-            if c in ('\n', '\r', '\f'):
+        # handle runs of ordinary characters in one go
+        for run in _lpt_special.split(str(s)):
+            if not run:
+                continue
+            elif run in ('\n', '\r', '\f'):
+                self._check_wrap()
                 # don't replace CR or LF with CRLF when writing to files
-                self.fhandle.write(c)
+                self.fhandle.write(run)
                 self.flush()
                 self.col = 1
                 # do the actual printing if we're on a short trigger
-                if (self.flush_trigger == 'line' and c == '\n') or (self.flush_trigger == 'page' and c == '\f'):
+                if (self.flush_trigger == 'line' and run == '\n') or (self.flush_trigger == 'page' and run == '\f'):
                     self.output_stream.flush()
-            elif c == '\b':   # BACKSPACE
+            elif run == '\b':   # BACKSPACE
+                self._check_wrap()
                 if self.col > 1:
                     self.col -= 1
                     self.fhandle.seek(-1, 1)
                     self.fhandle.truncate()
             else:
-                self.fhandle.write(c)
-                # nonprinting characters including tabs are not counted for WIDTH
-                # for lpt1 and files , nonprinting chars are not counted in LPOS; but chr$(8) will take a byte out of the buffer
-                if ord(c) >= 32:
-                    self.col += 1
+                self._write_run(run)
+        if self.fhandle.tell() >= self.chunk_size + self.backspace_room:
+            # pass on a long line, keeping a tail for backspaces to take out
+            val = self.fhandle.getvalue()
+            self.output_stream.write(val[:-self.backspace_room])
+            self.fhandle.truncate(0)
+            self.fhandle.write(val[-self.backspace_room:])
+
+    def _check_wrap(self):
+        """Start a new line if the printer width has been reached."""
+        if self.col >= self.width and self.width != 255:  # width 255 means wrapping enabled
+            self.fhandle.write('\r\n')
+            self.flush()
+            self.col = 1
+
+    def _write_run(self, run):
+        """Write a run of characters that are not CR, LF, FF or BACKSPACE."""
+        # nonprinting characters including tabs are not counted for WIDTH
+        # for lpt1 and files , nonprinting chars are not counted in LPOS; but chr$(8) will take a byte out of the buffer
+        while run:
+            self._check_wrap()
+            printing = len(run.translate(None, _lpt_nonprinting))
+            if self.width == 255 or self.col + printing < self.width:
+                self.fhandle.write(run)
+                self.col += printing
+                return
+            # cut the run after the character that reaches the width
+            room = self.width - self.col
+            if room <= 0:
+                # width 1: a new line before each character
+                self.fhandle.write(run[0])
+                self.col += run[0] not in _lpt_nonprinting
+                run = run[1:]
+                continue
+            elif printing == len(run):
+                cut = room
+            else:
+                cut = 0
+                while room:
+                    if run[cut] not in _lpt_nonprinting:
+                        room -= 1
+                    cut += 1
+            self.fhandle.write(run[:cut])
+            self.col = self.width
+            run = run[cut:]
 
     def write_line(self, s=''):
         """Write string or bytearray and newline to file."""
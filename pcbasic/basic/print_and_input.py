@@ -13,6 +13,7 @@ except ImportError:
 
 from . import util
 from . import devices
+from . import representation
 
 
 class InputTextFile(devices.TextFileBase):
@@ -55,6 +56,47 @@ def input_console(editor, stringspace, prompt, readvar, newline):
 ########################################
 # for PRINT USING
 
+# compiled format strings
+_using_formats = {}
+# maximum number of format strings to keep
+_max_using_formats = 256
+
+def compile_using_format(format_str):
+    """Split a format string into literals and fields; return a cached list of (literal, string_field, number_format)."""
+    try:
+        return _using_formats[format_str]
+    except KeyError:
+        pass
+    fors = StringIO(format_str)
+    template = []
+    literal = ''
+    while True:
+        c = util.peek(fors)
+        if c == '':
+            break
+        elif c == '_':
+            # escape char; next char in fors or _ if this is the last char
+            literal += fors.read(2)[-1]
+            continue
+        string_field = get_string_tokens(fors)
+        if string_field:
+            template.append((literal, string_field, None))
+        else:
+            number_field, digits_before, decimals = get_number_tokens(fors)
+            if number_field:
+                template.append((literal, None, representation.NumberFormat(
+                                        number_field, digits_before, decimals)))
+            else:
+                literal += fors.read(1)
+                continue
+        literal = ''
+    # trailing literal, without a field
+    template.append((literal, None, None))
+    if len(_using_formats) >= _max_using_formats:
+        _using_formats.clear()
+    _using_formats[format_str] = template
+    return template
+
 def get_string_tokens(fors):
     """Get consecutive string-related formatting tokens."""
     word = ''
@@ -6,10 +6,11 @@ Line printer output
 This file is released under the GNU GPL version 3 or later.
 """
 
-from StringIO import StringIO
 import subprocess
+import threading
 import logging
 import platform
+import Queue
 import os
 
 if platform.system() == 'Windows':
@@ -21,30 +22,109 @@ if platform.system() == 'Windows':
     except ImportError:
         win32print = None
 
-class PrinterStreamBase(StringIO):
+
+class PrinterStreamBase(object):
     """Base stream for printing."""
 
+    # number of bytes to collect before passing them on to the printer
+    chunk_size = 4096
+    # number of chunks waiting for the printer before write() blocks
+    max_chunks = 16
+
     def __init__(self, printer_name, codepage):
         """Initialise the printer stream."""
         self.printer_name = printer_name
         self.codepage = codepage
-        StringIO.__init__(self)
+        # bytes not yet passed on to the writer thread
+        self._buffer = []
+        self._buffer_size = 0
+        # writer thread and its queue are started on first use
+        self._queue = None
+        self._writer = None
+
+    def __getstate__(self):
+        """Pickle the printer stream."""
+        pickle_dict = self.__dict__.copy()
+        # don't pickle the writer thread
+        pickle_dict['_queue'] = None
+        pickle_dict['_writer'] = None
+        return pickle_dict
 
     def close(self):
         """Close the printer stream."""
         self.flush()
+        if self._writer:
+            self._queue.put(None)
+            self._writer.join()
+            self._queue, self._writer = None, None
         self._wait()
 
+    def write(self, s):
+        """Write to the printer buffer; pass on to the printer in chunks."""
+        self._buffer.append(s)
+        self._buffer_size += len(s)
+        if self._buffer_size >= self.chunk_size:
+            self._send(False)
+
     def flush(self):
-        """Flush the printer buffer to a printer."""
-        printbuf = self.getvalue()
-        if not printbuf:
+        """Complete the current print job."""
+        self._send(True)
+
+    def _send(self, end_job):
+        """Pass the buffer on to the writer thread; blocks if printer is behind."""
+        printbuf = ''.join(self._buffer)
+        if not printbuf and not end_job:
             return
-        self.truncate(0)
-        # any naked lead bytes in DBCS will remain just that - avoid in-line flushes.
-        utf8buf = self.codepage.str_to_unicode(
-                    printbuf, preserve_control=True).encode('utf-8', 'replace')
-        self._line_print(utf8buf)
+        self._buffer, self._buffer_size = [], 0
+        if not self._writer:
+            if not printbuf:
+                return
+            self._queue = Queue.Queue(self.max_chunks)
+            self._writer = threading.Thread(target=self._process_jobs)
+            self._writer.daemon = True
+            self._writer.start()
+        self._queue.put((printbuf, end_job))
+
+    def _process_jobs(self):
+        """Writer thread: convert chunks and pass them to the print job."""
+        job = None
+        # DBCS lead byte left over from the previous chunk
+        held = ''
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            printbuf, end_job = item
+            try:
+                # LPTFile may pass on long lines in pieces, which can split DBCS sequences
+                printbuf, held = held + printbuf, ''
+                if not end_job:
+                    printbuf, held = self._split_lead_byte(printbuf)
+                if printbuf:
+                    if job is None:
+                        job = self._start_job()
+                    self._write_job(job, self.codepage.str_to_unicode(
+                            printbuf, preserve_control=True).encode('utf-8', 'replace'))
+                if end_job and job is not None:
+                    job, last_job = None, job
+                    self._end_job(last_job)
+            except Exception as e:
+                # keep draining the queue, or write() and close() would block forever
+                logging.warning('Error while printing: %s', e)
+                job, held = None, ''
+
+    def _split_lead_byte(self, printbuf):
+        """Split off a DBCS lead byte at the end of a chunk that starts on a character boundary."""
+        if not self.codepage.dbcs:
+            return printbuf, ''
+        i, length = 0, len(printbuf)
+        while True:
+            match = self.codepage.lead_re.search(printbuf, i)
+            if not match:
+                return printbuf, ''
+            i = match.start() + 2
+            if i > length:
+                return printbuf[:-1], printbuf[-1:]
 
     def set_control(self, select=False, init=False, lf=False, strobe=False):
         """Set the values of the control pins."""
@@ -53,9 +133,15 @@ class PrinterStreamBase(StringIO):
         """Get the values of the status pins."""
         return False, False, False, False, False
 
-    def _line_print(self, printbuf):
+    def _start_job(self):
+        """Start a print job (dummy)."""
+
+    def _write_job(self, job, printbuf):
         """Don't print anything."""
 
+    def _end_job(self, job):
+        """Complete a print job (dummy)."""
+
     def _wait(self):
         """Wait for process to complete (dummy)."""
 
@@ -68,10 +154,19 @@ def get_printer_stream(val, codepage, temp_dir):
         else:
             logging.warning('Could not find win32print module. Printing is disabled.')
             return PrinterStreamBase(val, codepage)
-    elif subprocess.call("command -v paps >/dev/null 2>&1", shell=True) == 0:
-        return PAPSPrinterStream(val, codepage)
     else:
-        return CUPSPrinterStream(val, codepage)
+        # we only look for PAPS when the first job is printed
+        return PAPSPrinterStream(val, codepage)
+
+# whether the PAPS formatter is installed; not known until needed
+_paps_found = None
+
+def _paps_available():
+    """Check whether the PAPS formatter is installed."""
+    global _paps_found
+    if _paps_found is None:
+        _paps_found = subprocess.call("command -v paps >/dev/null 2>&1", shell=True) == 0
+    return _paps_found
 
 
 class WindowsPrinterStream(PrinterStreamBase):
@@ -85,16 +180,24 @@ class WindowsPrinterStream(PrinterStreamBase):
         # handle for last printing process
         self.handle = -1
 
-    def _line_print(self, printbuf):
-        """Print the buffer to a Windows printer."""
-        if self.printer_name == '' or self.printer_name == 'default':
-            self.printer_name = win32print.GetDefaultPrinter()
+    def _start_job(self):
+        """Start collecting a print job in a temporary file."""
         # open a file in our PC-BASIC temporary directory
         # this will get cleaned up on exit
-        with open(self._printfile, 'wb') as f:
-            # write UTF-8 Byte Order mark to ensure Notepad recognises encoding
-            f.write('\xef\xbb\xbf')
-            f.write(printbuf)
+        f = open(self._printfile, 'wb')
+        # write UTF-8 Byte Order mark to ensure Notepad recognises encoding
+        f.write('\xef\xbb\xbf')
+        return f
+
+    def _write_job(self, f, printbuf):
+        """Add to the print job."""
+        f.write(printbuf)
+
+    def _end_job(self, f):
+        """Print the job file to a Windows printer."""
+        f.close()
+        if self.printer_name == '' or self.printer_name == 'default':
+            self.printer_name = win32print.GetDefaultPrinter()
         # fMask = SEE_MASK_NOASYNC(0x00000100) + SEE_MASK_NOCLOSEPROCESS
         try:
             resdict = win32com.shell.shell.ShellExecuteEx(fMask=256+64,
@@ -113,42 +216,64 @@ class WindowsPrinterStream(PrinterStreamBase):
             pass
 
 
-class PAPSPrinterStream(PrinterStreamBase):
-    """Stream that prints to a CUPS printer using PAPS."""
+class CUPSPrinterStream(PrinterStreamBase):
+    """Stream that prints to a CUPS or LPR printer."""
 
-    def _line_print(self, printbuf):
-        """Print the buffer to a LPR printer using PAPS."""
+    def _get_command(self):
+        """Get the print command line."""
         options = ''
         if self.printer_name != '' and self.printer_name != 'default':
             options += '-P ' + self.printer_name
-        if printbuf != '':
-            # A4 paper is 595 points wide by 842 points high.
-            # Letter paper is 612 by 792 points.
-            # the below seems to allow 82 chars horizontally on A4; it appears
-            # my PAPS version doesn't quite use cpi correctly as 10cpi should
-            # allow 80 chars on A4 with a narrow margin but only does so with a
-            # margin of 0.
-            pr = subprocess.Popen(
-                'paps --cpi=11 --lpi=6 --left-margin=20 --right-margin=20 '
+        # cups defaults to 10 cpi, 6 lpi.
+        return 'lpr %s' % options
+
+    def _start_job(self):
+        """Start a print job by opening a pipe to the print command."""
+        return subprocess.Popen(self._get_command(), shell=True, stdin=subprocess.PIPE)
+
+    def _write_job(self, pr, printbuf):
+        """Stream to the print command."""
+        pr.stdin.write(printbuf)
+
+    def _end_job(self, pr):
+        """Close the pipe, which submits the print job."""
+        pr.stdin.close()
+
+
+class PAPSPrinterStream(CUPSPrinterStream):
+    """Stream that prints to a CUPS printer using PAPS, if installed."""
+
+    def _get_command(self):
+        """Get the print command line."""
+        if not _paps_available():
+            return CUPSPrinterStream._get_command(self)
+        # A4 paper is 595 points wide by 842 points high.
+        # Letter paper is 612 by 792 points.
+        # the below seems to allow 82 chars horizontally on A4; it appears
+        # my PAPS version doesn't quite use cpi correctly as 10cpi should
+        # allow 80 chars on A4 with a narrow margin but only does so with a
+        # margin of 0.
+        return ('paps --cpi=11 --lpi=6 --left-margin=20 --right-margin=20 '
                 '--top-margin=6 --bottom-margin=6 '
-                '| lpr %s' % options, shell=True, stdin=subprocess.PIPE)
-            # PAPS does not recognise CRLF
-            printbuf = printbuf.replace('\r\n', '\n')
-            pr.stdin.write(printbuf)
-            pr.stdin.close()
+                '| ' + CUPSPrinterStream._get_command(self))
 
+    def _start_job(self):
+        """Start a print job through PAPS."""
+        # carry a CR at the end of a chunk over to the next one
+        self._held_cr = ''
+        return CUPSPrinterStream._start_job(self)
 
-class CUPSPrinterStream(PrinterStreamBase):
-    """Stream that prints to a CUPS or LPR printer."""
+    def _write_job(self, pr, printbuf):
+        """Stream to PAPS."""
+        if not _paps_available():
+            return CUPSPrinterStream._write_job(self, pr, printbuf)
+        printbuf, self._held_cr = self._held_cr + printbuf, ''
+        if printbuf[-1:] == '\r':
+            printbuf, self._held_cr = printbuf[:-1], '\r'
+        # PAPS does not recognise CRLF
+        CUPSPrinterStream._write_job(self, pr, printbuf.replace('\r\n', '\n'))
 
-    def _line_print(self, printbuf):
-        """Print the buffer to a LPR (CUPS or older UNIX) printer."""
-        options = ''
-        if self.printer_name != '' and self.printer_name != 'default':
-            options += '-P ' + self.printer_name
-        if printbuf != '':
-            # cups defaults to 10 cpi, 6 lpi.
-            pr = subprocess.Popen('lpr %s' % options, shell=True,
-                                  stdin=subprocess.PIPE)
-            pr.stdin.write(printbuf)
-            pr.stdin.close()
+    def _end_job(self, pr):
+        """Close the pipe, which submits the print job."""
+        CUPSPrinterStream._write_job(self, pr, self._held_cr)
+        CUPSPrinterStream._end_job(self, pr)
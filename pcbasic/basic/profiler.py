@@ -0,0 +1,110 @@
+"""
+PC-BASIC - profiler.py
+Per-line and per-statement execution profile
+
+(c) 2016 Rob Hagemans
+This file is released under the GNU GPL version 3 or later.
+"""
+
+import sys
+import time
+import logging
+
+from . import basictoken as tk
+
+
+class Profiler(object):
+    """Count and time program lines, statements and event checks."""
+
+    def __init__(self, report=True, callgrind_file=u''):
+        """Initialise the profile."""
+        self._report = report
+        self._callgrind_file = callgrind_file
+        # name of the program file, for the callgrind output
+        self.program_name = u''
+        # line number: [executions, seconds]
+        self._lines = {}
+        # statement token: [executions, seconds]
+        self._statements = {}
+        # event checks: [checks, seconds]
+        self._events = [0, 0.]
+        # line being executed and the time it was entered
+        self._line = None
+        self._line_start = 0.
+        self._start = time.time()
+
+    def start_line(self, linenum):
+        """Start executing a program line."""
+        now = time.time()
+        if self._line is not None:
+            self._lines[self._line][1] += now - self._line_start
+        self._line, self._line_start = linenum, now
+        try:
+            self._lines[linenum][0] += 1
+        except KeyError:
+            self._lines[linenum] = [1, 0.]
+
+    def stop_line(self):
+        """Stop executing program lines."""
+        if self._line is not None:
+            self._lines[self._line][1] += time.time() - self._line_start
+            self._line = None
+
+    def add_statement(self, token, seconds):
+        """Record the execution of a statement."""
+        try:
+            record = self._statements[token]
+        except KeyError:
+            record = self._statements[token] = [0, 0.]
+        record[0] += 1
+        record[1] += seconds
+
+    def add_event_check(self, seconds):
+        """Record an event check."""
+        self._events[0] += 1
+        self._events[1] += seconds
+
+    def close(self):
+        """Write the report to standard error and the callgrind file, as requested."""
+        if self._report:
+            self.report(sys.stderr)
+        if self._callgrind_file:
+            self.write_callgrind(self._callgrind_file)
+
+    def report(self, stream):
+        """Write a report of the hottest lines and statements."""
+        self.stop_line()
+        total = time.time() - self._start
+        stream.write('%-12s %10s %10s %10s %6s\n' % ('line', 'count', 'seconds', 'per call', '%'))
+        for linenum, (count, seconds) in sorted(
+                self._lines.iteritems(), key=lambda item: item[1][1], reverse=True):
+            stream.write('%-12d %10d %10.3f %10.6f %6.1f\n' % (
+                    linenum, count, seconds, seconds/count, 100.*seconds/total if total else 0.))
+        stream.write('\n%-12s %10s %10s %10s %6s\n' % ('statement', 'count', 'seconds', 'per call', '%'))
+        for token, (count, seconds) in sorted(
+                self._statements.iteritems(), key=lambda item: item[1][1], reverse=True):
+            stream.write('%-12s %10d %10.3f %10.6f %6.1f\n' % (
+                    tk.keyword.get(token, token), count, seconds, seconds/count,
+                    100.*seconds/total if total else 0.))
+        count, seconds = self._events
+        stream.write('\n%-12s %10d %10.3f %10.6f %6.1f\n' % (
+                'event checks', count, seconds, seconds/count if count else 0.,
+                100.*seconds/total if total else 0.))
+        stream.write('%-12s %10s %10.3f\n' % ('total', '', total))
+        stream.flush()
+
+    def write_callgrind(self, filename):
+        """Write line counts and times in callgrind format."""
+        self.stop_line()
+        try:
+            with open(filename, 'w') as f:
+                f.write('# callgrind format\nversion: 1\ncreator: PC-BASIC\n')
+                f.write('positions: line\nevents: Count Microseconds\n\n')
+                name = self.program_name or 'program'
+                if isinstance(name, unicode):
+                    name = name.encode('utf-8')
+                f.write('fl=%s\nfn=main\n' % name)
+                for linenum, (count, seconds) in sorted(self._lines.iteritems()):
+                    f.write('%d %d %d\n' % (linenum, count, int(seconds * 1e6)))
+        except EnvironmentError as e:
+            logging.error('Could not write profile to %s: %s', filename, e)
@@ -6,16 +6,25 @@ Input/output redirection
 This file is released under the GNU GPL version 3 or later.
 """
 
+import os
 import threading
 import logging
 import Queue
 import sys
+import codecs
 import platform
 
 import unicodepage
+import devices
 
 
-def get_redirection(codepage, stdio, input_file, output_file, append):
+# size of blocks read from and written to redirected streams
+block_size = 65536
+# number of blocks a reader thread may run ahead of the interpreter
+queue_length = 16
+
+
+def get_redirection(codepage, stdio, input_file, output_file, append, device_params=None):
     """Initialise redirection objects."""
     if stdio:
         stdout_stream = unicodepage.CodecStream(
@@ -23,7 +32,10 @@ def get_redirection(codepage, stdio, input_file, output_file, append):
         stdin_stream = sys.stdin
     else:
         stdout_stream, stdin_stream = None, None
-    output_redirection = OutputRedirection(output_file, append, stdout_stream)
+    # buffer output unless someone may be watching it on a terminal
+    # or devices attached to STDIO write to stdout alongside us
+    buffered = not (stdio and (sys.stdout.isatty() or _has_stdio_device(device_params)))
+    output_redirection = OutputRedirection(output_file, append, stdout_stream, buffered)
     input_stream = None
     if input_file:
         try:
@@ -37,11 +49,24 @@ def get_redirection(codepage, stdio, input_file, output_file, append):
     return input_redirection, output_redirection
 
 
+def _has_stdio_device(device_params):
+    """Check if any device is attached to standard i/o."""
+    for arg in (device_params or {}).itervalues():
+        addr, val = devices.parse_protocol_string(arg or '')
+        if addr == 'STDIO' or (not addr and val.upper() == 'STDIO'):
+            return True
+    return False
+
+
 class OutputRedirection(object):
     """Manage I/O redirection."""
 
-    def __init__(self, option_output, append, filter_stream):
+    def __init__(self, option_output, append, filter_stream, buffered=False):
         """Initialise redirects."""
+        # output waiting to be written, if buffered
+        self._buffered = buffered
+        self._buffer = []
+        self._buffer_size = 0
         # redirect output to file or printer
         self._output_echos = []
         # filter interface depends on redirection output
@@ -57,11 +82,35 @@ class OutputRedirection(object):
 
     def write(self, s):
         """Write a string/bytearray to all redirected outputs."""
+        if not self._output_echos:
+            return
+        if not self._buffered:
+            for f in self._output_echos:
+                f.write(s)
+            return
+        self._buffer.append(bytes(s))
+        self._buffer_size += len(s)
+        if self._buffer_size >= block_size:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        """Write out buffered output as a single block."""
+        if self._buffer:
+            s = b''.join(self._buffer)
+            self._buffer, self._buffer_size = [], 0
+            for f in self._output_echos:
+                f.write(s)
+
+    def flush(self):
+        """Flush all redirected outputs."""
+        self._write_buffer()
         for f in self._output_echos:
-            f.write(s)
+            f.flush()
 
     def toggle_echo(self, stream):
         """Toggle copying of all screen I/O to stream."""
+        # buffered output goes to the streams that were echoing when it was written
+        self._write_buffer()
         if stream in self._output_echos:
             self._output_echos.remove(stream)
         else:
@@ -75,7 +124,9 @@ class InputRedirection(object):
     def __init__(self, input_list, codepage):
         """Initialise redirects."""
         self._codepage = codepage
-        self._buffer = []
+        # input that has been read from the sources but not yet consumed
+        self._buffer = u''
+        self._offset = 0
         self._sources = []
         self._input_streams = []
         self._lfcrs = []
@@ -97,17 +148,16 @@ class InputRedirection(object):
         # launch a daemon thread for each source
         for s, encoding in zip(self._input_streams, self._encodings):
             # launch a thread to allow nonblocking reads on both Windows and Unix
-            queue = Queue.Queue()
+            # bounded queue: the reader waits if the interpreter falls behind
+            queue = Queue.Queue(queue_length)
             thread = threading.Thread(target=self._process_input, args=(s, queue, encoding))
             thread.daemon = True
             thread.start()
             self._sources.append(queue)
-            # read as much as we can in advance
-            self._drain_source(queue)
 
     def __getstate__(self):
         """Pickler."""
-        pickle_dict = self.__dict__
+        pickle_dict = self.__dict__.copy()
         # don't pickle the queues
         del pickle_dict['_sources']
         del pickle_dict['_closed']
@@ -123,19 +173,41 @@ class InputRedirection(object):
 
     def _process_input(self, stream, queue, encoding):
         """Process input from stream."""
+        if encoding:
+            decoder = codecs.getincrementaldecoder(encoding)(b'replace')
+        # undecoded input held back until the rest of its line comes in
+        held = b''
         while True:
             # blocking read
-            instr = stream.readline()
+            instr = _read_block(stream)
             if not instr:
                 # input stream is closed, stop the thread
+                if encoding:
+                    held = decoder.decode(held, final=True)
+                elif held:
+                    held = self._codepage.str_to_unicode(held, preserve_control=True)
+                if held:
+                    queue.put(held)
                 queue.put(None)
                 return
             if encoding:
-                 queue.put(instr.decode(encoding, b'replace'))
+                # the incremental decoder keeps back incomplete sequences
+                queue.put(decoder.decode(instr))
             else:
-                 # raw input means it's already in the BASIC codepage
-                 # but the keyboard functions use unicode
-                 queue.put(self._codepage.str_to_unicode(instr, preserve_control=True))
+                # raw input means it's already in the BASIC codepage
+                # but the keyboard functions use unicode
+                # convert whole lines only, so that we don't split a DBCS sequence
+                instr = held + instr
+                end = max(instr.rfind(b'\r'), instr.rfind(b'\n')) + 1
+                if end:
+                    instr, held = instr[:end], instr[end:]
+                elif len(instr) < block_size:
+                    # no line break yet; don't hold on to overlong lines indefinitely
+                    instr, held = b'', instr
+                else:
+                    held = b''
+                if instr:
+                    queue.put(self._codepage.str_to_unicode(instr, preserve_control=True))
 
     def _drain_source(self, queue):
         """Read all available characters from a single source, or None if source closed."""
@@ -147,22 +219,41 @@ class InputRedirection(object):
 
     def is_closed(self):
         """All input streams have closed."""
-        return self._closed and sum(self._closed) == len(self._closed) and not self._buffer
+        return (self._closed and sum(self._closed) == len(self._closed) and
+                self._offset >= len(self._buffer))
 
     def read(self, n=0):
-        """Read input from sources."""
+        """Read up to n characters of input from sources; all available if n==0."""
         # fill buffer
         for i, source in enumerate(self._sources):
             if self._closed[i]:
                 continue
+            if n and len(self._buffer) - self._offset >= n:
+                break
             buf = self._drain_source(source)
             if buf is None:
                 self._closed[i] = True
-            else:
-                buf.replace('\r\n', '\r')
+            elif buf:
                 if self._lfcrs[i]:
-                    buf = buf.replace('\n', '\r')
-                self._buffer.append(buf)
-        # if n=0 this will read the whole buffer, which is default behaviour
-        self._buffer, chars = self._buffer[:-n], self._buffer[-n:]
-        return ''.join(chars)
+                    buf = buf.replace(u'\n', u'\r')
+                if self._offset:
+                    self._buffer = self._buffer[self._offset:]
+                    self._offset = 0
+                self._buffer += buf
+        if not n:
+            chars, self._buffer, self._offset = self._buffer[self._offset:], u'', 0
+        else:
+            chars = self._buffer[self._offset:self._offset+n]
+            self._offset += len(chars)
+        return chars
+
+
+def _read_block(stream):
+    """Read whatever input is available from a stream, up to a block; blocking."""
+    try:
+        fd = stream.fileno()
+    except (AttributeError, EnvironmentError, ValueError):
+        # not a real file, fall back to reading by line
+        return stream.readline()
+    # don't wait for a full block if the stream is a pipe or terminal
+    return os.read(fd, block_size)
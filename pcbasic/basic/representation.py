@@ -6,6 +6,7 @@ Convert between numbers and their string representations
 This file is released under the GNU GPL version 3 or later.
 """
 
+import re
 import string
 
 try:
@@ -103,6 +104,13 @@ def just_under(n_in):
 
 def get_digits(num, digits, remove_trailing=True):
     """Get the digits for an int."""
+    if digits > 0 and 0 <= num < 10L**digits:
+        digitstr = '%0*d' % (digits, num)
+        if remove_trailing:
+            # remove trailing zeros, but keep at least one digit
+            digitstr = digitstr.rstrip('0') or '0'
+        return digitstr
+    # outside the usual range, e.g. a leading "digit" of ten or more
     pow10 = 10L**(digits-1)
     digitstr = ''
     while pow10 >= 1:
@@ -199,48 +207,101 @@ def float_to_str(n_in, screen=False, write=False):
 
 def format_number(value, tokens, digits_before, decimals):
     """Format a number to a format string. For PRINT USING."""
-    # illegal function call if too many digits
-    if digits_before + decimals > 24:
-        raise error.RunError(error.IFC)
-    # extract sign, mantissa, exponent
-    value = unpack(value)
-    # dollar sign, decimal point
-    has_dollar, force_dot = '$' in tokens, '.' in tokens
-    # leading sign, if any
-    valstr, post_sign = '', ''
-    if tokens[0] == '+':
-        valstr += '-' if value.neg else '+'
-    elif tokens[-1] == '+':
-        post_sign = '-' if value.neg else '+'
-    elif tokens[-1] == '-':
-        post_sign = '-' if value.neg else ' '
-    else:
-        valstr += '-' if value.neg else ''
-        # reserve space for sign in scientific notation by taking away a digit position
-        if not has_dollar:
-            digits_before -= 1
-            if digits_before < 0:
-                digits_before = 0
-            # just one of those things GW does
-            #if force_dot and digits_before == 0 and decimals != 0:
-            #    valstr += '0'
-    # take absolute value
-    value.neg = False
-    # currency sign, if any
-    valstr += '$' if has_dollar else ''
-    # format to string
-    if '^' in tokens:
-        valstr += format_float_scientific(value, digits_before, decimals, force_dot)
-    else:
-        valstr += format_float_fixed(value, decimals, force_dot)
-    # trailing signs, if any
-    valstr += post_sign
-    if len(valstr) > len(tokens):
-        valstr = '%' + valstr
-    else:
+    return NumberFormat(tokens, digits_before, decimals).format(value)
+
+
+class NumberFormat(object):
+    """PRINT USING number field, analysed once for repeated use."""
+
+    def __init__(self, tokens, digits_before, decimals):
+        """Analyse the number field tokens."""
+        # illegal function call if too many digits; raised when used
+        self._too_long = digits_before + decimals > 24
+        self._length = len(tokens)
+        self._scientific = '^' in tokens
+        self._filler = '*' if '*' in tokens else ' '
+        # dollar sign, decimal point
+        self._dollar = '$' if '$' in tokens else ''
+        self._force_dot = '.' in tokens
+        # leading and trailing signs for negative and positive numbers
+        if tokens[0] == '+':
+            self._signs = ('-', '+'), ('', '')
+        elif tokens[-1] == '+':
+            self._signs = ('', ''), ('-', '+')
+        elif tokens[-1] == '-':
+            self._signs = ('', ''), ('-', ' ')
+        else:
+            self._signs = ('-', ''), ('', '')
+            # reserve space for sign in scientific notation by taking away a digit position
+            if not self._dollar:
+                digits_before = max(0, digits_before - 1)
+                # just one of those things GW does
+                #if force_dot and digits_before == 0 and decimals != 0:
+                #    valstr += '0'
+        self._digits_before = digits_before
+        self._decimals = decimals
+
+    def format(self, value):
+        """Format a packed number."""
+        if self._too_long:
+            raise error.RunError(error.IFC)
+        # extract sign, mantissa, exponent
+        value = unpack(value)
+        lead_signs, post_signs = self._signs
+        index = 0 if value.neg else 1
+        # take absolute value
+        value.neg = False
+        # format to string
+        if self._scientific:
+            digitstr = format_float_scientific(
+                    value, self._digits_before, self._decimals, self._force_dot)
+        else:
+            digitstr = format_float_fixed(value, self._decimals, self._force_dot)
+        valstr = lead_signs[index] + self._dollar + digitstr + post_signs[index]
+        if len(valstr) > self._length:
+            return '%' + valstr
         # filler
-        valstr = ('*' if '*' in tokens else ' ') * (len(tokens) - len(valstr)) + valstr
-    return valstr
+        return self._filler * (self._length - len(valstr)) + valstr
+
+
+# powers of ten by type, as calculated by pow_int
+_pow_ten = {Single: [Single.one], Double: [Double.one]}
+# powers of ten by type, as calculated by repeated multiplication from ten
+_mul_ten = {Single: [None, Single.ten], Double: [None, Double.ten]}
+# scientific notation range limits by type and number of digits
+_sci_limits = {Single: {}, Double: {}}
+
+def pow_ten(cls, exp10):
+    """Return the cached result of pow_int(ten, exp10) for exp10 >= 0."""
+    powers = _pow_ten[cls]
+    while len(powers) <= exp10:
+        powers.append(pow_int(cls.ten, len(powers)))
+    return powers[exp10]
+
+def mul_ten(cls, exp10):
+    """Return the cached result of multiplying ten by ten exp10-1 times, for exp10 >= 1."""
+    powers = _mul_ten[cls]
+    while len(powers) <= exp10:
+        # raises OverflowError at the top of the range, as uncached
+        powers.append(powers[-1].copy().imul10())
+    return powers[exp10]
+
+def scientific_limits(cls, work_digits):
+    """Return the cached range limits for scientific notation."""
+    try:
+        return _sci_limits[cls][work_digits]
+    except KeyError:
+        pass
+    if work_digits > 0:
+        # scientific representation
+        lim_bot = just_under(pow_ten(cls, work_digits-1))
+    else:
+        # special case when work_digits == 0, see also below
+        # setting to 0.1 results in incorrect rounding (why?)
+        lim_bot = cls.one.copy()
+    lim_top = lim_bot.copy().imul10()
+    _sci_limits[cls][work_digits] = lim_bot, lim_top
+    return lim_bot, lim_top
 
 def format_float_scientific(expr, digits_before, decimals, force_dot):
     """Put a float in scientific format."""
@@ -255,14 +316,7 @@ def format_float_scientific(expr, digits_before, decimals, force_dot):
             return '0D+00'  # matches GW output. odd, odd, odd
         digitstr, exp10 = '0'*(digits_before+decimals), 0
     else:
-        if work_digits > 0:
-            # scientific representation
-            lim_bot = just_under(pow_int(expr.ten, work_digits-1))
-        else:
-            # special case when work_digits == 0, see also below
-            # setting to 0.1 results in incorrect rounding (why?)
-            lim_bot = expr.one.copy()
-        lim_top = lim_bot.copy().imul10()
+        lim_bot, lim_top = scientific_limits(expr.__class__, work_digits)
         num, exp10 = expr.bring_to_range(lim_bot, lim_top)
         digitstr = get_digits(num, work_digits)
         if len(digitstr) < digits_before + decimals:
@@ -276,19 +330,20 @@ def format_float_scientific(expr, digits_before, decimals, force_dot):
 
 def format_float_fixed(expr, decimals, force_dot):
     """Put a float in fixed-point representation."""
-    unrounded = mul(expr, pow_int(expr.ten, decimals)) # expr * 10**decimals
+    cls = expr.__class__
+    unrounded = mul(expr, pow_ten(cls, decimals)) # expr * 10**decimals
     num = unrounded.copy().iround()
     # find exponent
     exp10 = 1
-    pow10 = pow_int(expr.ten, exp10) # pow10 = 10L**exp10
+    pow10 = mul_ten(cls, exp10) # pow10 = 10L**exp10
     while num.gt(pow10) or num.equals(pow10): # while pow10 <= num:
-        pow10.imul10() # pow10 *= 10
         exp10 += 1
+        pow10 = mul_ten(cls, exp10) # pow10 *= 10
     work_digits = exp10 + 1
     diff = 0
     if exp10 > expr.digits:
         diff = exp10 - expr.digits
-        num = div(unrounded, pow_int(expr.ten, diff)).iround()  # unrounded / 10**diff
+        num = div(unrounded, pow_ten(cls, diff)).iround()  # unrounded / 10**diff
         work_digits -= diff
     num = num.trunc_to_int()
     # argument work_digits-1 means we're getting work_digits==exp10+1-diff digits
@@ -299,77 +354,40 @@ def format_float_fixed(expr, decimals, force_dot):
 
 ##################################
 
+# decimal number syntax for str_to_float, after removing whitespace
+# mantissa digits may contain more than one point; !# end the number but not the exponent
+_float_re = re.compile('([+-]?)([0-9.]*)(?:([DdEe])([+-]?)([0-9]*)|([!#]))?')
+
 def str_to_float(s, allow_nonnum = True):
     """Return Float value for Python string."""
-    found_sign, found_point, found_exp = False, False, False
-    found_exp_sign, exp_neg, neg = False, False, False
-    exp10, exponent, mantissa, digits, zeros = 0, 0, 0, 0, 0
-    is_double, is_single = False, False
-    for c in s:
-        # ignore whitespace throughout (x = 1   234  56  .5  means x=123456.5 in gw!)
-        if c in number_whitespace:
-            continue
-        # determine sign
-        if (not found_sign):
-            found_sign = True
-            # number has started; if no sign encountered here, sign must be pos.
-            if c in '+-':
-                neg = (c == '-')
-                continue
-        # parse numbers and decimal points, until 'E' or 'D' is found
-        if (not found_exp):
-            if c >= '0' and c <= '9':
-                mantissa *= 10
-                mantissa += ord(c)-ord('0')
-                if found_point:
-                    exp10 -= 1
-                # keep track of precision digits
-                if mantissa != 0:
-                    digits += 1
-                    if found_point and c=='0':
-                        zeros += 1
-                    else:
-                        zeros=0
-                continue
-            elif c == '.':
-                found_point = True
-                continue
-            elif c.upper() in 'DE':
-                found_exp = True
-                is_double = (c.upper() == 'D')
-                continue
-            elif c == '!':
-                # makes it a single, even if more than eight digits specified
-                is_single = True
-                break
-            elif c == '#':
-                is_double = True
-                break
-            else:
-                if allow_nonnum:
-                    break
-                return None
-        # parse exponent
-        elif (not found_exp_sign):
-            # exponent has started; if no sign given, it must be pos.
-            found_exp_sign = True
-            if c in '+-':
-                exp_neg = (c == '-')
-                continue
-        if (c >= '0' and c <= '9'):
-            exponent *= 10
-            exponent += ord(c) - ord('0')
-            continue
-        else:
-            if allow_nonnum:
-                break
-            return None
-    if exp_neg:
-        exp10 -= exponent
+    # ignore whitespace throughout (x = 1   234  56  .5  means x=123456.5 in gw!)
+    s = s.translate(None, number_whitespace)
+    match = _float_re.match(s)
+    if not allow_nonnum and match.end() < len(s) and not match.group(6):
+        return None
+    sign, mantissa_str, exp_char, exp_sign, exp_str, type_char = match.groups()
+    neg = sign == '-'
+    point = mantissa_str.find('.')
+    if point < 0:
+        fraction = ''
     else:
-        exp10 += exponent
+        fraction = mantissa_str[point+1:].replace('.', '')
+        mantissa_str = mantissa_str.replace('.', '')
+    # each digit after the point moves the exponent, including leading zeros
+    exp10 = -len(fraction)
+    if exp_str:
+        if exp_sign == '-':
+            exp10 -= int(exp_str)
+        else:
+            exp10 += int(exp_str)
+    # keep track of precision digits: significant digits, not counting trailing zeros after the point
+    significant = mantissa_str.lstrip('0')
+    digits = len(significant)
+    zeros = min(len(significant) - len(significant.rstrip('0')), len(fraction))
+    mantissa = int(significant) if significant else 0
+    is_double = exp_char in ('D', 'd') or type_char == '#'
     # eight or more digits means double, unless single override
-    if digits - zeros > 7 and not is_single:
+    if digits - zeros > 7 and type_char != '!':
         is_double = True
     cls = Double if is_double else Single
     mbf = cls(neg, mantissa * 0x100, cls.bias).normalise()
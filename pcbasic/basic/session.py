@@ -7,6 +7,7 @@ This file is released under the GNU GPL version 3 or later.
 """
 import os
 import sys
+import time
 import logging
 import platform
 from contextlib import contextmanager
@@ -36,6 +37,24 @@ from . import sound
 from . import redirect
 from . import unicodepage
 from . import var
+from . import profiler
+
+
+class PreparedExpression(object):
+    """Expression tokenised and compiled once, for repeated evaluation."""
+
+    def __init__(self, code):
+        """Keep the tokenised code; it is compiled when first evaluated without error."""
+        self.code = code
+        self.ops = None
+
+
+class PreparedStatement(object):
+    """Statement tokenised once, for repeated execution."""
+
+    def __init__(self, tokens):
+        """Keep the tokenised statement."""
+        self.tokens = tokens
 
 
 class Session(object):
@@ -60,7 +79,7 @@ class Session(object):
             max_list_line=65535, allow_protect=False,
             allow_code_poke=False, max_memory=65534,
             max_reclen=128, max_files=3, reserved_memory=3429,
-            temp_dir=u''):
+            temp_dir=u'', profile=False, profile_callgrind=u''):
         """Initialise the interpreter session."""
         # use dummy queues if not provided
         if iface:
@@ -79,12 +98,18 @@ class Session(object):
         self.input_mode = False
         # syntax error prompt and EDIT
         self.edit_prompt = False
+        # periodic checkpoint callback and interval in seconds
+        self._checkpoint = None
+        self._checkpoint_interval = 0
+        self._checkpoint_time = 0
+        # don't update the cursor while executing a batch of statements
+        self._batch = False
         ######################################################################
         # prepare codepage
         self.codepage = unicodepage.Codepage(codepage, box_protect)
         # prepare I/O redirection
         self.input_redirection, self.output_redirection = redirect.get_redirection(
-                self.codepage, stdio, input_file, output_file, append)
+                self.codepage, stdio, input_file, output_file, append, device_params)
         # prepare tokeniser
         self.tokeniser = tokenise.Tokeniser(syntax, option_debug)
         # initialise the program
@@ -146,8 +171,9 @@ class Session(object):
         self.editor = editor.Editor(
                 self.screen, self.keyboard, self.sound,
                 self.output_redirection, self.devices.lpt1_file)
-        # set up the SHELL command
-        self.shell = shell.get_shell_manager(self.keyboard, self.screen, self.codepage, option_shell)
+        # the SHELL command is set up on first use
+        self._option_shell = option_shell
+        self._shell = None
         # initialise random number generator
         self.randomiser = rnd.RandomNumberGenerator()
         # initialise system clock
@@ -162,6 +188,11 @@ class Session(object):
         self.events.reset()
         self.parser = parser.Parser(self, syntax, pcjr_term, double)
         self.parser.set_pointer(False, 0)
+        # set up statement profiler
+        if profile or profile_callgrind:
+            self.profiler = profiler.Profiler(profile, profile_callgrind)
+        else:
+            self.profiler = None
         # set up debugger
         if option_debug:
             self.debugger = debug.Debugger(self)
@@ -183,11 +214,22 @@ class Session(object):
         pickle_dict['input_queue'] = signals.NullQueue()
         pickle_dict['video_queue'] = signals.NullQueue()
         pickle_dict['audio_queue'] = signals.NullQueue()
+        pickle_dict['_checkpoint'] = None
         return pickle_dict
 
     def __setstate__(self, pickle_dict):
         """Unpickle and resume the session."""
+        # snapshots from earlier versions have the shell manager set up
+        if 'shell' in pickle_dict:
+            pickle_dict['_shell'] = pickle_dict.pop('shell')
+        # and user functions without compiled code; these are parsed on every call
+        pickle_dict['user_functions'] = dict(
+                (name, fn + (None,) * (3 - len(fn)))
+                for name, fn in pickle_dict['user_functions'].iteritems())
+        # and no profiler
+        pickle_dict.setdefault('profiler', None)
         self.__dict__.update(pickle_dict)
+        self._batch = False
         self.keyboard._input_closed = False
         # suppress double prompt
         if not self._parse_mode:
@@ -204,6 +246,12 @@ class Session(object):
             self.sound.rebuild()
         return self
 
+    def set_checkpoint(self, callback, interval):
+        """Call callback(session) between statements at most every interval seconds."""
+        self._checkpoint = callback if interval > 0 else None
+        self._checkpoint_interval = interval
+        self._checkpoint_time = time.time() + interval
+
     def load_program(self, prog, rebuild_dict=True):
         """Load a program from native or BASIC file."""
         with self._handle_exceptions():
@@ -211,6 +259,8 @@ class Session(object):
                         prog, filetype='ABP',
                         mode='I') as progfile:
                 self.program.load(progfile, rebuild_dict=rebuild_dict)
+            if self.profiler and isinstance(prog, basestring):
+                self.profiler.program_name = prog
 
     def save_program(self, prog, filetype):
         """Save a program to native or BASIC file."""
@@ -220,16 +270,57 @@ class Session(object):
                         mode='O') as progfile:
                 self.program.save(progfile)
 
-    def execute(self, command):
-        """Execute a BASIC statement."""
+    def execute(self, command, variables=None):
+        """Execute a BASIC statement, or a prepared statement; set variables from a dict first."""
+        if isinstance(command, PreparedStatement):
+            with self._handle_exceptions():
+                self._set_variables(variables)
+                self._store_prepared(command)
+                self._loop()
+            return
         for cmd in command.splitlines():
             with self._handle_exceptions():
+                self._set_variables(variables)
+                variables = None
                 self._store_line(cmd)
                 self._loop()
 
-    def evaluate(self, expression):
-        """Evaluate a BASIC expression."""
+    def execute_batch(self, commands, variables=None):
+        """Execute statements without updating the cursor in between; stop at the first error."""
+        self._batch = True
+        try:
+            self._set_variables(variables)
+            for command in commands:
+                done = False
+                with self._handle_exceptions():
+                    if isinstance(command, PreparedStatement):
+                        self._store_prepared(command)
+                    else:
+                        self._store_line(command)
+                    self._loop()
+                    done = True
+                if not done:
+                    break
+        finally:
+            self._batch = False
+            self.screen.cursor.reset_visibility()
+
+    def prepare_statement(self, statement):
+        """Tokenise a BASIC statement for repeated execution."""
+        return PreparedStatement(self.tokeniser.tokenise_line(statement).getvalue())
+
+    def evaluate(self, expression, variables=None):
+        """Evaluate a BASIC expression, or a prepared expression; set variables from a dict first."""
         with self._handle_exceptions():
+            self._set_variables(variables)
+            if isinstance(expression, PreparedExpression):
+                if expression.ops is not None:
+                    value = self.parser.evaluate_compiled(expression.ops, expression.code)
+                else:
+                    ops = []
+                    value = self.parser.parse_expression(StringIO(expression.code), self, ops=ops)
+                    expression.ops = ops
+                return var.to_value(value, self.strings)
             # attach print token so tokeniser has a whole statement to work with
             tokens = self.tokeniser.tokenise_line('?' + expression)
             # skip : and print token and parse expression
@@ -237,22 +328,39 @@ class Session(object):
             return var.to_value(self.parser.parse_expression(tokens, self), self.strings)
         return None
 
+    def prepare_expression(self, expression):
+        """Tokenise a BASIC expression for repeated evaluation."""
+        tokens = self.tokeniser.tokenise_line('?' + expression)
+        # skip : and print token
+        tokens.read(2)
+        return PreparedExpression(tokens.read())
+
     def set_variable(self, name, value):
-        """Set a variable in memory."""
+        """Set a variable in memory; arrays can be set from nested lists or NumPy arrays."""
         if '(' in name:
-            name = name.split('(', 1)[0]
+            name = self.memory.complete_name(name.split('(', 1)[0].upper())
             var.build_array(value, name, self.strings, self.arrays)
         else:
+            name = self.memory.complete_name(name.upper())
             self.memory.set_variable(name, [], var.from_value(value, name[-1], self.strings))
 
-    def get_variable(self, name):
-        """Get a variable in memory."""
+    def get_variable(self, name, as_ndarray=False):
+        """Get a variable in memory; get numeric arrays as NumPy arrays if as_ndarray is set."""
         if '(' in name:
-            name = name.split('(', 1)[0]
+            name = self.memory.complete_name(name.split('(', 1)[0].upper())
+            if as_ndarray and name[-1] != '$':
+                return var.build_ndarray(name, self.arrays)
             return var.build_list(name, self.strings, self.arrays)
         else:
+            name = self.memory.complete_name(name.upper())
             return var.to_value(self.memory.get_variable(name, []), self.strings)
 
+    def _set_variables(self, variables):
+        """Set variables from a dict of names and values, if given."""
+        if variables:
+            for name, value in variables.iteritems():
+                self.set_variable(name, value)
+
     def interact(self):
         """Interactive interpreter session."""
         while True:
@@ -260,6 +368,8 @@ class Session(object):
                 with self._handle_exceptions():
                     self._loop()
                     self._show_prompt()
+                    if self._checkpoint and time.time() >= self._checkpoint_time:
+                        self._write_checkpoint()
                     # input loop, checks events
                     line = self.editor.wait_screenline(from_start=True)
                     self._prompt = not self._store_line(line)
@@ -271,19 +381,39 @@ class Session(object):
         # close files if we opened any
         self.files.close_all()
         self.devices.close()
+        # write out redirected output
+        self.output_redirection.flush()
+        if self.profiler:
+            self.profiler.close()
+
+    @property
+    def shell(self):
+        """Shell manager for the SHELL statement."""
+        if self._shell is None:
+            self._shell = shell.get_shell_manager(
+                    self.keyboard, self.screen, self.codepage, self._option_shell)
+        return self._shell
 
     ###########################################################################
     # implementation
 
     def _loop(self):
         """Run read-eval-print loop until control returns to user."""
-        self.screen.cursor.reset_visibility()
+        if not self._batch:
+            self.screen.cursor.reset_visibility()
         while True:
             last_parse = self._parse_mode
             if self._parse_mode:
+                if self._checkpoint and time.time() >= self._checkpoint_time:
+                    self._write_checkpoint()
                 try:
                     # may raise Break
-                    self.events.check_events()
+                    if self.profiler:
+                        start = time.time()
+                        self.events.check_events()
+                        self.profiler.add_event_check(time.time() - start)
+                    else:
+                        self.events.check_events()
                     # returns True if more statements to parse
                     if not self.parser.parse_statement():
                         self._parse_mode = False
@@ -303,11 +433,22 @@ class Session(object):
             if self._parse_mode != last_parse:
                 # move pointer to the start of direct line (for both on and off!)
                 self.parser.set_pointer(False, 0)
-                self.screen.cursor.reset_visibility()
+                if not self._batch:
+                    self.screen.cursor.reset_visibility()
             # return control to user
             if ((not self.auto_mode) and (not self._parse_mode)):
+                if self.profiler:
+                    self.profiler.stop_line()
                 break
 
+    def _write_checkpoint(self):
+        """Write a checkpoint of the session state."""
+        self._checkpoint_time = time.time() + self._checkpoint_interval
+        try:
+            self._checkpoint(self)
+        except Exception as e:
+            logging.error('Could not write checkpoint: %s', e)
+
     def _set_parse_mode(self, on):
         """Enter or exit parse mode."""
         self._parse_mode = on
@@ -317,7 +458,19 @@ class Session(object):
         """Store a program line or schedule a command line for execution."""
         if not line:
             return True
-        self.direct_line = self.tokeniser.tokenise_line(line)
+        return self._store_tokens(self.tokeniser.tokenise_line(line))
+
+    def _store_prepared(self, statement):
+        """Store or schedule a prepared statement."""
+        # the direct line must be a writable stream, for snapshots
+        tokens = StringIO()
+        tokens.write(statement.tokens)
+        tokens.seek(0)
+        return self._store_tokens(tokens)
+
+    def _store_tokens(self, tokens):
+        """Store a tokenised program line or schedule a tokenised command for execution."""
+        self.direct_line = tokens
         c = util.peek(self.direct_line)
         if c == '\0':
             # check for lines starting with numbers (6553 6) and empty lines
@@ -158,14 +158,10 @@ class Sound(object):
 
     def play(self, data_segment, mml_list):
         """Parse a list of Music Macro Language strings (PLAY statement)."""
-        gmls_list = []
-        for mml in mml_list:
-            gmls = StringIO()
-            # don't convert to uppercase as VARPTR$ elements are case sensitive
-            gmls.write(str(mml))
-            gmls.seek(0)
-            gmls_list.append(gmls)
-        ml_parser_list = [mlparser.MLParser(gmls, data_segment) for gmls in gmls_list]
+        ml_parser = mlparser.MLParser(None, data_segment)
+        mml_list = [str(mml) for mml in mml_list]
+        ops_list = [compile_play(mml) for mml in mml_list]
+        positions = [0, 0, 0]
         next_oct = 0
         voices = range(3)
         while True:
@@ -173,30 +169,25 @@ class Sound(object):
                 break
             for voice in voices:
                 vstate = self.play_state[voice]
-                gmls = gmls_list[voice]
-                ml_parser = ml_parser_list[voice]
-                c = util.skip_read(gmls, ml_parser.whitepace).upper()
-                if c == '':
+                ops, pos = ops_list[voice], positions[voice]
+                if pos >= len(ops):
                     voices.remove(voice)
                     continue
-                elif c == ';':
+                op = ops[pos]
+                positions[voice] = pos + 1
+                c = op[0]
+                if c == ';':
                     continue
                 elif c == 'X':
-                    # execute substring
-                    sub = ml_parser.parse_string()
-                    pos = gmls.tell()
-                    rest = gmls.read()
-                    gmls.truncate(pos)
-                    gmls.write(str(sub))
-                    gmls.write(rest)
-                    gmls.seek(pos)
+                    # execute substring: continue with the substring followed by the rest
+                    sub = ml_parser.get_string(op[1])
+                    mml_list[voice] = str(sub) + mml_list[voice][op[2]:]
+                    ops_list[voice] = compile_play(mml_list[voice])
+                    positions[voice] = 0
                 elif c == 'N':
-                    note = ml_parser.parse_number()
-                    util.range_check(0, 84, note)
+                    note = ml_parser.get_number(op[1])
                     dur = vstate.length
-                    c = util.skip(gmls, ml_parser.whitepace).upper()
-                    if c == '.':
-                        gmls.read(1)
+                    if op[2]:
                         dur *= 1.5
                     if note == 0:
                         self.play_sound(0, dur*vstate.tempo, vstate.speed,
@@ -206,17 +197,11 @@ class Sound(object):
                                          vstate.speed, volume=vstate.volume,
                                          voice=voice)
                 elif c == 'L':
-                    recip = ml_parser.parse_number()
-                    util.range_check(1, 64, recip)
-                    vstate.length = 1. / recip
+                    vstate.length = 1. / ml_parser.get_number(op[1])
                 elif c == 'T':
-                    recip = ml_parser.parse_number()
-                    util.range_check(32, 255, recip)
-                    vstate.tempo = 240. / recip
+                    vstate.tempo = 240. / ml_parser.get_number(op[1])
                 elif c == 'O':
-                    octave = ml_parser.parse_number()
-                    util.range_check(0, 6, octave)
-                    vstate.octave = octave
+                    vstate.octave = ml_parser.get_number(op[1])
                 elif c == '>':
                     vstate.octave += 1
                     if vstate.octave > 6:
@@ -225,68 +210,45 @@ class Sound(object):
                     vstate.octave -= 1
                     if vstate.octave < 0:
                         vstate.octave = 0
-                elif c in ('A', 'B', 'C', 'D', 'E', 'F', 'G', 'P'):
-                    note = c
+                elif c in ('A', 'P'):
+                    # note or pause with the last given length, the last nonzero length
+                    # and the number of dots after that
+                    _, note, given_length, nonzero_length, dots = op
+                    if given_length is not None:
+                        length = given_length
                     dur = vstate.length
-                    while True:
-                        c = util.skip(gmls, ml_parser.whitepace).upper()
-                        if not c:
-                            break
-                        elif c == '.':
-                            gmls.read(1)
-                            dur *= 1.5
-                        elif c in string.digits:
-                            numstr = ''
-                            while c and c in string.digits:
-                                gmls.read(1)
-                                numstr += c
-                                c = util.skip(gmls, ml_parser.whitepace)
-                            # NOT ml_parse_number, only literals allowed here!
-                            length = int(numstr)
-                            util.range_check(0, 64, length)
-                            if length > 0:
-                                dur = 1. / float(length)
-                        elif c in ('#', '+'):
-                            gmls.read(1)
-                            note += '#'
-                        elif c == '-':
-                            gmls.read(1)
-                            note += '-'
-                        else:
-                            break
-                    if note == 'P':
+                    if nonzero_length:
+                        dur = 1. / float(nonzero_length)
+                    for _ in range(dots):
+                        dur *= 1.5
+                    if c == 'P':
                         # don't do anything for length 0
                         if length > 0:
                             self.play_sound(0, dur * vstate.tempo, vstate.speed,
                                             volume=vstate.volume, voice=voice)
                     else:
                         # use default length for length 0
-                        try:
-                            self.play_sound(
-                                note_freq[(vstate.octave+next_oct)*12 + notes[note]],
-                                dur * vstate.tempo, vstate.speed,
-                                volume=vstate.volume, voice=voice)
-                        except KeyError:
-                            raise error.RunError(error.IFC)
+                        self.play_sound(
+                            note_freq[(vstate.octave+next_oct)*12 + note],
+                            dur * vstate.tempo, vstate.speed,
+                            volume=vstate.volume, voice=voice)
                     next_oct = 0
                 elif c == 'M':
-                    c = util.skip_read(gmls, ml_parser.whitepace).upper()
-                    if c == 'N':
-                        vstate.speed = 7./8.
-                    elif c == 'L':
-                        vstate.speed = 1.
-                    elif c == 'S':
-                        vstate.speed = 3./4.
-                    elif c == 'F':
+                    if op[1] == 'F':
                         self.foreground = True
-                    elif c == 'B':
+                    elif op[1] == 'B':
                         self.foreground = False
                     else:
-                        raise error.RunError(error.IFC)
+                        vstate.speed = op[1]
                 elif c == 'V' and (self.capabilities == 'tandy' or
                                     (self.capabilities == 'pcjr' and self.sound_on)):
+                    if op[1] is None:
+                        ml_parser.raise_error(*op[2:])
                     vstate.volume = min(15,
-                                    max(0, ml_parser.parse_number()))
+                                    max(0, ml_parser.get_number(op[1])))
+                elif c == 'error':
+                    # parse error, after resolving any variables read before it
+                    ml_parser.raise_error(*op[1:])
                 else:
                     raise error.RunError(error.IFC)
         max_time = max(q.expiry() for q in self.voice_queue[:3])
@@ -298,6 +260,104 @@ class Sound(object):
             self.wait_all_music()
 
 
+# compiled PLAY strings
+_play_cache = {}
+
+def compile_play(mml):
+    """Compile a Music Macro Language string into a list of operations."""
+    try:
+        return _play_cache[mml]
+    except KeyError:
+        pass
+    # don't convert to uppercase as VARPTR$ elements are case sensitive
+    gmls = StringIO(mml)
+    ml_parser = mlparser.MLParser(gmls, None)
+    ops = []
+    try:
+        while True:
+            ml_parser.args = []
+            c = util.skip_read(gmls, ml_parser.whitepace).upper()
+            if c == '':
+                break
+            elif c in (';', '>', '<'):
+                ops.append((c,))
+            elif c == 'X':
+                # keep the position of the rest of the string, to follow the substring
+                sub = ml_parser.compile_string()
+                ops.append((c, sub, gmls.tell()))
+            elif c == 'N':
+                note = ml_parser.compile_number(lower=0, upper=84)
+                dotted = util.skip(gmls, ml_parser.whitepace).upper() == '.'
+                if dotted:
+                    gmls.read(1)
+                ops.append((c, note, dotted))
+            elif c == 'L':
+                ops.append((c, ml_parser.compile_number(lower=1, upper=64)))
+            elif c == 'T':
+                ops.append((c, ml_parser.compile_number(lower=32, upper=255)))
+            elif c == 'O':
+                ops.append((c, ml_parser.compile_number(lower=0, upper=6)))
+            elif c in ('A', 'B', 'C', 'D', 'E', 'F', 'G', 'P'):
+                note = c
+                length, nonzero_length, dots = None, None, 0
+                while True:
+                    c = util.skip(gmls, ml_parser.whitepace).upper()
+                    if not c:
+                        break
+                    elif c == '.':
+                        gmls.read(1)
+                        dots += 1
+                    elif c in string.digits:
+                        numstr = ''
+                        while c and c in string.digits:
+                            gmls.read(1)
+                            numstr += c
+                            c = util.skip(gmls, ml_parser.whitepace)
+                        # NOT ml_parse_number, only literals allowed here!
+                        length = int(numstr)
+                        util.range_check(0, 64, length)
+                        # a nonzero length replaces the duration so far
+                        if length > 0:
+                            nonzero_length, dots = length, 0
+                    elif c in ('#', '+'):
+                        gmls.read(1)
+                        note += '#'
+                    elif c == '-':
+                        gmls.read(1)
+                        note += '-'
+                    else:
+                        break
+                if note == 'P':
+                    ops.append(('P', None, length, nonzero_length, dots))
+                else:
+                    try:
+                        ops.append(('A', notes[note], length, nonzero_length, dots))
+                    except KeyError:
+                        raise error.RunError(error.IFC)
+            elif c == 'M':
+                c = util.skip_read(gmls, ml_parser.whitepace).upper()
+                try:
+                    ops.append(('M', {'N': 7./8., 'L': 1., 'S': 3./4., 'F': 'F', 'B': 'B'}[c]))
+                except KeyError:
+                    raise error.RunError(error.IFC)
+            elif c == 'V':
+                # only available on Tandy and PCjr; checked when run, before any parse error
+                try:
+                    ops.append((c, ml_parser.compile_number()))
+                except error.RunError as e:
+                    ops.append((c, None, ml_parser.args, e.err))
+                    break
+            else:
+                raise error.RunError(error.IFC)
+    except error.RunError as e:
+        # raise the error when execution gets here
+        ops.append(('error', ml_parser.args, e.err))
+    if len(_play_cache) >= mlparser.cache_size:
+        _play_cache.clear()
+    _play_cache[mml] = ops
+    return ops
+
+
 class TimedQueue(object):
     """Queue with expiring elements."""
 
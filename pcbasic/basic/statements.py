@@ -2087,7 +2087,8 @@ class Statements(object):
             # GW doesn't allow DEF FN in direct mode, neither do we
             # (for no good reason, works fine)
             raise error.RunError(error.ILLEGAL_DIRECT)
-        self.session.user_functions[fnname] = fnvars, fncode
+        # the code is compiled on the first call that evaluates it without error
+        self.session.user_functions[fnname] = fnvars, fncode, None
         # update memory model
         # allocate function pointer
         pointer = vartypes.integer_to_bytes(vartypes.int_to_integer_unsigned(pointer_loc))
@@ -2444,43 +2445,34 @@ class Statements(object):
         if format_expr == '':
             raise error.RunError(error.IFC)
         util.require_read(ins, (';',))
-        fors = StringIO(format_expr)
-        semicolon, format_chars = False, False
+        template = print_and_input.compile_using_format(format_expr)
+        semicolon = False
         while True:
-            data_ends = util.skip_white(ins) in tk.end_statement
-            c = util.peek(fors)
-            if c == '':
-                if not format_chars:
-                    # there were no format chars in the string, illegal fn call (avoids infinite loop)
-                    raise error.RunError(error.IFC)
-                if data_ends:
-                    break
-                # loop the format string if more variables to come
-                fors.seek(0)
-            elif c == '_':
-                # escape char; write next char in fors or _ if this is the last char
-                output.write(fors.read(2)[-1])
-            else:
-                string_field = print_and_input.get_string_tokens(fors)
+            for literal, string_field, number_format in template:
+                # write literals char by char, as line wrapping is decided per write
+                for c in literal:
+                    output.write(c)
                 if string_field:
-                    if not data_ends:
+                    if util.skip_white(ins) not in tk.end_statement:
                         with self.session.strings:
                             s = self.session.strings.copy(vartypes.pass_string(self.parser.parse_expression(ins, self.session)))
                         if string_field == '&':
                             output.write(s)
                         else:
                             output.write(s[:len(string_field)] + ' '*(len(string_field)-len(s)))
+                elif number_format:
+                    if util.skip_white(ins) not in tk.end_statement:
+                        num = vartypes.pass_float(self.parser.parse_expression(ins, self.session))
+                        output.write(number_format.format(num))
                 else:
-                    number_field, digits_before, decimals = print_and_input.get_number_tokens(fors)
-                    if number_field:
-                        if not data_ends:
-                            num = vartypes.pass_float(self.parser.parse_expression(ins, self.session))
-                            output.write(representation.format_number(num, number_field, digits_before, decimals))
-                    else:
-                        output.write(fors.read(1))
-                if string_field or number_field:
-                    format_chars = True
-                    semicolon = util.skip_white_read_if(ins, (';', ','))
+                    continue
+                semicolon = util.skip_white_read_if(ins, (';', ','))
+            if len(template) == 1:
+                # there were no format chars in the string, illegal fn call (avoids infinite loop)
+                raise error.RunError(error.IFC)
+            if util.skip_white(ins) in tk.end_statement:
+                break
+            # loop the format string if more variables to come
         if not semicolon:
             output.write_line()
         util.require(ins, tk.end_statement)
@@ -7,6 +7,7 @@ This file is released under the GNU GPL version 3 or later.
 """
 
 import string
+import re
 
 try:
     from cStringIO import StringIO
@@ -19,18 +20,16 @@ from . import util
 from . import vartypes
 
 
-def ascii_read_to(ins, findrange):
-    """Read until a character from a given range is found."""
-    out = ''
-    while True:
-        d = ins.read(1)
-        if d == '':
-            break
-        if d in findrange:
-            break
-        out += d
-    ins.seek(-len(d),1)
-    return out
+# runs of characters that detokenise to themselves, outside and inside literals and comments
+_plain_re = re.compile('[\x20\x21\x23-\x7e]*')
+_literal_re = re.compile('[^%s]*' % re.escape(''.join(('\0', '"') + tk.number + tk.linenum)))
+
+# runs of characters that tokenise to themselves
+_whitespace_re = re.compile('[ \t\n]*')
+_name_re = re.compile('[%s]*' % re.escape(tk.name_chars))
+_rem_re = re.compile('[^\r\0]*')
+_literal_text_re = re.compile('[^\r\0"]*')
+_data_re = re.compile('[^\r\0:"]*')
 
 
 class Tokeniser(object):
@@ -59,6 +58,7 @@ class Tokeniser(object):
             self._token_to_keyword[tk.NOISE] = tk.KW_NOISE
             self._token_to_keyword[tk.TERM] = tk.KW_TERM
         self._keyword_to_token = dict((reversed(item) for item in self._token_to_keyword.items()))
+        self._max_keyword_length = max(len(word) for word in self._keyword_to_token)
 
     #################################################################
     # Detokenise functions
@@ -113,6 +113,13 @@ class Tokeniser(object):
             elif comment or litstring or ('\x20' <= s <= '\x7E'):
                 # honest ASCII
                 output += s
+                # pass on any further plain text in one go, if we don't need to track its position
+                rest = ins.read(255)
+                run = (_literal_re if comment or litstring else _plain_re).match(rest).end()
+                if not (textpos or (bytepos is not None and ins.tell() - len(rest) + run < bytepos)):
+                    run = 0
+                output += rest[:run]
+                ins.seek(run - len(rest), 1)
             elif s == '\x0A':
                 # LF becomes LF CR
                 output += '\x0A\x0D'
@@ -194,6 +201,8 @@ class Tokeniser(object):
 
     def tokenise_line(self, line):
         """Convert an ascii program line to tokenised form."""
+        # text file devices such as CAS1: and KYBD: return a bytearray
+        line = str(line)
         ins = StringIO(line)
         outs = StringIO()
         # skip whitespace at start of line
@@ -203,6 +212,8 @@ class Tokeniser(object):
             return outs
         # read the line number
         self._tokenise_line_number(ins, outs)
+        # from here on, work on the line itself and sync the stream only where we need it
+        pos = ins.tell()
         # expect line number
         allow_jumpnum = False
         # expect number (6553 6 -> the 6 is encoded as \x17)
@@ -212,25 +223,26 @@ class Tokeniser(object):
         # parse through elements of line
         while True:
             # peek next character
-            c = util.peek(ins)
+            c = line[pos:pos+1]
             # anything after NUL is ignored till EOL
             if c == '\0':
-                ins.read(1)
-                ascii_read_to(ins, ('', '\r'))
                 break
             # end of line
             elif c in ('', '\r'):
                 break
             # handle whitespace
             elif c in self._ascii_whitespace:
-                ins.read(1)
-                outs.write(c)
+                end = _whitespace_re.match(line, pos).end()
+                outs.write(line[pos:end])
+                pos = end
             # handle string literals
-            elif util.peek(ins) == '"':
-                self._tokenise_literal(ins, outs)
+            elif c == '"':
+                pos = self._tokenise_literal_at(line, pos, outs)
             # handle jump numbers
             elif allow_number and allow_jumpnum and c in string.digits + '.':
+                ins.seek(pos)
                 self._tokenise_jump_number(ins, outs)
+                pos = ins.tell()
             # handle numbers
             # numbers following var names with no operator or token in between
             # should not be parsed, eg OPTION BASE 1
@@ -238,10 +250,12 @@ class Tokeniser(object):
             # number starting with . or & are always parsed
             elif c in ('&', '.') or (allow_number and
                                       not allow_jumpnum and c in string.digits):
+                ins.seek(pos)
                 representation.tokenise_number(ins, outs)
+                pos = ins.tell()
             # operator keywords ('+', '-', '=', '/', '\\', '^', '*', '<', '>'):
             elif c in self._ascii_operators:
-                ins.read(1)
+                pos += 1
                 # operators don't affect line number mode - can do line number
                 # arithmetic and RENUM will do the strangest things
                 # this allows for 'LIST 100-200' etc.
@@ -249,23 +263,23 @@ class Tokeniser(object):
                 allow_number = True
             # special case ' -> :REM'
             elif c == "'":
-                ins.read(1)
+                pos += 1
                 outs.write(':' + tk.REM + tk.O_REM)
-                self._tokenise_rem(ins, outs)
+                pos = self._tokenise_rem_at(line, pos, outs)
             # special case ? -> PRINT
             elif c == '?':
-                ins.read(1)
+                pos += 1
                 outs.write(tk.PRINT)
                 allow_number = True
             # keywords & variable names
             elif c in string.ascii_letters:
-                word = self._tokenise_word(ins, outs)
+                word, pos = self._tokenise_word_at(line, pos, ins, outs)
                 # handle non-parsing modes
                 if (word in ('REM', "'") or
                             (word == 'DEBUG' and word in self._keyword_to_token)):
-                    self._tokenise_rem(ins, outs)
+                    pos = self._tokenise_rem_at(line, pos, outs)
                 elif word == "DATA":
-                    self._tokenise_data(ins, outs)
+                    pos = self._tokenise_data_at(line, pos, outs)
                 else:
                     allow_jumpnum = (word in self._linenum_words)
                     # numbers can follow tokenised keywords
@@ -274,7 +288,7 @@ class Tokeniser(object):
                     if word in ('SPC(', 'TAB('):
                         spc_or_tab = True
             else:
-                ins.read(1)
+                pos += 1
                 if c in (',', '#', ';'):
                     # can separate numbers as well as jumpnums
                     allow_number = True
@@ -291,26 +305,71 @@ class Tokeniser(object):
         outs.seek(0)
         return outs
 
-    def _tokenise_rem(self, ins, outs):
-        """Pass anything after REM as is till EOL."""
-        outs.write(ascii_read_to(ins, ('', '\r', '\0')))
+    def _tokenise_rem_at(self, line, pos, outs):
+        """Pass anything after REM as is till EOL; return new position."""
+        end = _rem_re.match(line, pos).end()
+        outs.write(line[pos:end])
+        return end
 
-    def _tokenise_data(self, ins, outs):
-        """Pass DATA as is, till end of statement, except for literals."""
+    def _tokenise_data_at(self, line, pos, outs):
+        """Pass DATA as is, till end of statement, except for literals; return new position."""
         while True:
-            outs.write(ascii_read_to(ins, ('', '\r', '\0', ':', '"')))
-            if util.peek(ins) == '"':
+            end = _data_re.match(line, pos).end()
+            outs.write(line[pos:end])
+            pos = end
+            if line[pos:pos+1] == '"':
                 # string literal in DATA
-                self._tokenise_literal(ins, outs)
+                pos = self._tokenise_literal_at(line, pos, outs)
             else:
-                break
+                return pos
+
+    def _tokenise_literal_at(self, line, pos, outs):
+        """Pass a string literal; return new position."""
+        end = _literal_text_re.match(line, pos+1).end()
+        if line[end:end+1] == '"':
+            end += 1
+        outs.write(line[pos:end])
+        return end
 
-    def _tokenise_literal(self, ins, outs):
-        """Pass a string literal."""
-        outs.write(ins.read(1))
-        outs.write(ascii_read_to(ins, ('', '\r', '\0', '"') ))
-        if util.peek(ins)=='"':
-            outs.write(ins.read(1))
+    def _tokenise_word_at(self, line, pos, ins, outs):
+        """Convert a keyword or name to tokenised form; return the word and new position."""
+        end = _name_re.match(line, pos).end()
+        run = line[pos:end].upper()
+        nxt = line[end:end+1]
+        if run[:2] != 'GO':
+            # a keyword may be followed by another name char only if it is FN or USR
+            for length in xrange(1, min(len(run), self._max_keyword_length) + 1):
+                word = run[:length]
+                if word in self._keyword_to_token and (length == len(run) or word in ('FN', 'USR')):
+                    self._write_keyword(word, outs)
+                    return word, pos + length
+            if not nxt:
+                outs.write(run)
+                return run, end
+            # keywords ending in a non-name char, such as MID$ and SPC(
+            word = run + nxt.upper()
+            if word not in self._keyword_to_token:
+                outs.write(run)
+                return run, end
+            elif word in ('SPC(', 'TAB(') or not line[end+1:end+2] or line[end+1] not in tk.name_chars:
+                self._write_keyword(word, outs)
+                return word, end + 1
+        # special cases such as GO TO and MID$A; let the stream tokeniser handle these
+        ins.seek(pos)
+        word = self._tokenise_word(ins, outs)
+        return word, ins.tell()
+
+    def _write_keyword(self, word, outs):
+        """Write the token for a keyword."""
+        token = self._keyword_to_token[word]
+        # handle special case ELSE -> :ELSE
+        if word == 'ELSE':
+            outs.write(':' + token)
+        # handle special case WHILE -> WHILE+
+        elif word == 'WHILE':
+            outs.write(token + tk.O_PLUS)
+        else:
+            outs.write(token)
 
     def _tokenise_line_number(self, ins, outs):
         """Convert an ascii line number to tokenised start-of-line."""
@@ -406,15 +465,7 @@ class Tokeniser(object):
                     nxt = util.peek(ins)
                     if nxt and nxt in tk.name_chars:
                         continue
-                token = self._keyword_to_token[word]
-                # handle special case ELSE -> :ELSE
-                if word == 'ELSE':
-                    outs.write(':' + token)
-                # handle special case WHILE -> WHILE+
-                elif word == 'WHILE':
-                    outs.write(token + tk.O_PLUS)
-                else:
-                    outs.write(token)
+                self._write_keyword(word, outs)
                 break
             # allowed names: letter + (letters, numbers, .)
             elif not c:
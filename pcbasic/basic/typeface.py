@@ -17,44 +17,76 @@ except ImportError:
 from . import font
 
 
+# parsed glyphs, shared by all sessions in this process
+_font_cache = {}
+
 def load_fonts(font_families, heights_needed, unicode_needed, substitutes, warn=False):
-    """Load font typefaces."""
-    fonts = {}
+    """Create font typefaces; their glyphs are parsed on first use."""
+    key = (tuple(font_families), frozenset(unicode_needed), frozenset(substitutes.iteritems()))
+    heights_needed = set(heights_needed)
     if 9 in heights_needed:
         # 9-pixel font is same as 8-pixel font
         heights_needed -= set([9])
         heights_needed |= set([8])
-    # load fonts, height-16 first
-    for height in reversed(sorted(heights_needed)):
-        # load a Unifont .hex font and take the codepage subset
-        fonts[height] = Font(height).load_hex(
-                font.read_files(font_families, height),
-                unicode_needed, substitutes, warn=warn)
-        # fix missing code points font based on 16-line font
-        try:
-            font_16 = fonts[16]
-        except KeyError:
-            font_16 = Font(16).load_hex(
-                font.read_files(font_families, 16),
-                unicode_needed, substitutes, warn=False)
-        if font_16:
-            fonts[height].fix_missing(unicode_needed, font_16)
+    fonts = dict((height, Font(height, loader=(key, warn))) for height in heights_needed)
     if 8 in fonts:
         fonts[9] = fonts[8]
     return fonts
 
+def _get_fontdict(key, height, warn):
+    """Parse a font typeface, once for each combination of fonts, codepage and height."""
+    try:
+        return _font_cache[key, height]
+    except KeyError:
+        pass
+    font_families, unicode_needed, substitutes = key
+    # load a Unifont .hex font and take the codepage subset
+    face = Font(height).load_hex(
+            font.read_files(font_families, height),
+            unicode_needed, dict(substitutes), warn=warn)
+    # fix missing code points font based on 16-line font
+    if height != 16:
+        face.fix_missing(unicode_needed, Font(16, _get_fontdict(key, 16, False)))
+    _font_cache[key, height] = face.fontdict
+    return face.fontdict
+
 
 class Font(object):
     """Single-height bitfont."""
 
-    def __init__(self, height, fontdict={}):
+    def __init__(self, height, fontdict={}, loader=None):
         """Initialise the font."""
         self.height = height
-        self.fontdict = fontdict
+        self._fontdict = fontdict
+        # font cache key and warning flag, if glyphs are yet to be parsed
+        self._loader = loader
+
+    def __setstate__(self, pickle_dict):
+        """Unpickle the font."""
+        # snapshots from earlier versions have the glyphs in fontdict
+        if 'fontdict' in pickle_dict:
+            pickle_dict['_fontdict'] = pickle_dict.pop('fontdict')
+            pickle_dict['_loader'] = None
+        self.__dict__.update(pickle_dict)
+
+    @property
+    def fontdict(self):
+        """Glyphs by unicode character."""
+        if self._loader is not None:
+            # copy the glyphs, as they can be changed through POKE
+            self._fontdict = dict(_get_fontdict(self._loader[0], self.height, self._loader[1]))
+            self._loader = None
+        return self._fontdict
+
+    @fontdict.setter
+    def fontdict(self, fontdict):
+        """Replace the glyphs."""
+        self._fontdict = fontdict
+        self._loader = None
 
     def load_hex(self, hex_resources, unicode_needed, substitutes, warn=True):
         """Load a set of overlaying unifont .hex files."""
-        self.fontdict = {}
+        fontdict = self.fontdict = {}
         all_needed = unicode_needed | set(substitutes)
         for hexres in reversed(hex_resources):
             if hexres is None:
@@ -77,7 +109,7 @@ class Font(object):
                     if c not in all_needed:
                         continue
                     # skip chars we already have
-                    if (c in self.fontdict):
+                    if (c in fontdict):
                         continue
                     # string must be 32-byte or 16-byte; cut to required font size
                     if len(fonthex) < 32:
@@ -86,7 +118,7 @@ class Font(object):
                         fonthex = fonthex[:2*self.height]
                     else:
                         fonthex = fonthex[:4*self.height]
-                    self.fontdict[c] = fonthex.decode('hex')
+                    fontdict[c] = fonthex.decode('hex')
                 except Exception as e:
                     logging.warning('Could not parse line in font file: %s', repr(line))
         # substitute code points
@@ -8,6 +8,8 @@ This file is released under the GNU GPL version 3 or later.
 
 import unicodedata
 import logging
+import codecs
+import re
 import os
 
 from . import codepage
@@ -21,11 +23,15 @@ printable_ascii = map(chr, range(0x20, 0x7F))
 # on the terminal, these values are not shown as special graphic chars but as their normal effect
 # BEL, TAB, LF, HOME, CLS, CR, RIGHT, LEFT, UP, DOWN  (and not BACKSPACE)
 control = ('\x07', '\x09', '\x0a', '\x0b', '\x0c', '\x0d', '\x1c', '\x1d', '\x1e', '\x1f')
+control_re = re.compile('[%s]' % re.escape(''.join(control)))
 
 
 ###############################################################################
 # codepages
 
+# parsed codepage tables, shared by all sessions in this process
+_tables = {}
+
 
 class Codepage(object):
     """Codepage tables."""
@@ -43,6 +49,12 @@ class Codepage(object):
 
     def load(self, codepage_name):
         """Load codepage to Unicode table."""
+        # the tables are not changed after loading, so they can be shared
+        try:
+            self.__dict__.update(_tables[codepage_name])
+            return codepage_name
+        except KeyError:
+            pass
         # lead and trail bytes
         self.lead = set()
         self.trail = set()
@@ -93,6 +105,15 @@ class Codepage(object):
         self.unicode_to_cp = dict((reversed(item) for item in self.cp_to_unicode.items()))
         if self.dbcs_num_chars > 0:
             self.dbcs = True
+        # single-byte decoding tables, without and with preserved control chars
+        self.sbcs_tables = [
+                _decoding_table(self.cp_to_unicode, preserve_control) for preserve_control in (False, True)]
+        # matches the start of any double-byte sequence
+        self.lead_re = re.compile('[%s]' % re.escape(''.join(sorted(self.lead)))) if self.lead else None
+        _tables[codepage_name] = dict(
+                (name, getattr(self, name)) for name in (
+                    'dbcs', 'substitutes', 'lead', 'trail', 'box_left', 'box_right',
+                    'cp_to_unicode', 'unicode_to_cp', 'dbcs_num_chars', 'sbcs_tables', 'lead_re'))
         return codepage_name
 
     def connects(self, c, d, bset):
@@ -131,6 +152,19 @@ class Codepage(object):
         return Converter(self, preserve_control, box_protect)
 
 
+def _decoding_table(cp_to_unicode, preserve_control):
+    """Build a single-byte decoding table for codecs.charmap_decode."""
+    table = [cp_to_unicode[chr(c)] for c in range(256)]
+    if preserve_control:
+        for c in control:
+            table[ord(c)] = c.decode('ascii')
+    if all(len(uc) == 1 for uc in table):
+        # a string table is much faster than a dict
+        return u''.join(table)
+    # some bytes map to grapheme clusters
+    return dict(enumerate(table))
+
+
 class CodecStream(object):
     """Converter stream wrapper."""
 
@@ -146,6 +180,10 @@ class CodecStream(object):
         self._stream.write(self._uniconv.to_unicode(bytes(s)).encode(
                     self._encoding, b'replace'))
 
+    def flush(self):
+        """Flush the underlying stream."""
+        self._stream.flush()
+
 
 ########################################
 # box drawing protection
@@ -209,24 +247,37 @@ class Converter(object):
 
     def to_unicode(self, s):
         """Process codepage string, returning unicode string when ready."""
+        table = self.cp.sbcs_tables[bool(self.preserve_control)]
         if not self.dbcs:
             # stateless if not dbcs
-            return u''.join([ (c.decode('ascii', errors='ignore')
-                                if (self.preserve_control and c in control)
-                                else self.cp.to_unicode(c))
-                            for c in s ])
+            return codecs.charmap_decode(s, 'strict', table)[0]
         else:
-            out = u''
+            out = []
             # remove any naked lead-byte first
             if self.buf:
-                out += u'\b'*len(self.buf)
+                out.append(u'\b'*len(self.buf))
             # process the string
-            for c in s:
-                out += self.process(c)
+            i, length = 0, len(s)
+            while i < length:
+                if not self.buf:
+                    # convert the run up to the next lead byte in one go
+                    # single-byte chars don't change the state, except for control chars
+                    match = self.cp.lead_re.search(s, i)
+                    end = match.start() if match else length
+                    if end > i:
+                        run = s[i:end]
+                        out.append(codecs.charmap_decode(run, 'strict', table)[0])
+                        if self.preserve_control and self.box_protect and control_re.search(run):
+                            self.bset = -1
+                            self.last = ''
+                        i = end
+                        continue
+                out.append(self.process(s[i]))
+                i += 1
             # any naked lead-byte or boxable dbcs left will be printed (but don't flush buffers!)
             if self.buf:
-                out += self.cp.to_unicode(self.buf)
-            return out
+                out.append(self.cp.to_unicode(self.buf))
+            return u''.join(out)
 
     def flush(self, num=None):
         """Empty buffer and return contents."""
@@ -7,8 +7,14 @@ This file is released under the GNU GPL version 3 or later.
 """
 
 import logging
+import bisect
 from operator import itemgetter
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from . import error
 from . import vartypes
 from . import fp
@@ -30,9 +36,22 @@ class StringSpace(object):
     def clear(self):
         """Empty string space."""
         self.strings.clear()
+        # sorted addresses of the stored strings
+        self._addresses = []
+        # substring views: address -> key of the string they are in, offset in that string
+        self._views = {}
         # strings are placed at the top of string memory, just below the stack
         self.current = self.memory.stack_start()
 
+    def __setstate__(self, pickle_dict):
+        """Unpickle."""
+        self.__dict__.update(pickle_dict)
+        # snapshots from earlier versions have no substring views or address index
+        if '_views' not in pickle_dict:
+            self._views = {}
+        if '_addresses' not in pickle_dict:
+            self._addresses = sorted(self.address(key) for key in self.strings)
+
     def _retrieve(self, key):
         """Retrieve a string by its 3-byte sequence. 2-byte keys allowed, but will return longer string for empty string."""
         key = str(key)
@@ -44,18 +63,24 @@ class StringSpace(object):
         else:
             raise KeyError('String key %s has wrong length.' % repr(key))
 
-    def _view(self, basic_string):
-        """Return a writeable view of a string from its string pointer."""
+    def hold(self, basic_string):
+        """Return a reference to a string, for use with substring and find.
+        The reference stays valid if strings are moved by garbage collection."""
         length = vartypes.string_length(basic_string)
         # empty string pointers can point anywhere
         if length == 0:
-            return bytearray()
+            return None, bytearray(), 0, 0
         address = vartypes.string_address(basic_string)
         # address >= self.memory.var_start(): if we no longer double-store code strings in string space object
         if address >= self.memory.code_start:
             # string stored in string space
-            sequence = vartypes.string_to_bytes(basic_string)
-            return memoryview(self._retrieve(sequence))
+            key = str(vartypes.string_to_bytes(basic_string)[-2:])
+            try:
+                return key, self.strings[key], 0, length
+            except KeyError:
+                # substring view
+                key, offset = self._views[key]
+                return key, self.strings[key], offset, length
         else:
             # string stored in field buffers
             # find the file we're in
@@ -64,13 +89,57 @@ class StringSpace(object):
             offset = start % self.memory.field_mem_offset
             if (number not in self.memory.fields) or (start < 0):
                 raise KeyError('Invalid string pointer')
-            # memoryview slice continues to point to buffer, does not copy
-            return memoryview(self.memory.fields[number].buffer)[offset:offset+length]
+            return None, self.memory.fields[number].buffer, offset, length
+
+    def _view(self, basic_string):
+        """Return a writeable view of a string from its string pointer."""
+        _, buf, offset, length = self.hold(basic_string)
+        if offset == 0 and len(buf) == length:
+            return memoryview(buf)
+        # memoryview slice continues to point to buffer, does not copy
+        return memoryview(buf)[offset:offset+length]
 
     def copy(self, basic_string):
         """Return a copy of a string from its string pointer."""
         return str(bytearray(self._view(basic_string)))
 
+    def substring(self, held, start, stop):
+        """Return part of a held string; don't copy it if it is in string space."""
+        key, buf, offset, length = held
+        if stop <= start:
+            return vartypes.null('$')
+        # copy if the string has been moved, or if assigning the result would share the original
+        if key is None or self.strings.get(key) is not buf or (start == 0 and stop == length):
+            return self.store(buf[offset+start:offset+stop])
+        offset += start
+        address = self.address(key) + offset
+        view_key = str(vartypes.integer_to_bytes(vartypes.int_to_integer_unsigned(address)))
+        if offset:
+            self._views[view_key] = key, offset
+        return vartypes.bytes_to_string(chr(stop - start) + view_key)
+
+    def find(self, held, basic_substring, start=0):
+        """Return the position of a substring in a held string at or after start, or -1."""
+        _, buf, offset, length = held
+        found = buf.find(self._view(basic_substring), offset + start, offset + length)
+        if found == -1:
+            return -1
+        return found - offset
+
+    def materialise(self, basic_string):
+        """Store a copy of a substring view, so that it can be assigned; return other strings as they are."""
+        length = vartypes.string_length(basic_string)
+        if length == 0:
+            return basic_string
+        key = str(vartypes.string_to_bytes(basic_string)[-2:])
+        try:
+            if len(self.strings[key]) == length:
+                return basic_string
+        except KeyError:
+            if key not in self._views:
+                return basic_string
+        return self.store(self.copy(basic_string))
+
     def modify(self, basic_string, in_str, offset=None, num=None):
         """Assign a new string into an existing buffer."""
         # if it is a code literal, we now do need to allocate space for a copy
@@ -100,6 +169,8 @@ class StringSpace(object):
         if size > 0:
             if key in self.strings:
                 logging.debug('String key %s at %d already defined.' % (repr(key), address))
+            else:
+                bisect.insort(self._addresses, address)
             # copy and convert to bytearray
             self.strings[key] = bytearray(in_str)
         return vartypes.bytes_to_string(chr(size) + key)
@@ -112,6 +183,7 @@ class StringSpace(object):
             length = len(self.strings[last_key])
             self.current += length
             del self.strings[last_key]
+            del self._addresses[bisect.bisect_left(self._addresses, last_address)]
         except KeyError:
             # happens if we're called before an out-of-memory exception is handled
             # and the string wasn't allocated
@@ -141,14 +213,22 @@ class StringSpace(object):
             # re-allocate string space
             item[0][:] = vartypes.string_to_bytes(self.store(item[2]))
 
+    def update(self, other):
+        """Take over the strings stored in another string space."""
+        self.strings.update(other.strings)
+        self._addresses = sorted(self.address(key) for key in self.strings)
+        self.current = min(self.current, other.current)
+
     def get_memory(self, address):
         """Retrieve data from data memory: string space """
-        # find the variable we're in
-        for key, value in self.strings.iteritems():
-            try_address = self.address(key)
-            length = len(value)
-            if try_address <= address < try_address + length:
-                return value[address - try_address]
+        # find the string we're in: the last one that starts at or below the address
+        i = bisect.bisect_right(self._addresses, address) - 1
+        if i < 0:
+            return -1
+        try_address = self._addresses[i]
+        value = self.strings[str(vartypes.integer_to_bytes(vartypes.int_to_integer_unsigned(try_address)))]
+        if address < try_address + len(value):
+            return value[address - try_address]
         return -1
 
     def __enter__(self):
@@ -178,20 +258,38 @@ class Scalars(object):
     def __init__(self, memory):
         """Initialise scalars."""
         self.memory = memory
+        # increased on every change to any scalar, so watches can tell if anything changed
+        self.version = 0
         self.clear()
 
     def clear(self):
         """Clear scalar variables."""
+        self.version += 1
         self.variables = {}
         self.var_memory = {}
+        # names in order of address; scalars are only ever added at the end
+        self._addresses = []
+        self._names = []
         self.current = 0
 
+    def __setstate__(self, pickle_dict):
+        """Unpickle."""
+        self.__dict__.update(pickle_dict)
+        # snapshots from earlier versions have no address index
+        if '_addresses' not in pickle_dict:
+            self._names = sorted(self.var_memory, key=self.var_memory.get)
+            self._addresses = [self.var_memory[name][0] for name in self._names]
+        if 'version' not in pickle_dict:
+            self.version = 0
+
     def set(self, name, value=None):
         """Assign a value to a variable."""
         name = self.memory.complete_name(name)
         type_char = name[-1]
         if value is not None:
             value = vartypes.pass_type(type_char, value)
+            if type_char == '$':
+                value = self.memory.strings.materialise(value)
         # update memory model
         # check if garbage needs collecting before allocating memory
         if name not in self.var_memory:
@@ -204,12 +302,15 @@ class Scalars(object):
             var_ptr = name_ptr + max(3, len(name)) + 1
             self.current += max(3, len(name)) + 1 + vartypes.byte_size[name[-1]]
             self.var_memory[name] = (name_ptr, var_ptr)
+            self._addresses.append(name_ptr)
+            self._names.append(name)
         # don't change the value if just checking allocation
         if value is None:
             if name in self.variables:
                 return
             else:
                 value = vartypes.null(type_char)
+        self.version += 1
         # copy buffers
         try:
             # in-place copy is crucial for FOR
@@ -235,25 +336,26 @@ class Scalars(object):
         except KeyError:
             return -1
 
+    def _find(self, address):
+        """Return the name of the variable whose record contains an address, or None."""
+        i = bisect.bisect_right(self._addresses, address) - 1
+        if i < 0:
+            return None
+        return self._names[i]
+
     def dereference(self, address):
         """Get a value for a scalar given its pointer address."""
-        for name, data in self.var_memory.iteritems():
-            if data[1] == address:
-                return self.get(name)
+        name = self._find(address)
+        if name is not None and self.var_memory[name][1] == address:
+            return self.get(name)
         return None
 
     def get_memory(self, address):
         """Retrieve data from data memory: variable space """
-        name_addr = -1
-        var_addr = -1
-        the_var = None
-        for name in self.var_memory:
-            name_try, var_try = self.var_memory[name]
-            if name_try <= address and name_try > name_addr:
-                name_addr, var_addr = name_try, var_try
-                the_var = name
+        the_var = self._find(address)
         if the_var is None:
             return -1
+        name_addr, var_addr = self.var_memory[the_var]
         if address >= var_addr:
             offset = address - var_addr
             if offset >= vartypes.byte_size[the_var[-1]]:
@@ -285,8 +387,24 @@ class Arrays(object):
         """Clear arrays."""
         self.arrays = {}
         self.array_memory = {}
+        # bounds, byte strides and element size per array, fixed at DIM time
+        self._geometry = {}
+        # names in order of address; arrays are only ever added at the end
+        self._addresses = []
+        self._names = []
         self.current = 0
 
+    def __setstate__(self, pickle_dict):
+        """Unpickle."""
+        self.__dict__.update(pickle_dict)
+        # snapshots from earlier versions have no address index
+        if '_addresses' not in pickle_dict:
+            self._names = sorted(self.array_memory, key=self.array_memory.get)
+            self._addresses = [self.array_memory[name][0] for name in self._names]
+        if '_geometry' not in pickle_dict:
+            self._geometry = dict((name, self._get_geometry(name, record[0]))
+                                  for name, record in self.arrays.iteritems())
+
     def erase(self, name):
         """Remove an array from memory."""
         try:
@@ -294,6 +412,7 @@ class Arrays(object):
         except KeyError:
             # illegal fn call
             raise error.RunError(error.IFC)
+        del self._geometry[name]
 
     def index(self, index, dimensions):
         """Return the flat index for a given dimensioned index."""
@@ -338,7 +457,13 @@ class Arrays(object):
         array_bytes = size*var_size_bytes(name)
         self.memory.check_free(record_len + array_bytes, error.OUT_OF_MEMORY)
         self.current += record_len + array_bytes
+        if name in self.array_memory:
+            # array has been erased; its old record is no longer reachable
+            i = bisect.bisect_left(self._addresses, self.array_memory[name][0])
+            del self._addresses[i], self._names[i]
         self.array_memory[name] = (name_ptr, array_ptr)
+        self._addresses.append(name_ptr)
+        self._names.append(name)
         try:
             self.arrays[name] = [ dimensions, bytearray(array_bytes), 0 ]
         except OverflowError:
@@ -347,26 +472,44 @@ class Arrays(object):
         except MemoryError:
             # out of memory
             raise error.RunError(error.OUT_OF_MEMORY)
+        self._geometry[name] = self._get_geometry(name, dimensions)
 
-    def check_dim(self, name, index):
-        """Check if an array has been allocated. If not, auto-allocate if indices are <= 10; raise error otherwise."""
+    def _get_geometry(self, name, dimensions):
+        """Return the upper bounds, byte strides and element size of an array."""
+        bytesize = var_size_bytes(name)
+        strides = []
+        area = bytesize
+        for d in dimensions:
+            strides.append(area)
+            area *= d + 1 - self.base_index
+        return tuple(dimensions), tuple(strides), bytesize
+
+    def _locate(self, name, index):
+        """Return the record of an array and the byte offset and size of an element; auto-allocate if needed."""
         try:
-            dimensions, lst, _ = self.arrays[name]
+            bounds, strides, bytesize = self._geometry[name]
         except KeyError:
             # auto-dimension - 0..10 or 1..10
             # this even fixes the dimensions if the index turns out to be out of range
-            dimensions = [10] * len(index)
-            self.dim(name, dimensions)
-            dimensions, lst, _ = self.arrays[name]
-        if len(index) != len(dimensions):
+            self.dim(name, [10] * len(index))
+            bounds, strides, bytesize = self._geometry[name]
+        if len(index) != len(bounds):
             raise error.RunError(error.SUBSCRIPT_OUT_OF_RANGE)
-        for i, d in zip(index, dimensions):
+        base = self.base_index
+        offset = 0
+        for i, d, stride in zip(index, bounds, strides):
             if i < 0:
                 raise error.RunError(error.IFC)
-            elif i < self.base_index or i > d:
+            elif i < base or i > d:
                 # dimensions is the *maximum index number*, regardless of self.base_index
                 raise error.RunError(error.SUBSCRIPT_OUT_OF_RANGE)
-        return dimensions, lst
+            offset += (i - base) * stride
+        return self.arrays[name], offset, bytesize
+
+    def check_dim(self, name, index):
+        """Check if an array has been allocated. If not, auto-allocate if indices are <= 10; raise error otherwise."""
+        record, _, _ = self._locate(name, index)
+        return record[0], record[1]
 
     def clear_base(self):
         """Unset the array base."""
@@ -384,21 +527,24 @@ class Arrays(object):
 
     def view(self, name, index):
         """Return a memoryview to an array element."""
-        dimensions, lst = self.check_dim(name, index)
-        bigindex = self.index(index, dimensions)
-        bytesize = var_size_bytes(name)
-        return memoryview(lst)[bigindex*bytesize:(bigindex+1)*bytesize]
+        record, offset, bytesize = self._locate(name, index)
+        return memoryview(record[1])[offset:offset+bytesize]
 
     def get(self, name, index):
         """Retrieve a copy of the value of an array element."""
-        return (name[-1], bytearray(self.view(name, index)))
+        record, offset, bytesize = self._locate(name, index)
+        return (name[-1], record[1][offset:offset+bytesize])
 
     def set(self, name, index, value):
         """Assign a value to an array element."""
+        value = vartypes.pass_type(name[-1], value)
+        if name[-1] == '$':
+            value = self.memory.strings.materialise(value)
+        record, offset, bytesize = self._locate(name, index)
         # copy value into array
-        self.view(name, index)[:] = vartypes.pass_type(name[-1], value)[1]
+        record[1][offset:offset+bytesize] = value[1]
         # increment array version
-        self.arrays[name][2] += 1
+        record[2] += 1
 
     def varptr(self, name, indices):
         """Retrieve the address of an array."""
@@ -411,33 +557,30 @@ class Arrays(object):
         except KeyError:
             return -1
 
+    def _find(self, address):
+        """Return the name of the array whose record contains an address, or None."""
+        i = bisect.bisect_right(self._addresses, address - self.memory.var_current()) - 1
+        if i < 0 or self._names[i] not in self.arrays:
+            return None
+        return self._names[i]
+
     def dereference(self, address):
         """Get a value for an array given its pointer address."""
-        found_addr = -1
-        found_name = None
-        for name, data in self.array_memory.iteritems():
-            addr = self.memory.var_current() + data[1]
-            if addr > found_addr and addr <= address:
-                found_addr = addr
-                found_name = name
-        if not found_name:
+        name = self._find(address)
+        if name is None:
+            return None
+        offset = address - self.memory.var_current() - self.array_memory[name][1]
+        if offset < 0 or offset >= self.array_size_bytes(name):
             return None
         _, lst, _ = self.arrays[name]
-        offset = address - found_addr
         return (name[-1], lst[offset : offset+var_size_bytes(name)])
 
     def get_memory(self, address):
         """Retrieve data from data memory: array space """
-        name_addr = -1
-        arr_addr = -1
-        the_arr = None
-        for name in self.array_memory:
-            name_try, arr_try = self.array_memory[name]
-            if name_try <= address and name_try > name_addr:
-                name_addr, arr_addr = name_try, arr_try
-                the_arr = name
+        the_arr = self._find(address)
         if the_arr is None:
             return -1
+        name_addr, arr_addr = self.array_memory[the_arr]
         var_current = self.memory.var_current()
         if address >= var_current + arr_addr:
             offset = address - arr_addr - var_current
@@ -453,7 +596,7 @@ class Arrays(object):
                 offset -= max(3, len(the_arr))+1
                 dimensions, _, _ = self.arrays[the_arr]
                 data_rep = vartypes.integer_to_bytes(vartypes.int_to_integer_unsigned(
-                    self.array_size_bytes(the_arr) + 1 + 2*len(dimensions)) + chr(len(dimensions)))
+                    self.array_size_bytes(the_arr) + 1 + 2*len(dimensions))) + chr(len(dimensions))
                 for d in dimensions:
                     data_rep += vartypes.integer_to_bytes(vartypes.int_to_integer_unsigned(
                                         d + 1 - self.base_index))
@@ -504,9 +647,40 @@ def get_name_in_memory(name, offset):
 # helper functions for Python interface
 
 def build_array(python_list, name, stringspace, arrays):
-    """Convert Python list to BASIC array."""
+    """Convert Python list or NumPy array to BASIC array."""
+    if numpy and isinstance(python_list, numpy.ndarray):
+        if name[-1] != '$':
+            _array_from_ndarray(python_list, name, arrays)
+            return
+        python_list = python_list.tolist()
     _array_from_list(python_list, name, [], stringspace, arrays)
 
+def _array_from_ndarray(values, name, arrays):
+    """Convert NumPy array to numeric BASIC array; allocate to its shape if needed."""
+    base = arrays.base_index or 0
+    if values.ndim == 0:
+        raise error.RunError(error.IFC)
+    if name not in arrays.arrays:
+        arrays.dim(name, [n - 1 + base for n in values.shape])
+    record = arrays.arrays[name]
+    extents = [d + 1 - base for d in record[0]]
+    if len(extents) != values.ndim or any(n > e for n, e in zip(values.shape, extents)):
+        raise error.RunError(error.SUBSCRIPT_OUT_OF_RANGE)
+    if name[-1] == '%':
+        if values.dtype.kind == 'f':
+            # round half away from zero, as on assignment
+            values = numpy.trunc(values + numpy.copysign(0.5, values))
+        if values.size and (values.max() > 0x7fff or values.min() < -0x8000):
+            raise error.RunError(error.OVERFLOW)
+        data, dtype = values.astype('<i2'), '<i2'
+    else:
+        data = fp.from_ieee_array(values, name[-1])
+        dtype = data.dtype
+    # BASIC arrays are stored with the first index running fastest
+    target = numpy.frombuffer(record[1], dtype).reshape(extents, order='F')
+    target[tuple(slice(0, n) for n in values.shape)] = data
+    record[2] += 1
+
 def _array_from_list(python_list, name, index, stringspace, arrays):
     """Convert Python list to BASIC array."""
     if not python_list:
@@ -526,14 +700,31 @@ def build_list(name, stringspace, arrays):
     else:
         return []
 
+def build_ndarray(name, arrays):
+    """Convert numeric BASIC array to NumPy array: int16, float32 or float64."""
+    typechar = name[-1]
+    if name not in arrays.arrays:
+        return numpy.zeros(0, _ndarray_types[typechar])
+    dimensions, buf, _ = arrays.arrays[name]
+    extents = [d + 1 - arrays.base_index for d in dimensions]
+    if typechar == '%':
+        values = numpy.frombuffer(buf, '<i2')
+    else:
+        values = fp.to_ieee_array(buf, typechar)
+    return values.astype(_ndarray_types[typechar]).reshape(extents, order='F')
+
+_ndarray_types = {'%': 'int16', '!': 'float32', '#': 'float64'}
+
 def _list_from_array(name, index, remaining_dimensions, stringspace, arrays):
     """Convert BASIC array to Python list."""
     if not remaining_dimensions:
         return []
-    elif len(remaining_dimensions) == 1:
-        return [to_value(arrays.get(name, index+[i+(arrays.base_index or 0)]), stringspace) for i in xrange(remaining_dimensions[0])]
+    # dimensions are the *maximum index number*
+    base = arrays.base_index or 0
+    if len(remaining_dimensions) == 1:
+        return [to_value(arrays.get(name, index+[i]), stringspace) for i in xrange(base, remaining_dimensions[0]+1)]
     else:
-        return [_list_from_array(name, index+[i+(arrays.base_index or 0)], remaining_dimensions[1:], stringspace, arrays) for i in xrange(remaining_dimensions[0])]
+        return [_list_from_array(name, index+[i], remaining_dimensions[1:], stringspace, arrays) for i in xrange(base, remaining_dimensions[0]+1)]
 
 def to_value(basic_val, stringspace):
     """Convert BASIC value to Python value."""
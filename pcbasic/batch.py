@@ -0,0 +1,132 @@
+"""
+PC-BASIC - batch.py
+Run many BASIC programs in parallel
+
+(c) 2016 Rob Hagemans
+This file is released under the GNU GPL version 3 or later.
+
+Usage: python -m pcbasic.batch [--processes=N] [--timeout=SECONDS] [--summary=FILE]
+                               [option ...] job [job ...]
+
+Each job is a BASIC program file or a directory with a PCBASIC.INI file, as for
+a package. Jobs run without an interface, each in its own process and with its
+own directory mounted as Z:. Any other options are passed on to every job;
+relative file names given with --input and --output are taken to be in each job's
+directory.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import multiprocessing
+
+from . import basic
+from . import config
+from .main import run_session
+
+
+def preload(options=()):
+    """Load the codepage and fonts for the common options before forking."""
+    argv, sys.argv = sys.argv, ['pcbasic'] + list(options) + ['--interface=none']
+    try:
+        with config.TemporaryDirectory(prefix='pcbasic-') as temp_dir:
+            settings = config.Settings(temp_dir)
+            basic.Session(**settings.get_session_parameters()).close()
+    finally:
+        sys.argv = argv
+
+def run_job(job, options=(), stdin=os.devnull, stdout=os.devnull):
+    """Run a single job in the current process."""
+    job = os.path.abspath(job)
+    if os.path.isdir(job):
+        os.chdir(job)
+        argv = []
+    else:
+        os.chdir(os.path.dirname(job))
+        argv = [os.path.basename(job)]
+    # redirect standard i/o at file descriptor level
+    os.dup2(os.open(stdin, os.O_RDONLY), 0)
+    out_fd = os.open(stdout, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    os.dup2(out_fd, 1)
+    os.dup2(out_fd, 2)
+    sys.argv = ['pcbasic'] + argv + list(options) + ['--interface=none']
+    with config.TemporaryDirectory(prefix='pcbasic-') as temp_dir:
+        settings = config.Settings(temp_dir)
+        launch_params = settings.get_launch_parameters()
+        # jobs running in parallel must not share a state file
+        launch_params['state_file'] = None
+        run_session(**launch_params)
+    sys.stdout.flush()
+
+def run_batch(jobs, processes=0, timeout=0, options=(), stdin=os.devnull, stdout=os.devnull):
+    """Run jobs in parallel processes and return a summary for each job."""
+    processes = processes or multiprocessing.cpu_count()
+    preload(options)
+    # jobs are tracked by submission index, as a job may be given more than once
+    pending = list(reversed(list(enumerate(jobs))))
+    running = []
+    # report in order of submission
+    results = [None] * len(jobs)
+    while pending or running:
+        while pending and len(running) < processes:
+            index, job = pending.pop()
+            process = multiprocessing.Process(
+                    target=run_job, args=(job, options, stdin, stdout))
+            process.start()
+            running.append((index, job, process, time.time()))
+        time.sleep(0.005)
+        for index, job, process, start in running[:]:
+            elapsed = time.time() - start
+            if process.is_alive():
+                if not timeout or elapsed < timeout:
+                    continue
+                process.terminate()
+                process.join()
+                status = 'timeout'
+            else:
+                process.join()
+                status = 'ok' if process.exitcode == 0 else 'error'
+            running.remove((index, job, process, start))
+            results[index] = {
+                'job': job, 'status': status,
+                'exitcode': process.exitcode, 'time': round(elapsed, 3)}
+    return results
+
+def main():
+    """Run the jobs given on the command line and write a JSON summary."""
+    processes, timeout, summary = 0, 0, None
+    options, jobs = [], []
+    for arg in sys.argv[1:]:
+        key, _, value = arg.partition('=')
+        try:
+            if key == '--processes':
+                processes = int(value)
+            elif key == '--timeout':
+                timeout = float(value)
+            elif key == '--summary':
+                summary = value
+            elif arg.startswith('-'):
+                options.append(arg)
+            else:
+                jobs.append(arg)
+        except ValueError:
+            logging.error('Invalid value for %s: %s', key, value)
+            sys.exit(1)
+    if not jobs:
+        sys.stderr.write(__doc__[__doc__.index('Usage:'):])
+        sys.exit(1)
+    results = run_batch(jobs, processes, timeout, options)
+    if summary:
+        with open(summary, 'w') as f:
+            json.dump(results, f, indent=4)
+    else:
+        json.dump(results, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -283,6 +283,9 @@ class Settings(object):
         u'fullscreen': {u'type': u'bool', u'default': False,},
         u'nokill': {u'type': u'bool', u'default': False,},
         u'debug': {u'type': u'bool', u'default': False,},
+        u'profile-startup': {u'type': u'bool', u'default': False,},
+        u'profile': {u'type': u'bool', u'default': False,},
+        u'profile-callgrind': {u'type': u'string', u'default': u'',},
         u'strict-hidden-lines': {u'type': u'bool', u'default': False,},
         u'strict-protect': {u'type': u'bool', u'default': False,},
         u'capture-caps': {u'type': u'bool', u'default': False,},
@@ -308,6 +311,7 @@ class Settings(object):
         u'copy-paste': {u'type': u'string', u'list': 2, u'default': [u'left', u'middle'],
                        u'choices': (u'left', u'middle', u'right', u'none',),},
         u'state': {u'type': u'string', u'default': u'',},
+        u'checkpoint': {u'type': u'int', u'default': 0,},
         u'mono-tint': {u'type': u'int', u'list': 3, u'default': [255, 255, 255],},
         u'monitor': {
             u'type': u'string', u'choices': (u'rgb', u'composite', u'mono'),
@@ -489,6 +493,9 @@ class Settings(object):
             'max_files': self.get('max-files'),
             # first field buffer address (workspace size; 3429 for gw-basic)
             'reserved_memory': self.get('reserved-memory'),
+            # statement profiler
+            'profile': self.get('profile'),
+            'profile_callgrind': self.get('profile-callgrind'),
         }
 
     def get_video_parameters(self):
@@ -552,6 +559,7 @@ class Settings(object):
             'prog': self.get(0) or self.get('run') or self.get('load'),
             'resume': self.get('resume'),
             'state_file': self.get_state_file(),
+            'checkpoint': self.get('checkpoint'),
             'commands': commands,
             }
         launch_params.update(self.get_session_parameters())
@@ -0,0 +1,211 @@
+"""
+PC-BASIC - converter.py
+Convert many program files between ASCII, bytecode and protected formats
+
+(c) 2016 Rob Hagemans
+This file is released under the GNU GPL version 3 or later.
+
+Usage: python -m pcbasic.converter [--convert={A|B|P}] [--output=DIR] [--processes=N]
+                                   [--summary=FILE] [option ...] file|dir [...]
+
+Files are converted one after another without starting an interpreter session.
+Directories are searched recursively. If --output is given, each converted
+program is written under DIR with its name relative to the directory it was
+found in, or to the current directory for files given by name; otherwise, all
+converted programs are written to standard output in turn.
+Any other options, such as --utf8, --strict-newline or --codepage, are
+interpreted as for --convert.
+"""
+
+import os
+import sys
+import json
+import logging
+import multiprocessing
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+from StringIO import StringIO as _StringIO
+
+from .basic import error
+from .basic import tokenise
+from .basic import program
+from .basic import disk
+from .basic import memory
+from .basic import unicodepage
+from . import config
+
+
+class Converter(object):
+    """Program file converter using only the tokeniser and program buffer."""
+
+    def __init__(self, mode=b'A', syntax=u'advanced', option_debug=False,
+                codepage=u'437', box_protect=True, utf8=False, universal=True,
+                max_list_line=65535, allow_protect=False,
+                reserved_memory=3429, max_reclen=128, max_files=3,
+                **session_params):
+        """Initialise converter; takes the same options as Session."""
+        self.mode = mode
+        # the codepage is only needed to convert from and to utf-8
+        cp = unicodepage.Codepage(codepage, box_protect) if utf8 else None
+        # only used to create file objects and recognise file types
+        self.disk = disk.DiskDevice(b'', None, u'', None, None, cp, None, utf8, universal)
+        self.program = program.Program(
+                tokenise.Tokeniser(syntax, option_debug),
+                max_list_line, allow_protect)
+        # line offsets in bytecode depend on the memory layout
+        self.program.set_address(memory.get_code_start(reserved_memory, max_reclen, max_files))
+
+    def convert(self, data):
+        """Convert program file contents to the target format."""
+        infile = self.disk.create_file_object(StringIO(data), b'ABP', b'I')
+        with infile:
+            self.program.load(infile, rebuild_dict=False)
+        buf = _Buffer()
+        with self.disk.create_file_object(buf, self.mode, b'O') as outfile:
+            self.program.save(outfile)
+        return buf.getvalue()
+
+    def convert_file(self, name_in, name_out=None):
+        """Convert a native file; write to standard output if no output name given."""
+        with open(name_in, b'rb') as f:
+            data = self.convert(f.read())
+        if not name_out:
+            sys.stdout.write(data)
+        else:
+            with open(name_out, b'wb') as f:
+                f.write(data)
+
+
+class _Buffer(_StringIO):
+    """Output buffer that keeps its contents when the file object is closed."""
+
+    def close(self):
+        """Don't discard the buffer."""
+
+
+def iter_jobs(paths, output_dir=None):
+    """Generate input and output file names for files and directory trees."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    name_in = os.path.join(root, name)
+                    rel = os.path.relpath(name_in, path)
+                    yield name_in, (os.path.join(output_dir, rel) if output_dir else None)
+        else:
+            # keep relative paths below the current directory, to avoid name clashes
+            rel = os.path.normpath(path)
+            if os.path.isabs(rel) or rel.startswith(os.pardir):
+                rel = os.path.basename(rel)
+            yield path, (os.path.join(output_dir, rel) if output_dir else None)
+
+# converter for the current worker process
+_converter = None
+
+def _init_worker(mode, params):
+    """Create the converter for this process."""
+    global _converter
+    _converter = Converter(mode, **params)
+
+def _convert_job(job):
+    """Convert a single file; return converted data if output is not to file."""
+    name_in, name_out = job
+    try:
+        with open(name_in, b'rb') as f:
+            data = _converter.convert(f.read())
+        if name_out is None:
+            return name_in, None, data
+        dirname = os.path.dirname(name_out)
+        if dirname and not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except EnvironmentError:
+                # may have been created by another worker in the meantime
+                if not os.path.isdir(dirname):
+                    raise
+        with open(name_out, b'wb') as f:
+            f.write(data)
+        return name_in, None, b''
+    except error.RunError as e:
+        return name_in, e.message, b''
+    except EnvironmentError as e:
+        return name_in, e.strerror or str(e), b''
+    except Exception as e:
+        # e.g. undecodable text with --utf8; don't abandon the other files
+        return name_in, b'%s: %s' % (type(e).__name__, e), b''
+
+def run_convert(jobs, mode=b'A', processes=1, stdout=None, **params):
+    """Convert files as listed in jobs, in order; generate name and error for each."""
+    if processes == 1:
+        _init_worker(mode, params)
+        results = (_convert_job(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(processes or None, _init_worker, (mode, params))
+        results = pool.imap(_convert_job, jobs, chunksize=16)
+    try:
+        for name_in, message, data in results:
+            if data and stdout:
+                stdout.write(data)
+            yield name_in, message
+    finally:
+        if processes != 1:
+            pool.terminate()
+
+def get_parameters(options=()):
+    """Get conversion mode and session options from command-line style options."""
+    argv, sys.argv = sys.argv, ['pcbasic'] + list(options) + ['--interface=none']
+    try:
+        with config.TemporaryDirectory(prefix='pcbasic-') as temp_dir:
+            settings = config.Settings(temp_dir)
+            mode, _, _ = settings.get_converter_parameters()
+            return mode, settings.get_session_parameters()
+    finally:
+        sys.argv = argv
+
+def main():
+    """Convert the files given on the command line."""
+    processes, output_dir, summary = 1, None, None
+    options, paths = [], []
+    for arg in sys.argv[1:]:
+        key, _, value = arg.partition('=')
+        try:
+            if key == '--processes':
+                processes = int(value)
+            elif key == '--output':
+                output_dir = value
+            elif key == '--summary':
+                summary = value
+            elif arg.startswith('-'):
+                options.append(arg)
+            else:
+                paths.append(arg)
+        except ValueError:
+            logging.error('Invalid value for %s: %s', key, value)
+            sys.exit(1)
+    if not paths:
+        sys.stderr.write(__doc__[__doc__.index('Usage:'):])
+        sys.exit(1)
+    mode, params = get_parameters(options)
+    results, failed = [], False
+    for name_in, message in run_convert(
+                iter_jobs(paths, output_dir), mode, processes, sys.stdout, **params):
+        if message:
+            logging.error('%s: %s', name_in, message)
+            failed = True
+        if summary:
+            results.append({
+                'file': name_in, 'status': 'error' if message else 'ok',
+                'message': message})
+    if summary:
+        with open(summary, 'w') as f:
+            json.dump(results, f, indent=4)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,11 @@ PC-BASIC - GW-BASIC/BASICA/Cartridge BASIC compatible interpreter
 This file is released under the GNU GPL version 3 or later.
 """
 
+import time
+# start of loading, for --profile-startup
+_start_time = time.time()
+
+import os
 import sys
 import locale
 import logging
@@ -24,16 +29,44 @@ from .version import __version__
 from . import ansipipe
 from . import basic
 from .basic import signals
+from .basic import unicodepage
 from . import state
 from . import config
 
 
+class StartupProfile(object):
+    """Timings of the phases of interpreter startup."""
+
+    def __init__(self, start_time):
+        """Start timing."""
+        self._timings = []
+        self._last = start_time
+
+    def mark(self, phase):
+        """Record the time taken since the previous mark."""
+        now = time.time()
+        self._timings.append((phase, now - self._last))
+        self._last = now
+
+    def report(self, stream):
+        """Write out the timings."""
+        for phase, seconds in self._timings:
+            stream.write('%-32s %8.3f s\n' % (phase, seconds))
+        stream.write('%-32s %8.3f s\n' % ('total', sum(t for _, t in self._timings)))
+        stream.flush()
+
+
 def main():
     """Initialise and perform requested operations."""
+    startup_profile = StartupProfile(_start_time)
+    startup_profile.mark('imports')
     try:
         with config.TemporaryDirectory(prefix='pcbasic-') as temp_dir:
             # get settings and prepare logging
             settings = config.Settings(temp_dir)
+            startup_profile.mark('config')
+            if not settings.get('profile-startup'):
+                startup_profile = None
             command = settings.get_command()
             if command == 'version':
                 # print version and exit
@@ -46,10 +79,10 @@ def main():
                 convert(settings)
             elif settings.get_interface():
                 # start an interpreter session with interface
-                launch_session(settings)
+                launch_session(settings, startup_profile)
             else:
                 # start an interpreter session with standard i/o
-                run_session(**settings.get_launch_parameters())
+                run_session(startup_profile=startup_profile, **settings.get_launch_parameters())
     except KeyboardInterrupt:
         pass
     except:
@@ -114,6 +147,17 @@ def show_platform_info():
 def convert(settings):
     """Perform file format conversion."""
     mode, name_in, name_out = settings.get_converter_parameters()
+    if name_in and os.path.isfile(name_in):
+        # native file: no need to start a session
+        from .converter import Converter
+        try:
+            Converter(mode, **settings.get_session_parameters()).convert_file(name_in, name_out)
+        except basic.RunError as e:
+            logging.error(e.message)
+        except EnvironmentError as e:
+            logging.error('Could not convert %s: %s', name_in, e)
+        return
+    # standard input or BASIC file spec
     session = basic.Session(**settings.get_session_parameters())
     try:
         session.load_program(name_in, rebuild_dict=False)
@@ -121,7 +165,7 @@ def convert(settings):
     except basic.RunError as e:
         logging.error(e.message)
 
-def launch_session(settings):
+def launch_session(settings, startup_profile=None):
     """Start an interactive interpreter session."""
     from . import interface
     try:
@@ -133,10 +177,12 @@ def launch_session(settings):
     except interface.InitFailed:
         logging.error('Failed to initialise interface.')
         return
+    if startup_profile:
+        startup_profile.mark('interface plugins')
     thread = threading.Thread(
                 target=run_session,
                 args=(iface,),
-                kwargs=settings.get_launch_parameters())
+                kwargs=dict(settings.get_launch_parameters(), startup_profile=startup_profile))
     try:
         # launch the BASIC thread
         thread.start()
@@ -147,16 +193,34 @@ def launch_session(settings):
         thread.join()
 
 def run_session(iface=None, resume=False, state_file=None, wait=False,
-                prog=None, commands=(), **session_params):
+                prog=None, commands=(), checkpoint=0, startup_profile=None, **session_params):
     """Run an interactive BASIC session."""
     try:
         if resume:
             session = state.zunpickle(state_file).attach(iface)
+            if startup_profile:
+                startup_profile.mark('resume session')
         else:
+            if startup_profile:
+                # time the codepage on its own; the session reuses the loaded tables
+                unicodepage.Codepage(session_params.get('codepage', u'437'))
+                startup_profile.mark('codepage')
             session = basic.Session(iface, **session_params)
+            if startup_profile:
+                startup_profile.mark('session')
+        if startup_profile:
+            # fonts are otherwise loaded on first use
+            for font in set(session.screen.fonts.itervalues()):
+                font.fontdict
+            startup_profile.mark('fonts')
+        # write periodic checkpoints
+        session.set_checkpoint(lambda s: state.zpickle(s, state_file), checkpoint)
         try:
             if prog:
                 session.load_program(prog)
+            if startup_profile:
+                startup_profile.mark('program')
+                startup_profile.report(sys.stderr)
             for cmd in commands:
                 session.execute(cmd)
             session.interact()
@@ -84,10 +84,16 @@ def zunpickle(state_file):
             logging.error('Could not read from %s', state_file)
 
 def zpickle(obj, state_file):
-    """Retuen a compressed pickle string."""
+    """Return a compressed pickle string."""
     if state_file:
+        # write to a new file first, so that a checkpoint interrupted midway
+        # leaves the previous state intact
+        temp_file = state_file + '.new'
         try:
-            with open(state_file, 'wb') as f:
+            with open(temp_file, 'wb') as f:
                 f.write(zlib.compress(pickle.dumps(obj, 2)))
+            if os.name == 'nt' and os.path.exists(state_file):
+                os.remove(state_file)
+            os.rename(temp_file, state_file)
         except EnvironmentError:
             logging.error('Could not write to %s', state_file)
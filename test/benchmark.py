@@ -0,0 +1,638 @@
+#!/usr/bin/env python2
+
+""" PC-BASIC benchmark script
+
+(c) 2016 Rob Hagemans
+This file is released under the GNU GPL version 3 or later.
+"""
+
+import sys
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+import socket
+import threading
+import random
+from contextlib import contextmanager
+from StringIO import StringIO
+
+# use the pcbasic package from this source tree
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pcbasic import basic
+from pcbasic.basic import unicodepage
+from pcbasic.basic import cassette
+from pcbasic import state
+from pcbasic import batch
+from pcbasic import converter
+
+
+@contextmanager
+def timer(label):
+    """Report the time taken by a benchmark step."""
+    start = time.time()
+    yield
+    print '    %-40s %8.3f s' % (label, time.time() - start)
+
+# number of failed checks
+failures = 0
+
+def check(condition, message):
+    """Report a failed correctness check."""
+    global failures
+    if not condition:
+        failures += 1
+        print '    FAILED: %s' % message
+
+def devices(**params):
+    """Device parameters for a Session."""
+    device_params = {'LPT1:': '', 'LPT2:': '', 'LPT3:': '', 'COM1:': '', 'COM2:': '', 'CAS1:': ''}
+    for name, value in params.items():
+        device_params[name.upper() + ':'] = value
+    return device_params
+
+
+###############################################################################
+# benchmarks
+
+def bench_cassette(temp_dir):
+    """SAVE and LOAD a large program to CAS and WAV tape images."""
+    for image in ('CAS:bench.cas', 'WAV:bench.wav'):
+        image = image.split(':')[0] + ':' + os.path.join(temp_dir, image.split(':')[1])
+        with basic.Session(device_params=devices(cas1=image)) as session:
+            for i in xrange(10, 12000, 10):
+                session.execute('%d PRINT "LINE %d"; I%%, A$(I%%), 1.5#*I%%' % (i, i))
+            program = session.program.bytecode.getvalue()
+            with timer('SAVE "CAS1:" %d bytes to %s' % (len(program), image[:3])):
+                session.execute('SAVE "CAS1:BENCH"')
+        with basic.Session(device_params=devices(cas1=image)) as session:
+            with timer('LOAD "CAS1:" %d bytes from %s' % (len(program), image[:3])):
+                session.execute('LOAD "CAS1:BENCH"')
+            check(session.program.bytecode.getvalue() == program, 'program differs after round trip')
+
+def bench_wav_halfpulses(temp_dir):
+    """Find WAV half-pulses with NumPy and in pure Python, on the same blocks."""
+    if not cassette.numpy:
+        print '    skipped: numpy module not available.'
+        return
+    rng = random.Random(27)
+    # square pulses of random length, with runs of near-zero samples in and between them
+    samples = []
+    for _ in xrange(20000):
+        sign = rng.choice((-1, 1))
+        for level in (sign, -sign):
+            samples += [level * rng.randint(2, 120)] * rng.randint(1, 12)
+            if rng.random() < 0.2:
+                samples += [rng.randint(-1, 1) for _ in xrange(rng.randint(1, 8))]
+    def halfpulses(find, blocks):
+        state, lengths, states = (1, 1, 0), [], []
+        for block in blocks:
+            found, state = find(block, 1, state)
+            lengths += found
+            states.append(state)
+        return lengths, states
+    for size in (1024, 16384):
+        blocks = [samples[i:i+size] for i in xrange(0, len(samples), size)]
+        # the numpy version gets its samples as arrays, as from frames_to_samples
+        arrays = [cassette.numpy.array(block) for block in blocks]
+        with timer('blocks of %d samples, python' % size):
+            python = halfpulses(cassette.find_halfpulses_python, blocks)
+        with timer('blocks of %d samples, numpy' % size):
+            vectorised = halfpulses(cassette.find_halfpulses_numpy, arrays)
+        check(python == vectorised, '%d-sample blocks: half-pulses differ' % size)
+    # block boundaries everywhere or at random places, including inside pulses and zero runs
+    short = samples[:5000]
+    splits = [[short[i:i+size] for i in xrange(0, len(short), size)] for size in (1, 2, 3)]
+    blocks, start = [], 0
+    while start < len(samples):
+        size = rng.choice((1, 2, rng.randint(3, 50), rng.randint(50, 5000)))
+        blocks.append(samples[start:start+size])
+        start += size
+    for blocks in splits + [blocks]:
+        check(halfpulses(cassette.find_halfpulses_python, blocks) ==
+                halfpulses(cassette.find_halfpulses_numpy, blocks),
+                'half-pulses differ when split into %d blocks' % len(blocks))
+    # 8- and 16-bit frames, mono and stereo, with an incomplete frame at the end
+    frames = ''.join(chr(rng.randint(0, 255)) for _ in xrange(40001))
+    for sampwidth, nchannels in ((1, 1), (1, 2), (2, 1), (2, 2)):
+        if sampwidth == 1:
+            params = 0, 128*nchannels
+        else:
+            params = 256*nchannels/2, 256*nchannels
+        python = cassette.frames_to_samples_python(frames, sampwidth, nchannels, *params)
+        vectorised = cassette.frames_to_samples_numpy(frames, sampwidth, nchannels, *params)
+        check(list(vectorised) == python, '%d-byte %d-channel samples differ' % (sampwidth, nchannels))
+
+def bench_snapshot(temp_dir):
+    """Save and resume session state with graphics, program and variables."""
+    state_file = os.path.join(temp_dir, 'bench.sav')
+    with basic.Session(device_params=devices()) as session:
+        for i in xrange(10, 3000, 10):
+            session.execute('%d PRINT "LINE %d"' % (i, i))
+        session.execute('SCREEN 9: FOR I=0 TO 300 STEP 3: LINE (I,0)-(639-I,349),I MOD 16: NEXT')
+        session.execute('DIM A#(2000), B$(500): FOR I=0 TO 500: B$(I)=STR$(I): NEXT')
+        session.execute('PSET (1,1), 4')
+        with timer('save'):
+            state.zpickle(session, state_file)
+        with timer('resume'):
+            resumed = state.zunpickle(state_file)
+        check(resumed.evaluate('POINT(1,1)') == 4, 'pixel differs after round trip')
+        check(resumed.evaluate('B$(321)') == ' 321', 'string differs after round trip')
+
+def bench_batch(temp_dir):
+    """Run many small programs, one process each, and as a batch."""
+    jobs = []
+    for i in range(40):
+        job_dir = os.path.join(temp_dir, 'JOB%d' % i)
+        os.mkdir(job_dir)
+        with open(os.path.join(job_dir, 'PCBASIC.INI'), 'w') as f:
+            f.write('[pcbasic]\nrun=JOB.BAS\nquit=True\noutput=OUTPUT.TXT\n')
+        with open(os.path.join(job_dir, 'JOB.BAS'), 'w') as f:
+            f.write('10 FOR I=1 TO 100: A$=A$+CHR$(65+I MOD 26): NEXT\r\n20 PRINT %d; A$\r\n' % i)
+        jobs.append(job_dir)
+    pcbasic = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pcbasic.py')
+    with timer('%d jobs in separate interpreters' % len(jobs)):
+        for job_dir in jobs:
+            subprocess.call(['python', pcbasic, job_dir, '--interface=none'],
+                    stdin=open(os.devnull), stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+    expected = [open(os.path.join(job_dir, 'OUTPUT.TXT'), 'rb').read() for job_dir in jobs]
+    with timer('%d jobs as a batch' % len(jobs)):
+        results = batch.run_batch(jobs)
+    check(all(result['status'] == 'ok' for result in results), 'job failed')
+    check(expected == [open(os.path.join(job_dir, 'OUTPUT.TXT'), 'rb').read() for job_dir in jobs],
+            'output differs')
+
+def bench_startup(temp_dir):
+    """Start the interpreter to run a small program and exit, one process each."""
+    program = os.path.join(temp_dir, 'HELLO.BAS')
+    with open(program, 'wb') as f:
+        f.write('10 PRINT "Hello"\r\n')
+    pcbasic = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pcbasic.py')
+    runs = 10
+    # maximum time for a headless start, run and exit, in seconds
+    budget = float(os.environ.get('PCBASIC_STARTUP_BUDGET', '1.0'))
+    times = []
+    with timer('%d runs, start and exit' % runs):
+        for _ in range(runs):
+            start = time.time()
+            output = subprocess.check_output(['python', pcbasic, program, '--interface=none', '-q'],
+                    stdin=open(os.devnull), stderr=open(os.devnull, 'w'))
+            times.append(time.time() - start)
+    check(output.strip() == 'Hello', 'wrong output')
+    median = sorted(times)[runs//2]
+    check(median <= budget, 'start and exit took %.3f s, budget is %.3f s' % (median, budget))
+    # per-phase timings of one run
+    profile = subprocess.Popen(['python', pcbasic, program, '--interface=none', '-q', '--profile-startup'],
+                    stdin=open(os.devnull), stdout=open(os.devnull, 'w'), stderr=subprocess.PIPE)
+    for line in profile.communicate()[1].splitlines():
+        print '      %s' % line
+    with timer('%d runs, import only' % runs):
+        for _ in range(runs):
+            subprocess.call(['python', '-c', 'import sys; sys.path.insert(0, sys.argv[1]); import pcbasic.main',
+                    os.path.dirname(pcbasic)])
+    with timer('%d sessions in one process' % runs):
+        for _ in range(runs):
+            basic.Session(device_params=devices(), font=['unifont', 'univga', 'freedos']).close()
+
+def bench_print_using(temp_dir):
+    """Format numbers and strings in a PRINT USING loop."""
+    output_file = os.path.join(temp_dir, 'USING.TXT')
+    with basic.Session(device_params=devices(), output_file=output_file) as session:
+        session.execute('10 FOR I = 1 TO 2000: X# = I * 1.2345678901# - 600')
+        session.execute('20 PRINT USING "+###.## **$#,###.## ##.##^^^^ \\  \\ !"; X#; X#*3; X#; "ABCDEF"; "XY"')
+        session.execute('30 NEXT')
+        with timer('PRINT USING, 2000 lines'):
+            session.execute('RUN')
+    check(open(output_file, 'rb').read().startswith('-598.77 **-$1796.30 -5.99D+02 ABCD X\r\n'),
+            'output differs')
+
+def bench_number_conversion(temp_dir):
+    """Convert numbers to and from text with STR$, VAL, PRINT# and INPUT#."""
+    with basic.Session(device_params=devices(), mount_dict={'Z': (unicode(temp_dir), u'')}) as session:
+        session.execute('DIM A!(1000), B#(1000), S$(1000)')
+        session.execute('FOR I = 0 TO 1000: A!(I) = RND * 10^(I MOD 60 - 30): B#(I) = CDBL(A!(I)) / 7: NEXT')
+        with timer('STR$ of 1000 singles and doubles'):
+            session.execute('FOR I = 0 TO 1000: S$(I) = STR$(A!(I)) + STR$(B#(I)): NEXT')
+        with timer('VAL of 1000 numbers'):
+            session.execute('FOR I = 0 TO 1000: X# = VAL(S$(I)): NEXT')
+        with timer('PRINT# of 1000 singles and doubles'):
+            session.execute('OPEN "NUMBERS.DAT" FOR OUTPUT AS 1: FOR I = 0 TO 1000: PRINT#1, A!(I); B#(I): NEXT: CLOSE')
+        with timer('INPUT# of 1000 singles and doubles'):
+            session.execute('OPEN "NUMBERS.DAT" FOR INPUT AS 1: FOR I = 0 TO 1000: INPUT#1, X!, Y#: NEXT: CLOSE')
+        check(session.evaluate('X! = VAL(STR$(A!(1000))) AND Y# = VAL(STR$(B#(1000)))') == -1, 'round trip differs')
+
+def bench_com_socket(temp_dir):
+    """Exchange lines and blocks with a server through a COM port attached to a local socket."""
+    try:
+        import serial
+    except ImportError:
+        print '    skipped: serial module not available.'
+        return
+    lines = ['LINE %4d %s' % (i, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'[i%26:]) for i in range(50)]
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('localhost', 0))
+    server.listen(1)
+    def serve():
+        conn, _ = server.accept()
+        # answer each request; stay within the 256-byte COM input buffer
+        for line in lines:
+            conn.recv(1)
+            conn.sendall(line + '\r')
+        for _ in range(16):
+            conn.recv(1)
+            conn.sendall('X' * 250)
+        conn.close()
+    thread = threading.Thread(target=serve)
+    thread.start()
+    com1 = 'SOCKET:localhost:%d' % server.getsockname()[1]
+    with basic.Session(device_params=devices(com1=com1), serial_buffer_size=256) as session:
+        session.execute('DIM A$(%d): OPEN "COM1:9600,N,8" AS 1' % len(lines))
+        with timer('%d requests answered by a line' % len(lines)):
+            session.execute('FOR I = 1 TO %d: PRINT#1, "?";: LINE INPUT#1, A$(I): NEXT' % len(lines))
+        with timer('16 requests answered by 250 bytes'):
+            session.execute('N = 0: FOR I = 1 TO 16: PRINT#1, "?";: B$ = INPUT$(250, #1): N = N + LEN(B$): NEXT')
+        check(session.evaluate('A$(%d)' % len(lines)) == lines[-1], 'line differs')
+        check(session.evaluate('N') == 4000 and session.evaluate('B$') == 'X' * 250, 'block differs')
+        session.execute('CLOSE')
+    thread.join()
+    server.close()
+
+def bench_stdio_filter(temp_dir):
+    """Run a BASIC program as a filter on redirected standard input and output."""
+    program = os.path.join(temp_dir, 'FILTER.BAS')
+    with open(program, 'wb') as f:
+        f.write('10 LINE INPUT A$\r\n20 PRINT A$\r\n30 GOTO 10\r\n')
+    lines = ['LINE %5d %s' % (i, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'[i%26:]) for i in range(4000)]
+    pcbasic = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pcbasic.py')
+    with timer('filter %d lines through LINE INPUT' % len(lines)):
+        process = subprocess.Popen(['python', pcbasic, program, '--interface=none'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'))
+        output, _ = process.communicate('\r'.join(lines) + '\r')
+    output = output.split('\r\n')
+    check(output.count(lines[-1]) == 2 and output.count(lines[0]) == 2, 'output differs')
+
+def bench_codepage(temp_dir):
+    """Convert text in single- and double-byte codepages to unicode."""
+    text = ''.join(chr(c) for c in range(32, 256)) * 4 + 'PRINT "HELLO"\r\n' * 100
+    for name in ('437', '932', '950'):
+        codepage = unicodepage.Codepage(name)
+        dbcs_text = ''.join(sorted(codepage.cp_to_unicode)[::7]) * 10
+        with timer('codepage %s, 1 MB as one string' % name):
+            whole = codepage.str_to_unicode(text * 400, preserve_control=True)
+        converter = codepage.get_converter(preserve_control=True)
+        with timer('codepage %s, 1 MB in 80-byte writes' % name):
+            for _ in xrange(400):
+                for i in xrange(0, len(text), 80):
+                    converter.to_unicode(text[i:i+80])
+        with timer('codepage %s, %d kB of mixed text' % (name, len(dbcs_text) * 10 // 1024)):
+            for _ in xrange(10):
+                codepage.str_to_unicode(dbcs_text)
+        check(whole[:len(whole)//400] == codepage.str_to_unicode(text, preserve_control=True),
+                'conversion differs')
+
+def bench_draw_play(temp_dir):
+    """Repeat the same DRAW and PLAY strings, as a game loop would."""
+    with basic.Session(device_params=devices()) as session:
+        session.execute('SCREEN 1: S$ = "U10 R10 D10 L10 E5 F5 G5 H5": D = 3')
+        with timer('DRAW, 300 times'):
+            session.execute('FOR I = 1 TO 300: DRAW "BM160,100 C=D; XS$; M+2,-2 TA45 U2 TA0 S4 BU1 NE1 NF1": NEXT')
+        check(session.evaluate('POINT(170, 90)') == 3, 'drawing differs')
+        # time the interpreter, not the music: don't queue the notes
+        notes = []
+        session.sound.play_sound = lambda *args, **kwargs: notes.append(args)
+        session.execute('M$ = "L16 O3 CDEFGAB>C"')
+        with timer('PLAY, 300 times'):
+            session.execute('FOR I = 1 TO 300: PLAY "MB T255 XM$; P64 <C8.D#E- N=D;": NEXT')
+        check(len(notes) == 300 * 13, 'music differs')
+
+def bench_def_fn(temp_dir):
+    """Call small DEF FN helpers in tight loops."""
+    with basic.Session(device_params=devices()) as session:
+        session.execute('10 DEF FNA(X) = X*X + 2*X + 1')
+        session.execute('20 DEF FNB#(X#, Y) = SQR(X#*X# + Y*Y)')
+        session.execute('30 DEF FNC$(A$) = LEFT$(A$ + "XYZ", 3)')
+        session.execute('40 X = -1: Y = 0: FOR I = 1 TO 3000: Y = Y + FNA(I): NEXT')
+        session.execute('50 Z# = 0: FOR I = 1 TO 1000: Z# = Z# + FNB#(I, 3): NEXT')
+        session.execute('60 FOR I = 1 TO 1000: C$ = FNC$(STR$(I)): NEXT')
+        with timer('5000 calls to DEF FN'):
+            session.execute('RUN')
+        check(session.evaluate('X') == -1, 'parameter not restored')
+        session.execute('W = 0: FOR I = 1 TO 3000: W = W + (I*I + 2*I + 1): NEXT')
+        check(session.evaluate('Y') == session.evaluate('W') and session.evaluate('C$') == ' 10',
+                'results differ')
+
+def bench_string_functions(temp_dir):
+    """Split, scan and search text with MID$, LEFT$, RIGHT$ and INSTR."""
+    with basic.Session(device_params=devices()) as session:
+        collections = []
+        collect_garbage = session.memory.collect_garbage
+        def count_collections():
+            collections.append(None)
+            collect_garbage()
+        session.memory.collect_garbage = count_collections
+        line = '5 CLEAR , 10000: L$ = "12,ALPHA,3.5,BRAVO CHARLIE,-7,DELTA,ECHO FOXTROT,,GOLF,99"'
+        session.execute(line)
+        session.execute('10 FOR I = 1 TO 200: P = 1: N = 0')
+        session.execute('20 C = INSTR(P, L$, ","): IF C = 0 THEN C = LEN(L$) + 1')
+        session.execute('30 IF LEFT$(MID$(L$, P, C - P), 1) > "9" THEN N = N + 1')
+        session.execute('40 P = C + 1: IF P <= LEN(L$) THEN 20')
+        session.execute('50 NEXT: F$ = MID$(L$, C - 2)')
+        del collections[:]
+        with timer('split a CSV line into fields, 200 times'):
+            session.execute('RUN')
+        check(session.evaluate('N') == 5 and session.evaluate('F$') == '99', 'fields differ')
+        split_collections = len(collections)
+        session.execute('NEW')
+        session.execute(line)
+        session.execute('10 FOR I = 1 TO 50: V = 0: R$ = ""')
+        session.execute('20 FOR J = 1 TO LEN(L$): IF MID$(L$, J, 1) >= "A" THEN V = V + 1')
+        session.execute('30 NEXT: R$ = RIGHT$(L$, 10) + LEFT$(L$, 10): NEXT')
+        del collections[:]
+        with timer('scan a line character by character, 50 times'):
+            session.execute('RUN')
+        check(session.evaluate('V') == 37 and session.evaluate('R$') == 'T,,GOLF,9912,ALPHA,3', 'scan differs')
+        print '    %-40s %8d' % ('garbage collections', split_collections + len(collections))
+
+def bench_peek_variables(temp_dir):
+    """PEEK into array and scalar variable memory with many variables defined."""
+    with basic.Session(device_params=devices()) as session:
+        for n in range(0, 200, 20):
+            session.execute('%d ' % (n+1) + ': '.join('V%d%% = %d' % (i, i) for i in range(n, n+20)))
+        for n in range(0, 200, 20):
+            session.execute('%d DIM ' % (n+2) + ', '.join('W%d%%(1)' % i for i in range(n, n+20)))
+        session.execute('300 P = 0: S = 0: DIM A%(3000): FOR I = 0 TO 3000: A%(I) = I: NEXT')
+        session.execute('310 P = VARPTR(A%(0))')
+        session.execute('320 FOR I = 0 TO 6001: S = S + PEEK(P + I): NEXT')
+        with timer('PEEK 6002 bytes of a DIMmed array'):
+            session.execute('RUN')
+        check(session.evaluate('S') == sum((i & 0xff) + (i >> 8) for i in range(3001)), 'array bytes differ')
+        session.execute('300 T = 0: FOR K = 1 TO 20')
+        session.execute('310 ')
+        session.execute('320 ')
+        for i in range(200):
+            session.execute('%d T = T + PEEK(VARPTR(V%d%%))' % (400+i, i))
+        session.execute('600 NEXT')
+        with timer('PEEK 200 scalars through VARPTR, 20 times'):
+            session.execute('RUN')
+        check(session.evaluate('T') == 20 * sum(range(200)), 'scalar bytes differ')
+
+def bench_matrix(temp_dir):
+    """Multiply two-dimensional arrays in nested FOR loops."""
+    with basic.Session(device_params=devices()) as session:
+        session.execute('10 DEFINT I-K: N = 15: DIM A(N, N), B(N, N), C(N, N)')
+        session.execute('20 FOR I = 0 TO N: FOR J = 0 TO N: A(I, J) = I + J: B(I, J) = I - J: NEXT: NEXT')
+        session.execute('30 FOR I = 0 TO N: FOR J = 0 TO N: S = 0')
+        session.execute('40 FOR K = 0 TO N: S = S + A(I, K) * B(K, J): NEXT')
+        session.execute('50 C(I, J) = S: NEXT: NEXT')
+        with timer('multiply 16x16 matrices'):
+            session.execute('RUN')
+        n = 16
+        expected = sum((n-1 + k) * (k - 2) for k in range(n))
+        check(session.evaluate('C(15, 2)') == expected, 'product differs')
+
+def bench_numpy_arrays(temp_dir):
+    """Move numeric arrays in and out of a session as lists and as NumPy arrays."""
+    try:
+        import numpy
+    except ImportError:
+        print '    skipped: numpy module not available.'
+        return
+    values = numpy.linspace(-1000., 1000., 50*40).reshape(50, 40)
+    with basic.Session(device_params=devices()) as session:
+        session.execute('DIM A#(49, 39), B#(49, 39), C!(49, 39), D!(49, 39)')
+        with timer('set 50x40 doubles from a list'):
+            session.set_variable('A#()', values.tolist())
+        with timer('set 50x40 doubles from an ndarray'):
+            session.set_variable('B#()', values)
+        with timer('set 50x40 singles from a list'):
+            session.set_variable('C!()', values.tolist())
+        with timer('set 50x40 singles from an ndarray'):
+            session.set_variable('D!()', values)
+        with timer('get 50x40 singles as a list'):
+            as_list = session.get_variable('C!()')
+        with timer('get 50x40 singles as an ndarray'):
+            as_ndarray = session.get_variable('D!()', as_ndarray=True)
+        check(session.evaluate('A#(49, 39) = B#(49, 39) AND C!(31, 7) = D!(31, 7)'), 'stored values differ')
+        check(as_ndarray.tolist() == as_list, 'retrieved values differ')
+
+def bench_prepared(temp_dir):
+    """Evaluate expressions and execute statements through the embedding API."""
+    with basic.Session(device_params=devices()) as session:
+        with timer('evaluate an expression 2000 times'):
+            for i in xrange(2000):
+                session.set_variable('X%', i)
+                session.evaluate('X% * 2 + LEN(STR$(X%))')
+        expression = session.prepare_expression('X% * 2 + LEN(STR$(X%))')
+        with timer('evaluate a prepared expression 2000 times'):
+            for i in xrange(2000):
+                value = session.evaluate(expression, {'X%': i})
+        check(value == 1999 * 2 + 5, 'expression value differs')
+        with timer('execute a statement 2000 times'):
+            for i in xrange(2000):
+                session.execute('S = S + X%: N% = N% + 1', {'X%': i})
+        statement = session.prepare_statement('S = S + X%: N% = N% + 1')
+        with timer('execute a prepared statement 2000 times'):
+            for i in xrange(2000):
+                session.execute(statement, {'X%': i})
+        with timer('execute a batch of 2000 statements'):
+            session.execute_batch([statement] * 2000)
+        check(session.get_variable('N%') == 6000 and session.get_variable('S') == 2 * 1999000 + 2000 * 1999,
+                'statement results differ')
+
+def bench_profiler(temp_dir):
+    """Run a loop with and without the statement profiler."""
+    lines = ['10 FOR I = 1 TO 2000', '20 A$ = STR$(I): B = B + I', '30 IF I MOD 10 = 0 THEN GOSUB 100',
+             '40 NEXT: END', '100 C = C + 1: RETURN']
+    for label, params in (('without profiler', {}), ('with profiler', {'profile': True})):
+        with basic.Session(device_params=devices(), **params) as session:
+            for line in lines:
+                session.execute(line)
+            with timer('2000 iterations, %s' % label):
+                session.execute('RUN')
+            if session.profiler:
+                report = StringIO()
+                session.profiler.report(report)
+                session.profiler = None
+                rows = [row.split() for row in report.getvalue().splitlines()]
+                check(rows[1][:2] == ['20', '2000'], 'hottest line differs')
+                check(['GOSUB', '200'] in [row[:2] for row in rows], 'statement count differs')
+
+def bench_debugger(temp_dir):
+    """Run a loop with watches and a conditional breakpoint in the debugger."""
+    lines = ['10 FOR I = 1 TO 2000', '20 A$ = STR$(I): B = B + I', '30 IF I MOD 10 = 0 THEN GOSUB 100',
+             '40 NEXT: END', '100 C = C + 1: RETURN']
+    watches = ['1 DEBUG watch("C")', '2 DEBUG watch("A$+B$", "C>100")', '3 DEBUG break_when("C=150")']
+    for label, params, extra in (
+            ('without debugger', {}, []),
+            ('with watches', {'option_debug': True}, watches)):
+        with basic.Session(device_params=devices(), **params) as session:
+            for line in extra + lines:
+                session.execute(line)
+            with timer('2000 iterations, %s' % label):
+                session.execute('RUN')
+                if extra:
+                    check(session.evaluate('C') == 150, 'breakpoint did not fire')
+                    session.execute('CONT')
+            check(session.evaluate('C') == 200, 'loop result differs')
+
+def bench_video_memory(temp_dir):
+    """Save and load full screens of video memory with BSAVE and BLOAD, and PEEK through it."""
+    modes = (
+        ('vga', 'SCREEN 0: WIDTH 80', '&HB800', 4000),
+        ('vga', 'SCREEN 1', '&HB800', 16384),
+        ('vga', 'SCREEN 2', '&HB800', 16384),
+        ('vga', 'SCREEN 7', '&HA000', 8000),
+        ('vga', 'SCREEN 9', '&HA000', 28000),
+        ('tandy', 'SCREEN 6', '&HB800', 32768),
+    )
+    for video, screen, segment, length in modes:
+        with basic.Session(device_params=devices(), video_capabilities=video,
+                           syntax='tandy' if video == 'tandy' else 'advanced',
+                           mount_dict={'Z': (unicode(temp_dir), u'')}) as session:
+            session.execute(screen)
+            session.execute('FOR I = 0 TO 999: PRINT CHR$(33 + I MOD 90);: NEXT')
+            if not screen.startswith('SCREEN 0'):
+                session.execute('CIRCLE (100, 100), 80, 2: PAINT (100, 100), 1, 2: LINE (0, 0)-(150, 90), 3, BF')
+            session.execute('DEF SEG = %s' % segment)
+            image = os.path.join(temp_dir, 'SCREEN.BSV')
+            copy = os.path.join(temp_dir, 'COPY.BSV')
+            with timer('%s, BSAVE' % screen):
+                for _ in range(10):
+                    session.execute('BSAVE "SCREEN.BSV", 0, %d' % length)
+            session.execute('CLS')
+            with timer('%s, BLOAD' % screen):
+                for _ in range(10):
+                    session.execute('BLOAD "SCREEN.BSV", 0')
+            session.execute('BSAVE "COPY.BSV", 0, %d' % length)
+            check(open(image, 'rb').read() == open(copy, 'rb').read(),
+                  '%s: screen differs after BSAVE and BLOAD' % screen)
+            with timer('%s, PEEK 2000 bytes' % screen):
+                session.execute('S = 0: FOR I = 0 TO 1999: S = S + PEEK(I): NEXT')
+            check(session.evaluate('S') == sum(bytearray(open(image, 'rb').read()[7:2007])),
+                  '%s: PEEK differs from BSAVE' % screen)
+
+def bench_wait_retrace(temp_dir):
+    """Synchronise with vertical retrace through WAIT on the video status register."""
+    adapters = (
+        ('cga', 'SCREEN 1', '&H3DA', 8, 15699.8 / 262),
+        ('ega', 'SCREEN 9', '&H3DA', 8, 21850. / 364),
+        ('vga', 'SCREEN 0', '&H3DA', 8, 31469. / 449),
+        ('hercules', 'SCREEN 0', '&H3BA', 128, 18432. / 370),
+    )
+    frames = 60
+    for video, screen, port, bit, rate in adapters:
+        with basic.Session(device_params=devices(), video_capabilities=video) as session:
+            session.execute(screen)
+            session.execute('WAIT %s, %d, %d: WAIT %s, %d' % (port, bit, bit, port, bit))
+            start, cpu = time.time(), time.clock()
+            with timer('%s, %d frames' % (video, frames)):
+                session.execute('FOR I = 1 TO %d: WAIT %s, %d, %d: WAIT %s, %d: NEXT' % (
+                        frames, port, bit, bit, port, bit))
+            elapsed, cpu = time.time() - start, time.clock() - cpu
+            print '    %-40s %8.3f Hz, %.0f%% cpu' % ('%s, frame rate' % video, frames / elapsed, 100. * cpu / elapsed)
+            check(abs(frames / elapsed - rate) < 1., '%s: frame rate differs' % video)
+
+def program_corpus(temp_dir):
+    """Copy the plain-text test programs to temp_dir, return their names."""
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    corpus = []
+    for name in sorted(os.listdir(test_dir)):
+        program = os.path.join(test_dir, name, 'TEST.BAS')
+        if not os.path.isfile(program):
+            continue
+        text = open(program, 'rb').read()
+        # plain-text programs that list as they were typed: no LF in lines, no overlong lines
+        lines = [line for line in text.split('\r\n') if line.strip() and line != '\x1a']
+        if (text[:1] not in ('\xff', '\xfe') and '\n' not in ''.join(lines) and
+                max(len(line) for line in lines) < 250):
+            corpus.append(os.path.join(temp_dir, name + '.BAS'))
+            with open(corpus[-1], 'wb') as f:
+                f.write('\r\n'.join(lines) + '\r\n')
+    return corpus
+
+def bench_convert(temp_dir):
+    """Convert the test programs between plain text, tokenised and protected formats."""
+    corpus = program_corpus(temp_dir)
+    def convert(session, conversions):
+        for i, program in enumerate(corpus):
+            for source, target, mode in conversions:
+                session.load_program(program if source is None else os.path.join(temp_dir, source % i))
+                session.save_program(os.path.join(temp_dir, target % i), mode)
+    with basic.Session(device_params=devices()) as session:
+        with timer('%d programs, A to B' % len(corpus)):
+            convert(session, [(None, '%d.BAS', 'B')])
+        with timer('%d programs, B to A' % len(corpus)):
+            convert(session, [('%d.BAS', '%d.ASC', 'A')])
+        with timer('%d programs, A to P' % len(corpus)):
+            convert(session, [('%d.ASC', '%d.PRO', 'P')])
+        with timer('%d programs, P to A' % len(corpus)):
+            convert(session, [('%d.PRO', '%d.TXT', 'A')])
+        # once listed, programs should survive a round trip
+        convert(session, [('%d.ASC', '%d.TOK', 'B'), ('%d.TOK', '%d.LST', 'A')])
+    listings = [[open(os.path.join(temp_dir, name % i), 'rb').read() for name in ('%d.ASC', '%d.TXT', '%d.LST')]
+                for i in range(len(corpus))]
+    check(all(asc == txt == lst for asc, txt, lst in listings), 'round trip differs')
+
+def bench_converter(temp_dir):
+    """Convert a directory of protected programs, with and without a session per file."""
+    source_dir, sample_dir = os.path.join(temp_dir, 'PROT'), os.path.join(temp_dir, 'SAMPLE')
+    os.mkdir(sample_dir)
+    corpus = program_corpus(temp_dir)
+    protector = converter.Converter('P')
+    for copy in range(10):
+        os.makedirs(os.path.join(source_dir, str(copy)))
+        for program in corpus:
+            protector.convert_file(program, os.path.join(source_dir, str(copy), os.path.basename(program)))
+    jobs = list(converter.iter_jobs([source_dir], os.path.join(temp_dir, 'OUT1')))
+    pcbasic = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pcbasic.py')
+    sample = jobs[:20]
+    with timer('%d programs, one --convert each' % len(sample)):
+        for name_in, _ in sample:
+            subprocess.call(['python', pcbasic, '--convert=A', name_in,
+                    os.path.join(sample_dir, os.path.basename(name_in))],
+                    stdin=open(os.devnull), stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+    with timer('%d programs, one process' % len(jobs)):
+        errors = [msg for _, msg in converter.run_convert(jobs, 'A')]
+    check(not any(errors), 'conversion failed')
+    jobs4 = list(converter.iter_jobs([source_dir], os.path.join(temp_dir, 'OUT4')))
+    with timer('%d programs, 4 processes' % len(jobs4)):
+        errors = [msg for _, msg in converter.run_convert(jobs4, 'A', processes=4)]
+    check(not any(errors), 'conversion failed')
+    check(all(open(os.path.join(sample_dir, os.path.basename(name_in)), 'rb').read() ==
+                open(name_out, 'rb').read() for name_in, name_out in sample),
+            'output differs from --convert')
+    check(all(open(name_out, 'rb').read() == open(job4[1], 'rb').read()
+                for (_, name_out), job4 in zip(jobs, jobs4)),
+            'output differs between processes')
+
+
+###############################################################################
+
+benchmarks = dict(
+    (name[6:], func) for name, func in globals().items() if name.startswith('bench_'))
+
+args = sys.argv[1:]
+
+if not args:
+    print 'Usage: benchmark.py NAME [NAME] ...'
+    print '       benchmark.py --all'
+    print 'Benchmarks: %s' % ' '.join(sorted(benchmarks))
+    sys.exit(1)
+
+if args == ['--all']:
+    args = sorted(benchmarks)
+
+for name in args:
+    print 'Running benchmark %s .. ' % name
+    if name not in benchmarks:
+        print '    no such benchmark.'
+        continue
+    temp_dir = tempfile.mkdtemp(prefix='pcbasic-bench-')
+    try:
+        benchmarks[name](temp_dir)
+    finally:
+        shutil.rmtree(temp_dir)
+
+if failures:
+    sys.exit(1)
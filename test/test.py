@@ -8,10 +8,13 @@ This file is released under the GNU GPL version 3 or later.
 
 import sys
 import os
-import subprocess
 import shutil
 import filecmp
 
+# use the pcbasic package from this source tree
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pcbasic import batch
+
 def is_same(file1, file2):
     try:
         return filecmp.cmp(file1, file2, shallow=False)
@@ -32,25 +35,35 @@ failed = []
 knowfailed = []
 
 for name in args:
-    print 'Running test %s .. ' % name,
     if not os.path.isdir(name):
-        print 'no such test.'
         continue
     output_dir = os.path.join(name, 'output')
-    model_dir = os.path.join(name, 'model')
-    known_dir = os.path.join(name, 'known')
     if os.path.isdir(output_dir):
         shutil.rmtree(output_dir)
     os.mkdir(output_dir)
     for filename in os.listdir(name):
         if os.path.isfile(os.path.join(name, filename)):
             shutil.copy(os.path.join(name, filename), os.path.join(output_dir, filename))
-    top = os.getcwd()
-    os.chdir(output_dir)
-    sys.stdout.flush()
-    subprocess.Popen(['python', os.path.join('..','..','..','pcbasic.py'), '--interface=none'],
-            stdin=sys.stdin, stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w')).wait()
-    os.chdir(top)
+
+# run all tests in parallel
+tests = [name for name in args if os.path.isdir(name)]
+results = batch.run_batch([os.path.join(name, 'output') for name in tests])
+status = dict((name, result['status']) for name, result in zip(tests, results))
+
+for name in args:
+    print 'Running test %s .. ' % name,
+    if not os.path.isdir(name):
+        print 'no such test.'
+        continue
+    if status[name] != 'ok':
+        # a crash or timeout is never a known failure
+        print 'FAILED: %s.' % status[name]
+        failed.append(name)
+        numtests += 1
+        continue
+    output_dir = os.path.join(name, 'output')
+    model_dir = os.path.join(name, 'model')
+    known_dir = os.path.join(name, 'known')
     passed = True
     known = True
     failfiles = []